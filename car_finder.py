@@ -9,6 +9,7 @@ from database import VehicleRepository, MarketPriceRepository, ProblemRepository
 from scoring_engine import VehicleScorer, UserPreferences
 from recommendation_engine import RecommendationEngine, UseCase
 from market_analysis import MarketAnalyzer
+from valuation import FairValueEstimator
 import sys
 
 
@@ -21,9 +22,11 @@ class CarFinder:
         self.price_repo = MarketPriceRepository(self.db)
         self.problem_repo = ProblemRepository(self.db)
         self.fit_repo = DriverFitRepository(self.db)
-        self.scorer = VehicleScorer(self.db)
-        self.recommender = RecommendationEngine(self.db)
-        self.market_analyzer = MarketAnalyzer(self.db)
+        self.valuation = FairValueEstimator(self.db)
+        self.valuation.refit()
+        self.scorer = VehicleScorer(self.db, self.valuation)
+        self.recommender = RecommendationEngine(self.db, self.valuation)
+        self.market_analyzer = MarketAnalyzer(self.db, self.valuation)
 
     def show_menu(self):
         """Display main menu"""
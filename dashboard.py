@@ -19,6 +19,8 @@ from database import (
 from scoring_engine import VehicleScorer, UserPreferences
 from recommendation_engine import RecommendationEngine
 from market_analysis import MarketAnalyzer
+from valuation import FairValueEstimator
+from geolocation import REFERENCE_LOCATIONS
 
 
 def generate_fb_marketplace_link(vehicle_name: str, price: float, city: str = "", state: str = "") -> str:
@@ -37,6 +39,39 @@ def generate_fb_marketplace_link(vehicle_name: str, price: float, city: str = ""
     return url
 
 
+def fit_trend_line(make: str, model: str, x_axis: str, y_axis: str,
+                   years: pd.Series, x_clean: np.ndarray, y_clean: np.ndarray):
+    """
+    Slope, intercept, R² and residual std dev for a chart's trend line
+    Price vs mileage uses the stored fair value model at the listings' mean
+    year (before region offsets); other axes get a plain linregress. R² and
+    the residual band always describe the plotted line against the plotted points.
+    """
+    fit = repos['valuation'].get_model(make, model) if (x_axis, y_axis) == ('mileage', 'price') else None
+    if fit:
+        slope = fit['coef_mileage']
+        intercept = fit['intercept'] + fit['coef_age'] * (fit['reference_year'] - years.mean())
+    else:
+        slope, intercept, r_value, p_value, std_err = linregress(x_clean, y_clean)
+
+    residuals = y_clean - (slope * x_clean + intercept)
+    total = np.sum((y_clean - y_clean.mean()) ** 2)
+    r_squared = 1 - np.sum(residuals ** 2) / total if total > 0 else 0.0
+    return slope, intercept, r_squared, np.std(residuals)
+
+
+def reference_distances(radius_miles: float) -> dict:
+    """
+    Listing id -> miles to the closest reference location, for listings within
+    radius_miles of one (indexed radius query, so every "nearby" figure agrees)
+    """
+    nearby = {}
+    for ref_lat, ref_lon in REFERENCE_LOCATIONS.values():
+        for row in repos['price_repo'].get_listings_near(ref_lat, ref_lon, radius_miles):
+            nearby[row['id']] = min(row['distance'], nearby.get(row['id'], row['distance']))
+    return nearby
+
+
 # Page configuration
 st.set_page_config(
     page_title="Car Valuation Dashboard",
@@ -73,15 +108,19 @@ st.markdown("""
 @st.cache_resource
 def init_db():
     db = DatabaseManager()
+    # One estimator shared by every component; fit whatever changed since the last run
+    valuation = FairValueEstimator(db)
+    valuation.refit()
     return {
         'db': db,
         'vehicle_repo': VehicleRepository(db),
         'price_repo': MarketPriceRepository(db),
         'problem_repo': ProblemRepository(db),
         'fit_repo': DriverFitRepository(db),
-        'scorer': VehicleScorer(db),
-        'recommender': RecommendationEngine(db),
-        'market_analyzer': MarketAnalyzer(db)
+        'scorer': VehicleScorer(db, valuation),
+        'recommender': RecommendationEngine(db, valuation),
+        'market_analyzer': MarketAnalyzer(db, valuation),
+        'valuation': valuation
     }
 
 
@@ -145,7 +184,7 @@ def show_home():
     # Quick stats
     col1, col2, col3 = st.columns(3)
 
-    with repos['db'].get_connection() as conn:
+    with repos['db'].get_connection(read_only=True) as conn:
         cursor = conn.execute("SELECT COUNT(DISTINCT make || model) FROM vehicles")
         unique_models = cursor.fetchone()[0]
 
@@ -179,7 +218,7 @@ def show_home():
         ORDER BY listing_count DESC, v.make, v.model
     """
 
-    with repos['db'].get_connection() as conn:
+    with repos['db'].get_connection(read_only=True) as conn:
         cursor = conn.execute(query)
         models = cursor.fetchall()
 
@@ -241,7 +280,7 @@ def show_home():
                 ORDER BY v.year DESC, mp.asking_price
             """
 
-            with repos['db'].get_connection() as conn:
+            with repos['db'].get_connection(read_only=True) as conn:
                 cursor = conn.execute(query, (make, model))
                 listings = cursor.fetchall()
 
@@ -331,13 +370,10 @@ def show_home():
 
                 # Check if we have enough data and variation for regression
                 if len(x_clean) >= 3 and len(np.unique(x_clean)) > 1:
-                    slope, intercept, r_value, p_value, std_err = linregress(x_clean, y_clean)
-                    r_squared = r_value ** 2
+                    slope, intercept, r_squared, std_residuals = fit_trend_line(
+                        make, model, x_axis, y_axis, df['year'], x_clean, y_clean)
                     x_range = np.linspace(x_clean.min(), x_clean.max(), 100)
                     y_pred = slope * x_range + intercept
-                    y_fit = slope * x_clean + intercept
-                    residuals = y_clean - y_fit
-                    std_residuals = np.std(residuals)
                     y_pred_1std_upper = y_pred + std_residuals
                     y_pred_1std_lower = y_pred - std_residuals
                     y_pred_2std_upper = y_pred + 2 * std_residuals
@@ -438,7 +474,7 @@ def show_home():
                     with col2:
                         st.metric("Listings", len(df))
                     with col3:
-                        nearby = df[df['distance'] <= 100].shape[0] if 'distance' in df.columns else 0
+                        nearby = int(df['id'].isin(reference_distances(100)).sum())
                         st.metric("Within 100mi", nearby)
                     with col4:
                         st.metric("Avg Price", f"${df['price'].mean():,.0f}")
@@ -565,20 +601,15 @@ def show_vehicle_finder():
 
             # Filter by distance
             if matches and max_distance < 500:
+                nearby = reference_distances(max_distance)
+
                 filtered_matches = []
                 for match in matches:
                     listing = match['listing']
-                    # Get distance from database
-                    distance_query = "SELECT distance_miles FROM market_prices WHERE id = ?"
-                    with repos['db'].get_connection() as conn:
-                        cursor = conn.execute(distance_query, (listing['id'],))
-                        result = cursor.fetchone()
-                        distance = result[0] if result and result[0] is not None else None
-
-                    if distance is not None and distance <= max_distance:
-                        match['distance'] = distance
+                    if listing['id'] in nearby:
+                        match['distance'] = nearby[listing['id']]
                         filtered_matches.append(match)
-                    elif distance is None:  # Include unknowns
+                    elif listing.get('latitude') is None:  # Include unknowns
                         match['distance'] = None
                         filtered_matches.append(match)
 
@@ -588,13 +619,7 @@ def show_vehicle_finder():
             else:
                 # Add distance info even if not filtering
                 for match in matches:
-                    listing = match['listing']
-                    distance_query = "SELECT distance_miles FROM market_prices WHERE id = ?"
-                    with repos['db'].get_connection() as conn:
-                        cursor = conn.execute(distance_query, (listing['id'],))
-                        result = cursor.fetchone()
-                        distance = result[0] if result and result[0] is not None else None
-                    match['distance'] = distance
+                    match['distance'] = match['listing'].get('distance_miles')
 
         if not matches:
             st.warning("No vehicles found matching your criteria. Try adjusting your requirements.")
@@ -728,20 +753,14 @@ def show_deal_finder():
         # Filter by mileage
         deals = [d for d in deals if d['mileage'] <= max_mileage]
 
-        # Filter by distance
+        # Filter by distance (indexed radius query around the reference locations)
+        nearby = reference_distances(max_distance)
         filtered_deals = []
         for deal in deals:
-            # Get distance from database
-            distance_query = "SELECT distance_miles FROM market_prices WHERE id = ?"
-            with repos['db'].get_connection() as conn:
-                cursor = conn.execute(distance_query, (deal['listing_id'],))
-                result = cursor.fetchone()
-                distance = result[0] if result and result[0] is not None else None
-
-            if distance is not None and distance <= max_distance:
-                deal['distance'] = distance
+            if deal['listing_id'] in nearby:
+                deal['distance'] = nearby[deal['listing_id']]
                 filtered_deals.append(deal)
-            elif distance is None and max_distance >= 500:  # Include unknowns if max is high
+            elif deal['coordinates'] is None and max_distance >= 500:  # Include unknowns if max is high
                 deal['distance'] = None
                 filtered_deals.append(deal)
 
@@ -780,10 +799,16 @@ def show_deal_finder():
                         location_text += f" ({deal['distance']:.0f} miles away)"
                     st.write(location_text)
                     st.write(f"**Condition:** {deal['condition']} | **Mileage:** {deal['mileage']:,}")
+                    if deal['z_score'] is not None:
+                        st.write(f"**vs. {deal['peer_count']} peers:** z-score {deal['z_score']:+.2f}, "
+                                 f"{deal['price_percentile']:.0f}th percentile")
 
                 with col2:
                     st.metric("Asking Price", f"${deal['asking_price']:,.0f}")
                     st.metric("Market Average", f"${deal['market_avg']:,.0f}")
+                    if deal['fair_value']:
+                        st.metric("Model Fair Value", f"${deal['fair_value']:,.0f}",
+                                 help="Mileage, age and region adjusted estimate for this model")
 
                 with col3:
                     st.metric("SAVINGS", f"${deal['savings']:,.0f}",
@@ -792,12 +817,7 @@ def show_deal_finder():
                     st.write(f"*Listing ID: {deal['listing_id']}*")
 
                 # Show actual listing URL if available
-                # Need to get the listing details to check for source_url
-                listing_query = "SELECT source_url FROM market_prices WHERE id = ?"
-                with repos['db'].get_connection() as conn:
-                    cursor = conn.execute(listing_query, (deal['listing_id'],))
-                    listing_row = cursor.fetchone()
-                    source_url = listing_row[0] if listing_row else None
+                source_url = deal['source_url']
 
                 if source_url:
                     st.markdown(f"📍 **Source:** Facebook Marketplace")
@@ -850,6 +870,8 @@ def show_market_analysis():
                             'Listings': stats['listing_count'],
                             'Avg Price': stats['avg_asking_price'],
                             'Median Price': stats['median_asking_price'],
+                            '25th Pct': stats['p25_asking_price'],
+                            '75th Pct': stats['p75_asking_price'],
                             'Min Price': stats['min_price'],
                             'Max Price': stats['max_price']
                         })
@@ -929,7 +951,7 @@ def show_market_analysis():
             ORDER BY v.make, v.model
         """
 
-        with repos['db'].get_connection() as conn:
+        with repos['db'].get_connection(read_only=True) as conn:
             cursor = conn.execute(query)
             models = cursor.fetchall()
 
@@ -990,7 +1012,7 @@ def show_market_analysis():
                     ORDER BY v.year DESC, mp.asking_price
                 """
 
-                with repos['db'].get_connection() as conn:
+                with repos['db'].get_connection(read_only=True) as conn:
                     cursor = conn.execute(query, (make, model))
                     listings = cursor.fetchall()
 
@@ -1089,19 +1111,14 @@ def show_market_analysis():
                     y_clean = y_data[valid_mask]
 
                     if len(x_clean) >= 3:  # Need at least 3 points for regression
-                        # Linear regression
-                        slope, intercept, r_value, p_value, std_err = linregress(x_clean, y_clean)
-                        r_squared = r_value ** 2
+                        # Trend line (fair value model for price vs mileage)
+                        slope, intercept, r_squared, std_residuals = fit_trend_line(
+                            make, model, x_axis, y_axis, df['year'], x_clean, y_clean)
 
                         # Create prediction line
                         x_range = np.linspace(x_clean.min(), x_clean.max(), 100)
                         y_pred = slope * x_range + intercept
 
-                        # Calculate residuals and standard deviation
-                        y_fit = slope * x_clean + intercept
-                        residuals = y_clean - y_fit
-                        std_residuals = np.std(residuals)
-
                         # 1 and 2 standard deviation bands
                         y_pred_1std_upper = y_pred + std_residuals
                         y_pred_1std_lower = y_pred - std_residuals
@@ -1272,7 +1289,7 @@ def show_market_analysis():
                         st.metric("Avg MPG", f"{df['mpg'].mean():.1f}")
 
                     with col4:
-                        nearby = df[df['distance'] <= 100].shape[0] if 'distance' in df.columns else 0
+                        nearby = int(df['id'].isin(reference_distances(100)).sum())
                         st.metric("Within 100mi", nearby)
                         st.metric("Avg Maintenance/yr", f"${df['maintenance'].mean():,.0f}")
 
@@ -1523,6 +1540,7 @@ def show_add_listing():
                 )
 
                 listing_id = repos['price_repo'].add_listing(listing)
+                repos['valuation'].refit()  # only this listing's make/model is refit
                 st.success(f"✅ Listing added successfully! ID: {listing_id}")
                 st.balloons()
             else:
@@ -1589,4 +1607,6 @@ def show_comparison():
 
 
 if __name__ == "__main__":
-    main()
+    # One fair value version check per page run, however many listings it scores
+    with repos['valuation'].pinned():
+        main()
@@ -5,48 +5,573 @@ Handles all SQL database operations
 
 import sqlite3
 import json
+import threading
 from pathlib import Path
 from datetime import datetime
-from typing import List, Dict, Optional, Tuple
+from typing import List, Dict, Optional, Set, Tuple
 from contextlib import contextmanager
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, fields, replace
 
+from geolocation import get_city_coordinates, bounding_box, haversine_distance
+
+
+@dataclass
+class PerformanceProfile:
+    """SQLite pragmas applied every time a connection is opened"""
+    journal_mode: str = "WAL"  # readers never block on the writer
+    synchronous: str = "NORMAL"  # safe with WAL, far fewer fsyncs than FULL
+    cache_size: int = -64000  # negative = KiB, so ~64MB page cache
+    mmap_size: int = 268435456  # 256MB memory-mapped reads
+    temp_store: str = "MEMORY"
+    busy_timeout_ms: int = 5000  # wait for other processes' locks
+
+    def apply(self, conn: sqlite3.Connection, read_only: bool = False):
+        """Apply this profile to a freshly opened connection"""
+        if not read_only:
+            # journal_mode is persistent in the file and needs write access to
+            # change; if another process holds the database, keep its mode
+            current = conn.execute("PRAGMA journal_mode").fetchone()[0]
+            if current.lower() != self.journal_mode.lower():
+                try:
+                    conn.execute(f"PRAGMA journal_mode={self.journal_mode}")
+                except sqlite3.OperationalError:
+                    pass
+        conn.execute(f"PRAGMA synchronous={self.synchronous}")
+        conn.execute(f"PRAGMA cache_size={int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size={int(self.mmap_size)}")
+        conn.execute(f"PRAGMA temp_store={self.temp_store}")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+
+
+PERFORMANCE_PROFILES = {
+    'default': PerformanceProfile(),
+    'durable': PerformanceProfile(synchronous="FULL"),
+    'bulk_import': PerformanceProfile(synchronous="OFF", cache_size=-256000),
+    'legacy': PerformanceProfile(journal_mode="DELETE", synchronous="FULL",
+                                 cache_size=-2000, mmap_size=0, temp_store="DEFAULT"),
+}
+
+
+def _execute_script(conn: sqlite3.Connection, script: str):
+    """Run a multi-statement SQL script inside the caller's transaction
+
+    Unlike executescript(), this does not COMMIT first, so a migration and its
+    version bump succeed or fail together.
+    """
+    statement = ""
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            conn.execute(statement)
+            statement = ""
+    if statement.strip():
+        conn.execute(statement)
+
+
+def _column_exists(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    """Check whether a table already has a column"""
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table})"))
+
+
+def _migration_001_baseline(conn: sqlite3.Connection):
+    """Base tables and indexes from database_schema.sql"""
+    schema_path = Path(__file__).parent / "database_schema.sql"
+    with open(schema_path, 'r') as f:
+        _execute_script(conn, f.read())
+
+
+def _migration_002_distance_miles(conn: sqlite3.Connection):
+    """Distance to the nearest reference location (was added ad hoc by geolocation.py)"""
+    if not _column_exists(conn, 'market_prices', 'distance_miles'):
+        conn.execute("ALTER TABLE market_prices ADD COLUMN distance_miles REAL")
+
+
+# market_stats is keyed by (make, model, year, region) and stores running sums,
+# so averages are sum / count. NULL regions are stored as ''.
+_MARKET_STATS_GROUP_KEY = """
+    (make, model, year) = (SELECT make, model, year FROM vehicles WHERE id = {row}.vehicle_id)
+    AND region = COALESCE({row}.region, '')
+"""
+
+_MARKET_STATS_ADD = """
+    INSERT INTO market_stats (make, model, year, region, listing_count, sum_price,
+                              min_price, max_price, sum_mileage, sold_count,
+                              sale_price_count, sum_sale_price)
+    SELECT v.make, v.model, v.year, COALESCE(NEW.region, ''), 1, NEW.asking_price,
+           NEW.asking_price, NEW.asking_price, NEW.mileage,
+           CASE WHEN NEW.sold = 1 THEN 1 ELSE 0 END,
+           CASE WHEN NEW.sold = 1 AND NEW.sale_price IS NOT NULL THEN 1 ELSE 0 END,
+           COALESCE(CASE WHEN NEW.sold = 1 THEN NEW.sale_price END, 0)
+    FROM vehicles v WHERE v.id = NEW.vehicle_id
+    ON CONFLICT(make, model, year, region) DO UPDATE SET
+        listing_count = listing_count + 1,
+        sum_price = sum_price + excluded.sum_price,
+        min_price = MIN(min_price, excluded.min_price),
+        max_price = MAX(max_price, excluded.max_price),
+        sum_mileage = sum_mileage + excluded.sum_mileage,
+        sold_count = sold_count + excluded.sold_count,
+        sale_price_count = sale_price_count + excluded.sale_price_count,
+        sum_sale_price = sum_sale_price + excluded.sum_sale_price,
+        updated_at = CURRENT_TIMESTAMP;
+"""
+
+_MARKET_STATS_REMOVE = """
+    UPDATE market_stats SET
+        listing_count = listing_count - 1,
+        sum_price = sum_price - OLD.asking_price,
+        sum_mileage = sum_mileage - OLD.mileage,
+        sold_count = sold_count - (CASE WHEN OLD.sold = 1 THEN 1 ELSE 0 END),
+        sale_price_count = sale_price_count -
+            (CASE WHEN OLD.sold = 1 AND OLD.sale_price IS NOT NULL THEN 1 ELSE 0 END),
+        sum_sale_price = sum_sale_price - COALESCE(CASE WHEN OLD.sold = 1 THEN OLD.sale_price END, 0),
+        updated_at = CURRENT_TIMESTAMP
+    WHERE {key};
+    DELETE FROM market_stats WHERE listing_count <= 0 AND {key};
+    UPDATE market_stats SET
+        min_price = (SELECT MIN(mp.asking_price) FROM market_prices mp
+                     JOIN vehicles v ON mp.vehicle_id = v.id
+                     WHERE v.make = market_stats.make AND v.model = market_stats.model
+                       AND v.year = market_stats.year
+                       AND COALESCE(mp.region, '') = market_stats.region),
+        max_price = (SELECT MAX(mp.asking_price) FROM market_prices mp
+                     JOIN vehicles v ON mp.vehicle_id = v.id
+                     WHERE v.make = market_stats.make AND v.model = market_stats.model
+                       AND v.year = market_stats.year
+                       AND COALESCE(mp.region, '') = market_stats.region)
+    WHERE {key} AND (OLD.asking_price <= min_price OR OLD.asking_price >= max_price);
+""".format(key=_MARKET_STATS_GROUP_KEY.format(row='OLD'))
+
+# Recompute every region of one (make, model, year) from scratch; {filter} is a
+# WHERE clause on vehicles v, or 1=1 for a full rebuild
+_MARKET_STATS_REBUILD = """
+    INSERT INTO market_stats (make, model, year, region, listing_count, sum_price,
+                              min_price, max_price, sum_mileage, sold_count,
+                              sale_price_count, sum_sale_price)
+    SELECT v.make, v.model, v.year, COALESCE(mp.region, ''), COUNT(*), SUM(mp.asking_price),
+           MIN(mp.asking_price), MAX(mp.asking_price), SUM(mp.mileage),
+           COUNT(CASE WHEN mp.sold = 1 THEN 1 END),
+           COUNT(CASE WHEN mp.sold = 1 THEN mp.sale_price END),
+           COALESCE(SUM(CASE WHEN mp.sold = 1 THEN mp.sale_price END), 0)
+    FROM market_prices mp
+    JOIN vehicles v ON mp.vehicle_id = v.id
+    WHERE {filter}
+    GROUP BY v.make, v.model, v.year, COALESCE(mp.region, '');
+"""
+
+
+def _rebuild_vehicle_group_sql(row: str) -> str:
+    """Trigger body that rebuilds market_stats for a vehicle row's (make, model, year)"""
+    match = f"make = {row}.make AND model = {row}.model AND year = {row}.year"
+    return (f"DELETE FROM market_stats WHERE {match};" +
+            _MARKET_STATS_REBUILD.format(
+                filter=f"v.make = {row}.make AND v.model = {row}.model AND v.year = {row}.year"))
+
+
+def _migration_003_market_stats(conn: sqlite3.Connection):
+    """Materialized per-model market statistics kept current by triggers"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS market_stats (
+            make TEXT NOT NULL,
+            model TEXT NOT NULL,
+            year INTEGER NOT NULL,
+            region TEXT NOT NULL DEFAULT '',
+            listing_count INTEGER NOT NULL DEFAULT 0,
+            sum_price REAL NOT NULL DEFAULT 0,
+            min_price REAL,
+            max_price REAL,
+            sum_mileage REAL NOT NULL DEFAULT 0,
+            sold_count INTEGER NOT NULL DEFAULT 0,
+            sale_price_count INTEGER NOT NULL DEFAULT 0,
+            sum_sale_price REAL NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (make, model, year, region)
+        )
+    """)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_market_stats_insert
+        AFTER INSERT ON market_prices
+        BEGIN {_MARKET_STATS_ADD} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_market_stats_delete
+        AFTER DELETE ON market_prices
+        BEGIN {_MARKET_STATS_REMOVE} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_market_stats_update
+        AFTER UPDATE OF vehicle_id, asking_price, mileage, sold, sale_price, region ON market_prices
+        BEGIN {_MARKET_STATS_REMOVE} {_MARKET_STATS_ADD} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_market_stats_vehicle_update
+        AFTER UPDATE OF make, model, year ON vehicles
+        BEGIN {_rebuild_vehicle_group_sql('OLD')} {_rebuild_vehicle_group_sql('NEW')} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_market_stats_vehicle_delete
+        AFTER DELETE ON vehicles
+        BEGIN {_rebuild_vehicle_group_sql('OLD')} END
+    """)
+
+    # Backfill from the listings already in the database
+    conn.execute("DELETE FROM market_stats")
+    conn.execute(_MARKET_STATS_REBUILD.format(filter="1=1"))
+
+
+def _migration_004_filter_indexes(conn: sqlite3.Connection):
+    """Indexes behind the SQL-side hard filters in get_filtered_listings"""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_market_prices_price_mileage "
+                 "ON market_prices(asking_price, mileage)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_driver_fit_vehicle ON driver_fit(vehicle_id)")
+
+
+# Count a change against a (make, model) so FairValueEstimator.refit only refits those
+_FAIR_VALUE_MARK_DIRTY = """
+    INSERT INTO fair_value_dirty (make, model, changes)
+    SELECT make, model, 1 FROM vehicles WHERE id = {row}.vehicle_id
+    ON CONFLICT(make, model) DO UPDATE SET changes = changes + 1;
+"""
+
+_FAIR_VALUE_MARK_VEHICLE_DIRTY = """
+    INSERT INTO fair_value_dirty (make, model, changes) VALUES ({row}.make, {row}.model, 1)
+    ON CONFLICT(make, model) DO UPDATE SET changes = changes + 1;
+"""
 
-class DatabaseManager:
-    """Manages SQLite database connections and operations"""
 
-    def __init__(self, db_path: str = "car_valuation.db"):
+def _migration_005_fair_value_models(conn: sqlite3.Connection):
+    """Per-model fair value regressions and the change log that drives refits"""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fair_value_models (
+            make TEXT NOT NULL,
+            model TEXT NOT NULL,
+            intercept REAL NOT NULL,
+            coef_mileage REAL NOT NULL,
+            coef_age REAL NOT NULL,
+            region_offsets TEXT,
+            reference_year INTEGER NOT NULL,
+            sigma REAL NOT NULL,
+            r_squared REAL,
+            listing_count INTEGER NOT NULL,
+            fitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (make, model)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS fair_value_dirty (
+            make TEXT NOT NULL,
+            model TEXT NOT NULL,
+            changes INTEGER NOT NULL DEFAULT 1,
+            PRIMARY KEY (make, model)
+        )
+    """)
+
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_fair_value_insert
+        AFTER INSERT ON market_prices
+        BEGIN {_FAIR_VALUE_MARK_DIRTY.format(row='NEW')} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_fair_value_delete
+        AFTER DELETE ON market_prices
+        BEGIN {_FAIR_VALUE_MARK_DIRTY.format(row='OLD')} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_fair_value_update
+        AFTER UPDATE OF vehicle_id, asking_price, mileage, region ON market_prices
+        BEGIN {_FAIR_VALUE_MARK_DIRTY.format(row='OLD')} {_FAIR_VALUE_MARK_DIRTY.format(row='NEW')} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_fair_value_vehicle_update
+        AFTER UPDATE OF make, model, year ON vehicles
+        BEGIN {_FAIR_VALUE_MARK_VEHICLE_DIRTY.format(row='OLD')} {_FAIR_VALUE_MARK_VEHICLE_DIRTY.format(row='NEW')} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_fair_value_vehicle_delete
+        AFTER DELETE ON vehicles
+        BEGIN {_FAIR_VALUE_MARK_VEHICLE_DIRTY.format(row='OLD')} END
+    """)
+
+    # Everything that already has listings needs a first fit
+    conn.execute("""
+        INSERT OR IGNORE INTO fair_value_dirty (make, model)
+        SELECT DISTINCT v.make, v.model
+        FROM market_prices mp
+        JOIN vehicles v ON mp.vehicle_id = v.id
+    """)
+
+
+def _migration_006_listing_coordinates(conn: sqlite3.Connection):
+    """Listing lat/lon plus an R*Tree index over them for radius queries"""
+    for column in ('latitude', 'longitude'):
+        if not _column_exists(conn, 'market_prices', column):
+            conn.execute(f"ALTER TABLE market_prices ADD COLUMN {column} REAL")
+
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS market_prices_geo
+        USING rtree(id, min_lat, max_lat, min_lon, max_lon)
+    """)
+
+    index_point = """
+        INSERT OR REPLACE INTO market_prices_geo (id, min_lat, max_lat, min_lon, max_lon)
+        SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+        WHERE NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+    """
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_market_prices_geo_insert
+        AFTER INSERT ON market_prices
+        BEGIN {index_point} END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS trg_market_prices_geo_update
+        AFTER UPDATE OF latitude, longitude ON market_prices
+        BEGIN DELETE FROM market_prices_geo WHERE id = OLD.id; {index_point} END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS trg_market_prices_geo_delete
+        AFTER DELETE ON market_prices
+        BEGIN DELETE FROM market_prices_geo WHERE id = OLD.id; END
+    """)
+
+    # Backfill from the city/state already on each listing
+    rows = conn.execute("""
+        SELECT id, city, state FROM market_prices
+        WHERE latitude IS NULL AND city IS NOT NULL AND city != ''
+    """).fetchall()
+    updates = []
+    for listing_id, city, state in rows:
+        coords = get_city_coordinates(city, state)
+        if coords:
+            updates.append((coords[0], coords[1], listing_id))
+    conn.executemany("UPDATE market_prices SET latitude = ?, longitude = ? WHERE id = ?", updates)
+
+
+def _sql_haversine(lat1, lon1, lat2, lon2) -> Optional[float]:
+    """haversine(lat1, lon1, lat2, lon2) in SQL; NULL if any coordinate is NULL"""
+    if lat1 is None or lon1 is None or lat2 is None or lon2 is None:
+        return None
+    return haversine_distance(lat1, lon1, lat2, lon2)
+
+
+def register_sql_functions(conn: sqlite3.Connection):
+    """Register the scalar functions queries may use (haversine distance in miles)"""
+    conn.create_function("haversine", 4, _sql_haversine, deterministic=True)
+
+
+def near_conditions(near: Tuple[float, float], radius_miles: float,
+                    alias: str = "mp") -> Tuple[List[str], List]:
+    """
+    WHERE conditions for listings within radius_miles of near=(lat, lon)
+    A bounding-box probe of the R*Tree prefilters, haversine() makes it exact
+    """
+    lat, lon = near
+    min_lat, max_lat, min_lon, max_lon = bounding_box(lat, lon, radius_miles)
+    conditions = [
+        f"{alias}.id IN (SELECT id FROM market_prices_geo "
+        "WHERE min_lat >= ? AND max_lat <= ? AND min_lon >= ? AND max_lon <= ?)",
+        f"haversine(?, ?, {alias}.latitude, {alias}.longitude) <= ?"
+    ]
+    return conditions, [min_lat, max_lat, min_lon, max_lon, lat, lon, radius_miles]
+
+
+# Ordered schema migrations: (version, description, apply function).
+# PRAGMA user_version holds the applied version; schema_version keeps the history.
+SCHEMA_MIGRATIONS = [
+    (1, "baseline schema", _migration_001_baseline),
+    (2, "market_prices.distance_miles", _migration_002_distance_miles),
+    (3, "market_stats summary table", _migration_003_market_stats),
+    (4, "indexes for listing hard filters", _migration_004_filter_indexes),
+    (5, "fair value regression models", _migration_005_fair_value_models),
+    (6, "listing coordinates and R*Tree index", _migration_006_listing_coordinates),
+]
+
+SCHEMA_VERSION = SCHEMA_MIGRATIONS[-1][0]
+
+# Databases already brought up to SCHEMA_VERSION by this process
+_migrated_paths = set()
+_migrated_paths_lock = threading.Lock()
+
+
+class DatabaseManager:
+    """Manages SQLite database connections and operations
+
+    By default connections are pooled: all writes go through one long-lived
+    writer connection (serialized by a lock), and reads use per-thread
+    read-only connections, so dashboard pages keep rendering while a scraper
+    or importer is writing. Pass pooled=False to get the old connect-per-call
+    behaviour. The pragmas applied to each connection come from `profile`,
+    either a PerformanceProfile or a key of PERFORMANCE_PROFILES.
+    """
+
+    def __init__(self, db_path: str = "car_valuation.db", pooled: bool = True,
+                 profile='default'):
         self.db_path = db_path
+        self.pooled = pooled
+        self.profile = PERFORMANCE_PROFILES[profile] if isinstance(profile, str) else profile
+
+        # Single writer shared by every thread
+        self._write_lock = threading.RLock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._write_depth = 0
+        self._writer_owner = None
+
+        # Per-thread read-only connections, keyed by thread ident
+        self._local = threading.local()
+        self._pool_lock = threading.Lock()
+        self._pool: Dict[int, sqlite3.Connection] = {}
+
         self.initialize_database()
 
-    @contextmanager
-    def get_connection(self):
-        """Context manager for database connections"""
-        conn = sqlite3.connect(self.db_path)
+    def _open_connection(self, read_only: bool = False) -> sqlite3.Connection:
+        """Open a new connection with the performance profile applied"""
+        if read_only and self.db_path != ":memory:":
+            uri = Path(self.db_path).resolve().as_uri() + "?mode=ro"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+        else:
+            read_only = False
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
         conn.row_factory = sqlite3.Row  # Enable column access by name
-        try:
-            yield conn
-            conn.commit()
-        except Exception:
-            conn.rollback()
-            raise
-        finally:
-            conn.close()
+        self.profile.apply(conn, read_only=read_only)
+        register_sql_functions(conn)
+        return conn
 
-    def initialize_database(self):
-        """Create database schema if it doesn't exist"""
-        schema_path = Path(__file__).parent / "database_schema.sql"
+    def _reader_connection(self) -> sqlite3.Connection:
+        """Get (or lazily open) the read-only connection for this thread
 
-        with self.get_connection() as conn:
-            with open(schema_path, 'r') as f:
-                schema_sql = f.read()
-                conn.executescript(schema_sql)
+        Opening one also closes the readers of threads that have exited, so
+        short-lived threads (e.g. one per Streamlit rerun) don't pile up
+        connections.
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open_connection(read_only=True)
+            self._local.conn = conn
+            ident = threading.get_ident()
+            with self._pool_lock:
+                alive = {thread.ident for thread in threading.enumerate()}
+                stale = [self._pool.pop(key) for key in list(self._pool)
+                         if key not in alive or key == ident]
+                self._pool[ident] = conn
+            for old in stale:
+                old.close()
+        return conn
+
+    def _holds_writer(self) -> bool:
+        """True if the current thread is inside a write block"""
+        return self._write_depth > 0 and self._writer_owner == threading.get_ident()
 
-        print(f"Database initialized: {self.db_path}")
+    @contextmanager
+    def get_connection(self, read_only: bool = False):
+        """Context manager for database connections
+
+        Write connections commit on success and roll back on error. Nested
+        uses on the same thread share the writer, and only the outermost
+        block commits or rolls back. read_only=True hands out a read-only
+        connection instead, unless this thread is already writing, in which
+        case the writer is reused so uncommitted rows stay visible.
+        """
+        if not self.pooled:
+            conn = self._open_connection(read_only=read_only)
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                conn.close()
+            return
+
+        # An in-memory database only exists on the writer's connection
+        if read_only and not self._holds_writer() and self.db_path != ":memory:":
+            yield self._reader_connection()
+            return
+
+        with self._write_lock:
+            if self._writer is None:
+                self._writer = self._open_connection()
+            conn = self._writer
+            self._write_depth += 1
+            self._writer_owner = threading.get_ident()
+            try:
+                yield conn
+                if self._write_depth == 1:
+                    conn.commit()
+            except Exception:
+                if self._write_depth == 1:
+                    conn.rollback()
+                raise
+            finally:
+                self._write_depth -= 1
+                if self._write_depth == 0:
+                    self._writer_owner = None
+
+    def close(self):
+        """Close the writer and every pooled reader (safe to call more than once)"""
+        with self._write_lock:
+            writer, self._writer = self._writer, None
+        with self._pool_lock:
+            pool, self._pool = list(self._pool.values()), {}
+        for conn in pool + ([writer] if writer else []):
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+        self._local = threading.local()
+
+    def initialize_database(self):
+        """Bring the schema up to date, at most once per database per process
+
+        The check is a single PRAGMA user_version read; migrations only run
+        when the file is behind SCHEMA_VERSION.
+        """
+        key = self.db_path if self.db_path == ":memory:" else str(Path(self.db_path).resolve())
+        if key in _migrated_paths:
+            return
+
+        with _migrated_paths_lock:
+            if key in _migrated_paths:
+                return
+
+            with self.get_connection() as conn:
+                current = conn.execute("PRAGMA user_version").fetchone()[0]
+                if current < SCHEMA_VERSION:
+                    self._apply_migrations(conn)
+
+            if self.db_path != ":memory:":
+                _migrated_paths.add(key)
+
+    def _apply_migrations(self, conn: sqlite3.Connection):
+        """Apply pending migrations in one write transaction"""
+        # Take the write lock first so concurrent processes migrate one at a time
+        conn.execute("BEGIN IMMEDIATE")
+        current = conn.execute("PRAGMA user_version").fetchone()[0]
+
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS schema_version (
+                version INTEGER PRIMARY KEY,
+                description TEXT,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+        for version, description, migrate in SCHEMA_MIGRATIONS:
+            if version <= current:
+                continue
+            migrate(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO schema_version (version, description) VALUES (?, ?)",
+                (version, description)
+            )
+            print(f"Applied schema migration {version}: {description}")
+
+        if current < SCHEMA_VERSION:
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+            print(f"Database initialized: {self.db_path} (schema v{SCHEMA_VERSION})")
 
     def execute_query(self, query: str, params: tuple = ()) -> List[Dict]:
         """Execute a SELECT query and return results as list of dicts"""
-        with self.get_connection() as conn:
+        with self.get_connection(read_only=True) as conn:
             cursor = conn.execute(query, params)
             columns = [description[0] for description in cursor.description]
             return [dict(zip(columns, row)) for row in cursor.fetchall()]
@@ -135,6 +660,9 @@ class MarketPrice:
     city: str = ""
     state: str = "CA"
     region: str = ""
+    latitude: Optional[float] = None  # filled from city/state on insert when missing
+    longitude: Optional[float] = None
+    distance_miles: Optional[float] = None  # to the nearest reference location
 
     # Features
     has_leather: bool = False
@@ -205,6 +733,19 @@ class DriverFit:
     id: Optional[int] = None
 
 
+# SQLite caps bound parameters per statement; keep IN (...) lists well under it
+IN_CLAUSE_CHUNK = 500
+
+# on_conflict modes accepted by the bulk insert APIs
+ON_CONFLICT_MODES = (None, 'ignore', 'update')
+
+
+def _chunked(items: List, size: int = IN_CLAUSE_CHUNK):
+    """Yield successive slices of at most `size` items"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
 class VehicleRepository:
     """Repository for vehicle CRUD operations"""
 
@@ -220,12 +761,67 @@ class VehicleRepository:
 
         return self.db.execute_write(query, tuple(data.values()))
 
+    def create_vehicles_bulk(self, vehicles: List[Vehicle],
+                             on_conflict: Optional[str] = None) -> List[int]:
+        """
+        Insert many vehicles in a single transaction
+        Returns the vehicle IDs in the same order as `vehicles`
+
+        on_conflict decides what happens when (make, model, year, trim) already
+        exists: None raises IntegrityError and rolls back the whole batch,
+        'ignore' keeps the existing row, 'update' overwrites it.
+        """
+        if on_conflict not in ON_CONFLICT_MODES:
+            raise ValueError(f"on_conflict must be one of {ON_CONFLICT_MODES}")
+        if not vehicles:
+            return []
+
+        columns = [f.name for f in fields(Vehicle) if f.name != 'id']
+        key_columns = ['make', 'model', 'year', 'trim']
+        placeholders = ', '.join(['?' for _ in columns])
+        query = f"INSERT INTO vehicles ({', '.join(columns)}) VALUES ({placeholders})"
+
+        if on_conflict == 'ignore':
+            query += f" ON CONFLICT({', '.join(key_columns)}) DO NOTHING"
+        elif on_conflict == 'update':
+            updates = ', '.join(f"{c} = excluded.{c}" for c in columns if c not in key_columns)
+            query += (f" ON CONFLICT({', '.join(key_columns)}) DO UPDATE SET {updates},"
+                      " updated_at = CURRENT_TIMESTAMP")
+
+        rows = [tuple(getattr(v, c) for c in columns) for v in vehicles]
+
+        with self.db.get_connection() as conn:
+            conn.executemany(query, rows)
+
+            # Conflicting rows get no new rowid, so resolve every ID by its key
+            ids_by_key = {}
+            makes = list({v.make for v in vehicles})
+            for chunk in _chunked(makes):
+                cursor = conn.execute(
+                    f"SELECT id, make, model, year, trim FROM vehicles "
+                    f"WHERE make IN ({', '.join(['?' for _ in chunk])})",
+                    tuple(chunk)
+                )
+                for row in cursor:
+                    ids_by_key[(row[1], row[2], row[3], row[4])] = row[0]
+
+        return [ids_by_key[(v.make, v.model, v.year, v.trim)] for v in vehicles]
+
     def get_vehicle(self, vehicle_id: int) -> Optional[Dict]:
         """Get vehicle by ID"""
         query = "SELECT * FROM vehicles WHERE id = ?"
         results = self.db.execute_query(query, (vehicle_id,))
         return results[0] if results else None
 
+    def get_vehicles_by_ids(self, vehicle_ids: List[int]) -> Dict[int, Dict]:
+        """Get many vehicles at once, keyed by ID"""
+        vehicles = {}
+        for chunk in _chunked(list(vehicle_ids)):
+            query = f"SELECT * FROM vehicles WHERE id IN ({', '.join(['?' for _ in chunk])})"
+            for row in self.db.execute_query(query, tuple(chunk)):
+                vehicles[row['id']] = row
+        return vehicles
+
     def find_vehicles(self, make: str = None, model: str = None,
                      year_min: int = None, year_max: int = None) -> List[Dict]:
         """Find vehicles matching criteria"""
@@ -250,6 +846,16 @@ class VehicleRepository:
 
         return self.db.execute_query(query, tuple(params))
 
+    def get_vehicle_id_map(self) -> Dict[Tuple[str, str, int], int]:
+        """
+        {(make, model, year): vehicle_id} for every vehicle in one query
+        When several trims share a key, the first one created wins
+        """
+        ids = {}
+        for row in self.db.execute_query("SELECT id, make, model, year FROM vehicles ORDER BY id"):
+            ids.setdefault((row['make'], row['model'], row['year']), row['id'])
+        return ids
+
     def get_or_create_vehicle(self, vehicle: Vehicle) -> int:
         """Get existing vehicle ID or create new one"""
         existing = self.db.execute_query(
@@ -266,12 +872,33 @@ class VehicleRepository:
 class MarketPriceRepository:
     """Repository for market pricing data"""
 
+    # Aggregates over market_stats rows, matching the old AVG/MIN/MAX over listings
+    _MARKET_STATS_COLUMNS = """
+        COALESCE(SUM(listing_count), 0) as listing_count,
+        SUM(sum_price) / SUM(listing_count) as avg_price,
+        MIN(min_price) as min_price,
+        MAX(max_price) as max_price,
+        SUM(sum_mileage) / SUM(listing_count) as avg_mileage,
+        COALESCE(SUM(sold_count), 0) as sold_count,
+        SUM(sum_sale_price) / NULLIF(SUM(sale_price_count), 0) as avg_sale_price
+    """
+
     def __init__(self, db: DatabaseManager):
         self.db = db
 
+    @staticmethod
+    def _with_coordinates(listing: MarketPrice) -> MarketPrice:
+        """Listing with latitude/longitude geocoded from city/state if they are missing"""
+        if listing.latitude is not None or not listing.city:
+            return listing
+        coords = get_city_coordinates(listing.city, listing.state)
+        if not coords:
+            return listing
+        return replace(listing, latitude=coords[0], longitude=coords[1])
+
     def add_listing(self, listing: MarketPrice) -> int:
         """Add a market listing"""
-        data = asdict(listing)
+        data = asdict(self._with_coordinates(listing))
         data.pop('id', None)
 
         columns = ', '.join(data.keys())
@@ -280,11 +907,106 @@ class MarketPriceRepository:
 
         return self.db.execute_write(query, tuple(data.values()))
 
+    def add_listings_bulk(self, listings: List[MarketPrice],
+                          on_conflict: Optional[str] = None) -> List[int]:
+        """
+        Insert many market listings in a single transaction
+        Returns the listing IDs in the same order as `listings`
+
+        market_prices has no unique key, so conflicts are matched on a
+        non-empty source_url: None always inserts, 'ignore' keeps the existing
+        row and returns its ID, 'update' overwrites the existing row.
+        """
+        if on_conflict not in ON_CONFLICT_MODES:
+            raise ValueError(f"on_conflict must be one of {ON_CONFLICT_MODES}")
+        if not listings:
+            return []
+
+        columns = [f.name for f in fields(MarketPrice) if f.name != 'id']
+        placeholders = ', '.join(['?' for _ in columns])
+        insert_query = f"INSERT INTO market_prices ({', '.join(columns)}) VALUES ({placeholders})"
+        update_query = (f"UPDATE market_prices SET {', '.join(c + ' = ?' for c in columns)} "
+                        "WHERE id = ?")
+
+        rows = [tuple(getattr(l, c) for c in columns) for l in map(self._with_coordinates, listings)]
+        ids: List[Optional[int]] = [None] * len(listings)
+
+        with self.db.get_connection() as conn:
+            existing = {}
+            if on_conflict:
+                urls = list({l.source_url for l in listings if l.source_url})
+                for chunk in _chunked(urls):
+                    cursor = conn.execute(
+                        f"SELECT id, source_url FROM market_prices "
+                        f"WHERE source_url IN ({', '.join(['?' for _ in chunk])}) ORDER BY id",
+                        tuple(chunk)
+                    )
+                    for row in cursor:
+                        existing.setdefault(row[1], row[0])
+
+            to_insert = []  # indexes into listings
+            to_update = {}  # existing listing id -> row
+            first_new_by_url = {}  # URL -> index of its first new row in this batch
+            aliases = {}  # index of an in-batch duplicate -> index of the first copy
+            for i, listing in enumerate(listings):
+                url = listing.source_url
+                if on_conflict and url in existing:
+                    ids[i] = existing[url]
+                    if on_conflict == 'update':
+                        to_update[existing[url]] = rows[i]
+                elif on_conflict and url in first_new_by_url:
+                    first = first_new_by_url[url]
+                    aliases[i] = first
+                    if on_conflict == 'update':
+                        rows[first] = rows[i]
+                else:
+                    if url:
+                        first_new_by_url[url] = i
+                    to_insert.append(i)
+
+            if to_update:
+                conn.executemany(update_query,
+                                 [row + (listing_id,) for listing_id, row in to_update.items()])
+
+            if to_insert:
+                conn.executemany(insert_query, [rows[i] for i in to_insert])
+                # The writer holds the write lock for the whole transaction, so
+                # AUTOINCREMENT hands this batch a contiguous block of IDs
+                last_id = conn.execute("SELECT last_insert_rowid()").fetchone()[0]
+                first_id = last_id - len(to_insert) + 1
+                for n, i in enumerate(to_insert):
+                    ids[i] = first_id + n
+                for i, first in aliases.items():
+                    ids[i] = ids[first]
+
+        return ids
+
+    def get_listing_fingerprints(self) -> Set[Tuple[int, float, int]]:
+        """(vehicle_id, asking_price, mileage) of every listing, for duplicate checks in memory"""
+        with self.db.get_connection(read_only=True) as conn:
+            return {tuple(row) for row in conn.execute("SELECT vehicle_id, asking_price, mileage FROM market_prices")}
+
     def get_listings(self, vehicle_id: int = None, region: str = None,
-                    min_date: str = None, sold_only: bool = False) -> List[Dict]:
-        """Get market listings with filters"""
+                    min_date: str = None, sold_only: bool = False,
+                    near: Tuple[float, float] = None, radius_miles: float = None) -> List[Dict]:
+        """
+        Get market listings with filters
+        With near=(lat, lon) rows also carry 'distance' in miles; with radius_miles
+        they are limited to that radius and returned nearest first
+        """
         conditions = []
         params = []
+        distance_column = ""
+        order_by = "listing_date DESC"
+
+        if near:
+            distance_column = ", haversine(?, ?, mp.latitude, mp.longitude) AS distance"
+            params.extend(near)
+            if radius_miles is not None:
+                near_sql, near_params = near_conditions(near, radius_miles)
+                conditions.extend(near_sql)
+                params.extend(near_params)
+                order_by = "distance"
 
         if vehicle_id:
             conditions.append("vehicle_id = ?")
@@ -298,45 +1020,188 @@ class MarketPriceRepository:
         if sold_only:
             conditions.append("sold = 1")
 
+        where_clause = " AND ".join(conditions) if conditions else "1=1"
+        query = f"""
+            SELECT mp.*, v.make, v.model, v.year, v.trim{distance_column}
+            FROM market_prices mp
+            JOIN vehicles v ON mp.vehicle_id = v.id
+            WHERE {where_clause}
+            ORDER BY {order_by}
+        """
+
+        return self.db.execute_query(query, tuple(params))
+
+    def get_listings_near(self, lat: float, lon: float, radius_miles: float) -> List[Dict]:
+        """
+        Listings within radius_miles of (lat, lon), nearest first
+        The R*Tree narrows to a bounding box; rows carry an exact 'distance' in miles
+        """
+        return self.get_listings(near=(lat, lon), radius_miles=radius_miles)
+
+    def get_filtered_listings(self, budget_max: float = None, max_mileage: int = None,
+                              require_4wd: bool = False, driver_height: int = None,
+                              require_tall_driver_suitable: bool = False,
+                              min_cargo_cuft: float = 0, min_towing_lbs: int = 0) -> List[Dict]:
+        """
+        Get listings that pass a buyer's hard requirements, filtered in SQL
+        Rows have the same columns as get_listings
+
+        Height and tall-driver checks only apply to vehicles that have driver
+        fit data; missing cargo/towing specs count as 0.
+        """
+        conditions = []
+        params = []
+
+        if budget_max is not None:
+            conditions.append("mp.asking_price <= ?")
+            params.append(budget_max)
+        if max_mileage is not None:
+            conditions.append("mp.mileage <= ?")
+            params.append(max_mileage)
+        if require_4wd:
+            conditions.append("v.drivetrain IN ('4WD', 'AWD')")
+        if require_tall_driver_suitable:
+            conditions.append("(df.id IS NULL OR df.tall_driver_suitable)")
+        if driver_height is not None:
+            conditions.append("(df.id IS NULL OR (df.recommended_height_min <= ? "
+                              "AND df.recommended_height_max >= ?))")
+            params.extend([driver_height, driver_height])
+        if min_cargo_cuft:
+            conditions.append("COALESCE(v.cargo_capacity_cuft, 0) >= ?")
+            params.append(min_cargo_cuft)
+        if min_towing_lbs:
+            conditions.append("COALESCE(v.towing_capacity_lbs, 0) >= ?")
+            params.append(min_towing_lbs)
+
         where_clause = " AND ".join(conditions) if conditions else "1=1"
         query = f"""
             SELECT mp.*, v.make, v.model, v.year, v.trim
             FROM market_prices mp
             JOIN vehicles v ON mp.vehicle_id = v.id
+            LEFT JOIN driver_fit df
+                ON df.id = (SELECT MIN(id) FROM driver_fit WHERE vehicle_id = v.id)
             WHERE {where_clause}
             ORDER BY listing_date DESC
         """
 
         return self.db.execute_query(query, tuple(params))
 
+    def get_region_centroids(self) -> Dict[str, Tuple[float, float]]:
+        """{region: (mean latitude, mean longitude)} over each region's geocoded listings"""
+        rows = self.db.execute_query("""
+            SELECT region, AVG(latitude) as latitude, AVG(longitude) as longitude
+            FROM market_prices
+            WHERE COALESCE(region, '') != '' AND latitude IS NOT NULL AND longitude IS NOT NULL
+            GROUP BY region
+        """)
+        return {row['region']: (row['latitude'], row['longitude']) for row in rows}
+
+    def get_price_rows_for_models(self, models: List[Tuple[str, str]] = None, year: int = None) -> List[Dict]:
+        """
+        Slim price rows for many (make, model) pairs (all vehicles if None) in one pass
+        Vehicles without listings come back once with NULL listing columns
+        """
+        query = """
+            SELECT v.make, v.model, v.year, mp.region, mp.asking_price,
+                   mp.mileage, mp.sold, mp.sale_price
+            FROM vehicles v
+            LEFT JOIN market_prices mp ON mp.vehicle_id = v.id
+            WHERE {where_clause}
+        """
+        year_conditions = ["v.year = ?"] if year else []
+        year_params = [year] if year else []
+
+        if models is None:
+            where_clause = " AND ".join(year_conditions) if year_conditions else "1=1"
+            return self.db.execute_query(query.format(where_clause=where_clause), tuple(year_params))
+
+        wanted = set(models)
+        rows = []
+        makes = list({make for make, _ in wanted})
+        for chunk in _chunked(makes):
+            conditions = [f"v.make IN ({', '.join(['?' for _ in chunk])})"] + year_conditions
+            rows.extend(row for row in self.db.execute_query(query.format(where_clause=" AND ".join(conditions)),
+                                                             tuple(chunk) + tuple(year_params))
+                        if (row['make'], row['model']) in wanted)
+        return rows
+
+    def get_underpriced_listings(self, threshold_pct: float = 10) -> List[Dict]:
+        """
+        Unsold listings at least threshold_pct below their make/model/year peer average
+        One window-function query; rows carry peer_avg, peer_count, peer_sq_dev
+        (sum of squared deviations) and price_percentile (0 = cheapest peer)
+        """
+        query = """
+            WITH peers AS (
+                SELECT mp.*, v.make, v.model, v.year, v.trim,
+                       AVG(mp.asking_price) OVER w AS peer_avg,
+                       COUNT(mp.asking_price) OVER w AS peer_count,
+                       PERCENT_RANK() OVER (w ORDER BY mp.asking_price) AS price_percentile
+                FROM market_prices mp
+                JOIN vehicles v ON mp.vehicle_id = v.id
+                WINDOW w AS (PARTITION BY v.make, v.model, v.year)
+            ),
+            spread AS (
+                SELECT *,
+                       SUM((asking_price - peer_avg) * (asking_price - peer_avg))
+                           OVER (PARTITION BY make, model, year) AS peer_sq_dev
+                FROM peers
+            )
+            SELECT * FROM spread
+            WHERE NOT COALESCE(sold, 0)
+              AND peer_avg > 0
+              AND (asking_price - peer_avg) / peer_avg * 100 <= -?
+            ORDER BY (peer_avg - asking_price) / peer_avg DESC
+        """
+        return self.db.execute_query(query, (threshold_pct,))
+
     def get_market_statistics(self, make: str, model: str, year: int,
                               region: str = None) -> Dict:
-        """Get market statistics for a vehicle"""
-        conditions = ["v.make = ?", "v.model = ?", "v.year = ?"]
+        """Get market statistics for a vehicle (O(1) lookup in market_stats)"""
+        conditions = ["make = ?", "model = ?", "year = ?"]
         params = [make, model, year]
 
         if region:
-            conditions.append("mp.region = ?")
+            conditions.append("region = ?")
             params.append(region)
 
         where_clause = " AND ".join(conditions)
         query = f"""
-            SELECT
-                COUNT(*) as listing_count,
-                AVG(mp.asking_price) as avg_price,
-                MIN(mp.asking_price) as min_price,
-                MAX(mp.asking_price) as max_price,
-                AVG(mp.mileage) as avg_mileage,
-                COUNT(CASE WHEN mp.sold = 1 THEN 1 END) as sold_count,
-                AVG(CASE WHEN mp.sold = 1 THEN mp.sale_price END) as avg_sale_price
-            FROM market_prices mp
-            JOIN vehicles v ON mp.vehicle_id = v.id
+            SELECT {self._MARKET_STATS_COLUMNS}
+            FROM market_stats
             WHERE {where_clause}
         """
 
         results = self.db.execute_query(query, tuple(params))
         return results[0] if results else {}
 
+    def get_market_statistics_bulk(self, keys: List[Tuple[str, str, int]]) -> Dict[Tuple[str, str, int], Dict]:
+        """
+        Market statistics for many (make, model, year) groups in one query
+        Returns {(make, model, year): stats} with the same fields as get_market_statistics
+        """
+        wanted = set(keys)
+        stats = {}
+        makes = list({make for make, _, _ in wanted})
+        for chunk in _chunked(makes):
+            query = f"""
+                SELECT make, model, year, {self._MARKET_STATS_COLUMNS}
+                FROM market_stats
+                WHERE make IN ({', '.join(['?' for _ in chunk])})
+                GROUP BY make, model, year
+            """
+            for row in self.db.execute_query(query, tuple(chunk)):
+                key = (row.pop('make'), row.pop('model'), row.pop('year'))
+                if key in wanted:
+                    stats[key] = row
+        return stats
+
+    def refresh_market_stats(self):
+        """Rebuild market_stats from scratch (the triggers normally keep it current)"""
+        with self.db.get_connection() as conn:
+            conn.execute("DELETE FROM market_stats")
+            conn.execute(_MARKET_STATS_REBUILD.format(filter="1=1"))
+
 
 class ProblemRepository:
     """Repository for vehicle problems and reliability"""
@@ -374,6 +1239,19 @@ class ProblemRepository:
 
         return self.db.execute_query(query, params)
 
+    def get_problems_for_models(self, models: List[Tuple[str, str]]) -> Dict[Tuple[str, str], List[Dict]]:
+        """Get known problems for many (make, model) pairs, keyed by pair"""
+        wanted = set(models)
+        problems = {pair: [] for pair in wanted}
+        makes = list({make for make, _ in wanted})
+        for chunk in _chunked(makes):
+            query = f"SELECT * FROM vehicle_problems WHERE make IN ({', '.join(['?' for _ in chunk])})"
+            for row in self.db.execute_query(query, tuple(chunk)):
+                pair = (row['make'], row['model'])
+                if pair in problems:
+                    problems[pair].append(row)
+        return problems
+
     def add_reliability_data(self, make: str, model: str, year_start: int,
                             year_end: int, reliability_score: int, **kwargs) -> int:
         """Add reliability data"""
@@ -385,6 +1263,56 @@ class ProblemRepository:
         return self.db.execute_write(query, (make, model, year_start, year_end, reliability_score))
 
 
+class FairValueRepository:
+    """Repository for the per-model fair value regressions"""
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+
+    def get_models(self) -> Dict[Tuple[str, str], Dict]:
+        """All fitted models keyed by (make, model), region_offsets decoded"""
+        models = {}
+        for row in self.db.execute_query("SELECT * FROM fair_value_models"):
+            row['region_offsets'] = json.loads(row['region_offsets']) if row['region_offsets'] else {}
+            models[(row['make'], row['model'])] = row
+        return models
+
+    def get_version(self) -> Tuple:
+        """Changes whenever save_models stores or drops a model (for cache checks)"""
+        rows = self.db.execute_query("SELECT MAX(fitted_at) as fitted_at, COUNT(*) as count FROM fair_value_models")
+        return (rows[0]['fitted_at'], rows[0]['count'])
+
+    def get_dirty_models(self) -> Dict[Tuple[str, str], int]:
+        """(make, model) groups whose listings changed since their last fit, with change counters"""
+        rows = self.db.execute_query("SELECT make, model, changes FROM fair_value_dirty")
+        return {(row['make'], row['model']): row['changes'] for row in rows}
+
+    def save_models(self, refit: Dict[Tuple[str, str], Optional[Dict]],
+                    changes: Dict[Tuple[str, str], int]):
+        """
+        Replace the models for the refit groups in one transaction (None drops a group)
+        Dirty marks are cleared only if no change landed after `changes` was read
+        """
+        with self.db.get_connection() as conn:
+            conn.executemany("DELETE FROM fair_value_models WHERE make = ? AND model = ?",
+                             [key for key, fit in refit.items() if fit is None])
+            conn.executemany("""
+                INSERT OR REPLACE INTO fair_value_models
+                (make, model, intercept, coef_mileage, coef_age, region_offsets,
+                 reference_year, sigma, r_squared, listing_count, fitted_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, strftime('%Y-%m-%d %H:%M:%f', 'now'))
+            """, [
+                (make, model, fit['intercept'], fit['coef_mileage'], fit['coef_age'],
+                 json.dumps(fit['region_offsets']), fit['reference_year'], fit['sigma'],
+                 fit['r_squared'], fit['listing_count'])
+                for (make, model), fit in refit.items() if fit is not None
+            ])
+            conn.executemany(
+                "DELETE FROM fair_value_dirty WHERE make = ? AND model = ? AND changes = ?",
+                [(make, model, count) for (make, model), count in changes.items()]
+            )
+
+
 class DriverFitRepository:
     """Repository for driver fit and comfort data"""
 
@@ -408,6 +1336,16 @@ class DriverFitRepository:
         results = self.db.execute_query(query, (vehicle_id,))
         return results[0] if results else None
 
+    def get_fit_data_by_vehicle_ids(self, vehicle_ids: List[int]) -> Dict[int, Dict]:
+        """Get driver fit data for many vehicles, keyed by vehicle ID"""
+        fit_data = {}
+        for chunk in _chunked(list(vehicle_ids)):
+            query = (f"SELECT * FROM driver_fit WHERE vehicle_id IN ({', '.join(['?' for _ in chunk])}) "
+                     "ORDER BY id")
+            for row in self.db.execute_query(query, tuple(chunk)):
+                fit_data.setdefault(row['vehicle_id'], row)
+        return fit_data
+
     def find_suitable_vehicles(self, driver_height: int, min_comfort: int = 7) -> List[Dict]:
         """Find vehicles suitable for a driver height"""
         query = """
@@ -1,5 +1,6 @@
 -- Car Valuation Database Schema
 -- Comprehensive database for tracking vehicle values, market trends, and identifying good deals
+-- This file is schema migration 1; later changes are added to SCHEMA_MIGRATIONS in database.py
 
 -- Core vehicle information
 CREATE TABLE IF NOT EXISTS vehicles (
@@ -4,9 +4,15 @@ Geolocation and Distance Calculation
 Calculate distances between locations for filtering nearby listings
 """
 
+import csv
+import difflib
 import math
-from typing import Tuple, Optional, Dict
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Tuple, Optional, Dict, List
 import sqlite3
+import numpy as np
 
 
 # Reference locations
@@ -15,6 +21,34 @@ REFERENCE_LOCATIONS = {
     'San Jose, CA': (37.3382, -121.8863),
 }
 
+# City gazetteer: one row per (city, state) with optional '|'-separated aliases.
+# Loaded on first lookup and kept for the life of the process.
+GAZETTEER_PATH = Path(__file__).with_name('city_coordinates.csv')
+_gazetteer = None
+_gazetteer_names = None
+
+PLACE_ABBREVIATIONS = {'st': 'saint', 'mt': 'mount', 'ft': 'fort'}
+
+STATE_CODES = {
+    'california': 'CA', 'nevada': 'NV', 'washington': 'WA', 'oregon': 'OR',
+    'idaho': 'ID', 'arizona': 'AZ', 'utah': 'UT',
+}
+
+# Fallback points for the listing regions (see FacebookParser.determine_region),
+# used only when a region has no geocoded listings to average
+REGION_CENTROIDS = {
+    'Bay Area': (37.6000, -122.1500),
+    'SoCal': (33.9000, -117.9000),
+    'Central Valley': (37.0000, -120.3000),
+    'Other CA': (36.9741, -122.0308),
+    'California': (36.7783, -119.4179),
+    'Washington': (47.4000, -121.5000),
+    'Oregon': (44.6000, -122.8000),
+    'Nevada': (37.5000, -117.5000),
+    'Arizona': (33.4484, -112.0740),
+    'Idaho': (43.6150, -116.2023),
+}
+
 
 def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     """
@@ -43,191 +77,98 @@ def haversine_distance(lat1: float, lon1: float, lat2: float, lon2: float) -> fl
     return R * c
 
 
-def get_city_coordinates(city: str, state: str) -> Optional[Tuple[float, float]]:
+def haversine_matrix(lats, lons, ref_lats, ref_lons) -> np.ndarray:
     """
-    Get approximate coordinates for a city
+    Vectorized haversine_distance between n points and m reference points
 
     Returns:
-        (latitude, longitude) or None if not found
+        (n, m) array of distances in miles (NaN where a coordinate is NaN)
     """
-    # Common California cities
-    california_cities = {
-        'San Francisco': (37.7749, -122.4194),
-        'Oakland': (37.8044, -122.2712),
-        'Berkeley': (37.8715, -122.2730),
-        'San Jose': (37.3382, -121.8863),
-        'Fremont': (37.5485, -121.9886),
-        'Santa Cruz': (36.9741, -122.0308),
-        'Sacramento': (38.5816, -121.4944),
-        'Fresno': (36.7378, -119.7871),
-        'Bakersfield': (35.3733, -119.0187),
-        'Los Angeles': (34.0522, -118.2437),
-        'San Diego': (32.7157, -117.1611),
-        'Orange': (33.7879, -117.8531),
-        'Irvine': (33.6846, -117.8265),
-        'Anaheim': (33.8366, -117.9143),
-        'Riverside': (33.9806, -117.3755),
-        'Perris': (33.7825, -117.2287),
-        'Salinas': (36.6777, -121.6555),
-        'San Leandro': (37.7249, -122.1561),
-        'Carson': (33.8317, -118.2820),
-        'Stockton': (37.9577, -121.2908),
-        'Modesto': (37.6391, -120.9969),
-        'Walnut Creek': (37.9101, -122.0652),
-        'Palo Alto': (37.4419, -122.1430),
-        'Cupertino': (37.3230, -122.0322),
-        'Mountain View': (37.3861, -122.0839),
-        'Sunnyvale': (37.3688, -122.0363),
-        'Milpitas': (37.4323, -121.8996),
-        'Hayward': (37.6688, -122.0808),
-        'San Mateo': (37.5630, -122.3255),
-        'Redwood City': (37.4852, -122.2364),
-        'Folsom': (38.6779, -121.1760),
-        'Roseville': (38.7521, -121.2880),
-        'Rocklin': (38.7907, -121.2358),
-        'Citrus Heights': (38.7071, -121.2811),
-        'Malibu': (34.0259, -118.7798),
-        'Pomona': (34.0551, -117.7499),
-        'Hesperia': (34.4264, -117.3009),
-        'Palmdale': (34.5794, -118.1165),
-        'Fontana': (34.0922, -117.4350),
-        'San Rafael': (37.9735, -122.5311),
-        'Selma': (36.5707, -119.6120),
-        'Hanford': (36.3274, -119.6457),
-        'Sun Valley': (34.2197, -118.3645),
-        'Covina': (34.0900, -117.8903),
-        'La Habra': (33.9319, -117.9462),
-        'Exeter': (36.2960, -119.1420),
-        'Imperial': (32.8473, -115.5694),
-        'Fresno': (36.7378, -119.7871),
-        'Pacoima': (34.2605, -118.4300),
-        'Hollister': (36.8524, -121.4016),
-        'Antioch': (38.0049, -121.8058),
-        'Oroville': (39.5138, -121.5564),
-        'Pleasant Grove': (38.8082, -121.5222),
-        'Rancho Cordova': (38.5891, -121.3028),
-        'Brentwood': (37.9318, -121.6958),
-        'Windsor': (38.5471, -122.8164),
-        'Camp Pendleton Marine Corps Base': (33.3142, -117.3150),
-        'Highland': (34.1283, -117.2086),
-        'Chino Hills': (33.9898, -117.7323),
-        'West Sacramento': (38.5805, -121.5302),
-        'South Gate': (33.9550, -118.2120),
-        'North Hollywood': (34.1878, -118.3792),
-        'Ukiah': (39.1502, -123.2078),
-        'Perris': (33.7825, -117.2287),
-    }
+    lat1 = np.radians(np.asarray(lats, dtype=float))[:, None]
+    lon1 = np.radians(np.asarray(lons, dtype=float))[:, None]
+    lat2 = np.radians(np.asarray(ref_lats, dtype=float))[None, :]
+    lon2 = np.radians(np.asarray(ref_lons, dtype=float))[None, :]
 
-    # Nevada cities
-    nevada_cities = {
-        'Las Vegas': (36.1699, -115.1398),
-        'Reno': (39.5296, -119.8138),
-    }
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 3959.0 * 2 * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
 
-    # Washington cities
-    washington_cities = {
-        'Seattle': (47.6062, -122.3321),
-        'Tacoma': (47.2529, -122.4443),
-        'Spokane': (47.6588, -117.4260),
-        'Bellevue': (47.6101, -122.2015),
-        'Kent': (47.3809, -122.2348),
-        'Kirkland': (47.6769, -122.2060),
-        'Renton': (47.4829, -122.2171),
-        'Bremerton': (47.5673, -122.6326),
-        'Fife': (47.2393, -122.3571),
-        'Bothell': (47.7623, -122.2054),
-        'Auburn': (47.3073, -122.2285),
-        'Puyallup': (47.1856, -122.2931),
-        'Olympia': (47.0379, -122.9007),
-        'Vancouver': (45.6387, -122.6615),
-        'Ridgefield': (45.8151, -122.7445),
-        'Battle Ground': (45.7809, -122.5354),
-        'Lake Oswego': (45.4207, -122.6706),
-        'Covington': (47.3581, -122.1215),
-        'Monroe': (47.8556, -121.9709),
-        'Pullman': (46.7312, -117.1796),
-        'Moses Lake': (47.1301, -119.2781),
-        'Sumner': (47.2037, -122.2407),
-    }
 
-    # Oregon cities
-    oregon_cities = {
-        'Portland': (45.5152, -122.6784),
-        'Eugene': (44.0521, -123.0868),
-        'Salem': (44.9429, -123.0351),
-        'Bend': (44.0582, -121.3153),
-        'Medford': (42.3265, -122.8756),
-        'Corvallis': (44.5646, -123.2620),
-        'Springfield': (44.0462, -122.9814),
-        'Hillsboro': (45.5229, -122.9897),
-        'Lebanon': (44.5365, -122.9070),
-        'Happy Valley': (45.4470, -122.5195),
-        'Warrenton': (46.1651, -123.9237),
-        'Hermiston': (45.8404, -119.2894),
-        'Umpqua': (43.3165, -123.4551),
-        'Coeur D\'Alene': (47.6777, -116.7805),  # Actually Idaho but near OR border
-    }
+def closest_reference_distances(lats, lons, references: Dict[str, Tuple[float, float]] = None) -> np.ndarray:
+    """Distance from each point to its nearest reference location (NaN if unknown)"""
+    references = references or REFERENCE_LOCATIONS
+    ref_lats, ref_lons = zip(*references.values())
+    return haversine_matrix(lats, lons, ref_lats, ref_lons).min(axis=1)
 
-    # Idaho cities
-    idaho_cities = {
-        'Boise': (43.6150, -116.2023),
-        'Meridian': (43.6121, -116.3915),
-        'Nampa': (43.5407, -116.5635),
-        'Idaho Falls': (43.4666, -112.0341),
-        'Pocatello': (42.8713, -112.4455),
-        'Caldwell': (43.6629, -116.6874),
-        'Coeur D\'Alene': (47.6777, -116.7805),
-        'Twin Falls': (42.5630, -114.4608),
-        'Eagle': (43.6955, -116.3540),
-        'Rathdrum': (47.8119, -116.8976),
-        'Huston': (43.6240, -116.3470),
-    }
 
-    # Arizona cities
-    arizona_cities = {
-        'Phoenix': (33.4484, -112.0740),
-        'Tucson': (32.2226, -110.9747),
-        'Mesa': (33.4152, -111.8315),
-        'Chandler': (33.3062, -111.8413),
-        'Scottsdale': (33.4942, -111.9261),
-        'Glendale': (33.5387, -112.1860),
-        'Gilbert': (33.3528, -111.7890),
-        'Tempe': (33.4255, -111.9400),
-        'Peoria': (33.5806, -112.2374),
-        'Surprise': (33.6303, -112.3679),
-    }
+def bounding_box(lat: float, lon: float, radius_miles: float) -> Tuple[float, float, float, float]:
+    """
+    Lat/lon box that contains every point within radius_miles of (lat, lon)
 
-    # Utah cities
-    utah_cities = {
-        'Salt Lake City': (40.7608, -111.8910),
-        'Provo': (40.2338, -111.6585),
-        'West Valley City': (40.6916, -112.0011),
-        'West Jordan': (40.6097, -111.9391),
-        'Orem': (40.2969, -111.6946),
-        'Sandy': (40.5649, -111.8389),
-        'Hurricane': (37.1753, -113.2899),
-    }
+    Returns:
+        (min_lat, max_lat, min_lon, max_lon)
+    """
+    # One degree of latitude is ~69 miles; longitude degrees shrink with cos(lat)
+    delta_lat = radius_miles / 69.0
+    cos_lat = math.cos(math.radians(lat))
+    delta_lon = radius_miles / (69.0 * cos_lat) if cos_lat > 1e-6 else 180.0
+    return (lat - delta_lat, lat + delta_lat,
+            lon - min(delta_lon, 180.0), lon + min(delta_lon, 180.0))
+
+
+def _normalize_place(name: str) -> str:
+    """Lowercase, drop punctuation, expand St./Mt./Ft. so spellings share one key"""
+    words = re.sub(r"[^a-z0-9 ]", " ", name.lower().replace("'", "")).split()
+    return " ".join(PLACE_ABBREVIATIONS.get(word, word) for word in words)
+
+
+def _normalize_state(state: str) -> str:
+    state = (state or "").strip()
+    return STATE_CODES.get(state.lower(), state.upper())
+
+
+def _load_gazetteer() -> Dict[Tuple[str, str], Tuple[float, float]]:
+    """Read city_coordinates.csv once into a {(normalized city, state): (lat, lon)} index"""
+    global _gazetteer, _gazetteer_names
+    if _gazetteer is None:
+        index = {}
+        names = {}
+        with open(GAZETTEER_PATH, newline='') as f:
+            for row in csv.DictReader(f):
+                coords = (float(row['latitude']), float(row['longitude']))
+                state = row['state']
+                for name in [row['city']] + [a for a in row['aliases'].split('|') if a]:
+                    key = _normalize_place(name)
+                    index.setdefault((key, state), coords)
+                    names.setdefault(state, []).append(key)
+        _gazetteer_names = names
+        _gazetteer = index
+    return _gazetteer
+
+
+@lru_cache(maxsize=4096)
+def _fuzzy_city_lookup(city_key: str, state: str) -> Optional[Tuple[float, float]]:
+    """Closest known spelling in the same state (e.g. typos in scraped city names)"""
+    matches = difflib.get_close_matches(city_key, _gazetteer_names.get(state, []), n=1, cutoff=0.85)
+    return _gazetteer[(matches[0], state)] if matches else None
 
-    # Normalize city name
-    city_normalized = city.strip()
-
-    if state == 'CA':
-        coords = california_cities.get(city_normalized)
-    elif state == 'WA':
-        coords = washington_cities.get(city_normalized)
-    elif state == 'OR':
-        coords = oregon_cities.get(city_normalized)
-    elif state == 'ID':
-        coords = idaho_cities.get(city_normalized)
-    elif state == 'AZ':
-        coords = arizona_cities.get(city_normalized)
-    elif state == 'NV':
-        coords = nevada_cities.get(city_normalized)
-    elif state == 'UT':
-        coords = utah_cities.get(city_normalized)
-    else:
-        coords = None
 
+def get_city_coordinates(city: str, state: str) -> Optional[Tuple[float, float]]:
+    """
+    Get approximate coordinates for a city
+
+    Returns:
+        (latitude, longitude) or None if not found
+    """
+    if not city:
+        return None
+
+    gazetteer = _load_gazetteer()
+    city_key = _normalize_place(city)
+    state = _normalize_state(state)
+
+    coords = gazetteer.get((city_key, state))
+    if coords is None:
+        coords = _fuzzy_city_lookup(city_key, state)
     return coords
 
 
@@ -273,38 +214,67 @@ def get_closest_distance(city: str, state: str) -> Optional[float]:
     return min(distances) if distances else None
 
 
+def update_listing_distances(conn: sqlite3.Connection,
+                             references: Dict[str, Tuple[float, float]] = None) -> Dict:
+    """
+    Recompute distance_miles for every listing against the reference locations
+    Missing coordinates are geocoded once per city; all rows are written with one
+    executemany. Listings that no longer geocode have their old distance cleared.
+
+    Returns:
+        Counts of updated / newly calculated / failed / cleared listings and the failed cities
+    """
+    rows = conn.execute("""
+        SELECT id, city, state, latitude, longitude, distance_miles
+        FROM market_prices
+        WHERE latitude IS NOT NULL OR (city IS NOT NULL AND city != '') OR distance_miles IS NOT NULL
+    """).fetchall()
+
+    coords_cache = {}
+    lats, lons = [], []
+    for _, city, state, lat, lon, _ in rows:
+        if lat is None or lon is None:
+            if (city, state) not in coords_cache:
+                coords_cache[(city, state)] = get_city_coordinates(city, state)
+            lat, lon = coords_cache[(city, state)] or (np.nan, np.nan)
+        lats.append(lat)
+        lons.append(lon)
+
+    distances = closest_reference_distances(lats, lons, references) if rows else np.array([])
+    known = ~np.isnan(distances)
+
+    # Unresolved rows get NULL rather than keeping a distance from an older gazetteer
+    conn.executemany("""
+        UPDATE market_prices
+        SET distance_miles = ?, latitude = COALESCE(latitude, ?), longitude = COALESCE(longitude, ?)
+        WHERE id = ?
+    """, [(float(distances[i]), lats[i], lons[i], rows[i][0]) if known[i] else (None, None, None, rows[i][0])
+          for i in range(len(rows))])
+
+    return {
+        'updated': int(known.sum()),
+        'newly_calculated': sum(1 for i in np.flatnonzero(known) if rows[i][5] is None),
+        'failed': int((~known).sum()),
+        'cleared': sum(1 for i in np.flatnonzero(~known) if rows[i][5] is not None),
+        'failed_cities': sorted({f"{rows[i][1]}, {rows[i][2]}" for i in np.flatnonzero(~known) if rows[i][1]})
+    }
+
+
 def add_distance_column_to_db(db_path: str = "car_valuation.db"):
     """
-    Add distance_miles column to market_prices table and calculate distances
+    Calculate distances for all listings
+    (the distance_miles column itself is created by the schema migrations)
     """
     from database import DatabaseManager
 
     db = DatabaseManager(db_path)
 
     with db.get_connection() as conn:
-        # Check if column exists
-        cursor = conn.execute("PRAGMA table_info(market_prices)")
-        columns = [row[1] for row in cursor.fetchall()]
-
-        if 'distance_miles' not in columns:
-            print("Adding distance_miles column...")
-            conn.execute("ALTER TABLE market_prices ADD COLUMN distance_miles REAL")
-
         # Calculate distances for all listings
         print("\nCalculating distances from Santa Cruz / San Jose...")
-        cursor = conn.execute("SELECT id, city, state FROM market_prices")
-        listings = cursor.fetchall()
-
-        updated = 0
-        for listing_id, city, state in listings:
-            if city and state:
-                distance = get_closest_distance(city, state)
-                if distance is not None:
-                    conn.execute("UPDATE market_prices SET distance_miles = ? WHERE id = ?",
-                               (distance, listing_id))
-                    updated += 1
-
-        print(f"\n✓ Updated {updated} listings with distance calculations")
+        stats = update_listing_distances(conn)
+
+        print(f"\n✓ Updated {stats['updated']} listings with distance calculations")
 
 
 def main():
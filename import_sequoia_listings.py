@@ -8,6 +8,8 @@ import re
 from datetime import datetime
 from pathlib import Path
 
+from vehicle_matcher import match_vehicle
+
 # Sequoia listings data extracted from the RTF file
 SEQUOIA_LISTINGS = [
     {"price": 4900, "original_price": 5500, "year": 2004, "model": "sequoia Limited", "location": "Gardnerville, NV", "mileage": 281000, "url": "https://www.facebook.com/marketplace/item/1196591129264299/"},
@@ -32,33 +34,18 @@ SEQUOIA_LISTINGS = [
 ]
 
 def normalize_model_name(model: str) -> str:
-    """Normalize Sequoia model names"""
-    model = model.strip().title()
-    # Standardize common variations
-    model = model.replace("Sequoia", "Sequoia")
-    return model
+    """Normalize Sequoia model names to the catalog spelling ("sequoia sr5" -> "Sequoia SR5")"""
+    match = match_vehicle(model, make='Toyota')
+    if match is None:
+        return model.strip().title()
+    return f"{match.model} {match.trim}" if match.trim else match.model
 
 def get_or_create_vehicle(cursor, year: int, model: str) -> int:
     """Get vehicle_id or create vehicle entry if it doesn't exist"""
     make = 'Toyota'
-    trim = None
-
-    # Extract trim from model if present
-    model_lower = model.lower()
-    if 'limited' in model_lower:
-        trim = 'Limited'
-        model = 'Sequoia'
-    elif 'sr5' in model_lower:
-        trim = 'SR5'
-        model = 'Sequoia'
-    elif 'capstone' in model_lower:
-        trim = 'Capstone'
-        model = 'Sequoia'
-    elif 'trd' in model_lower:
-        trim = 'TRD'
-        model = 'Sequoia'
-    else:
-        model = 'Sequoia'
+    match = match_vehicle(model, make=make)
+    trim = match.trim if match else None
+    model = 'Sequoia'
 
     # Check if vehicle exists
     cursor.execute("""
@@ -5,99 +5,255 @@ Identify best markets to buy from and sell into
 """
 
 from database import DatabaseManager, VehicleRepository, MarketPriceRepository
-from typing import Dict, List, Optional
+from geolocation import REGION_CENTROIDS, haversine_distance
+from valuation import FairValueEstimator
+from typing import Dict, List, Optional, Tuple
 from collections import defaultdict
+import math
 import statistics
+import numpy as np
+
+# Rough cost of moving a car (trailer or driver + fuel) per mile between regions
+TRANSPORT_COST_PER_MILE = 0.75
+
+
+def _grouped_stats(group: np.ndarray, values: np.ndarray, n_groups: int) -> Dict[str, np.ndarray]:
+    """
+    Count, mean, sample stdev, min/max, median and quartiles of values per group id
+    Percentiles interpolate linearly, so the median matches statistics.median
+    """
+    count = np.bincount(group, minlength=n_groups)
+    safe_count = np.maximum(count, 1)
+    mean = np.bincount(group, weights=values, minlength=n_groups) / safe_count
+    sq_dev = np.bincount(group, weights=(values - mean[group]) ** 2, minlength=n_groups)
+    std = np.where(count > 1, np.sqrt(sq_dev / np.maximum(count - 1, 1)), 0.0)
+
+    # Sort by (group, value) so each group is a contiguous ascending run
+    order = np.lexsort((values, group))
+    ordered = values[order] if len(values) else np.zeros(1)
+    starts = np.concatenate(([0], np.cumsum(count)[:-1]))
+    last = len(ordered) - 1  # empty groups get clipped indices; callers check count
+
+    def percentile(q):
+        pos = starts + (safe_count - 1) * q
+        lo = np.minimum(np.floor(pos).astype(int), last)
+        hi = np.minimum(np.ceil(pos).astype(int), last)
+        return ordered[lo] + (ordered[hi] - ordered[lo]) * (pos - np.floor(pos))
+
+    return {
+        'count': count,
+        'mean': mean,
+        'std': std,
+        'min': percentile(0.0),
+        'max': percentile(1.0),
+        'median': percentile(0.5),
+        'p25': percentile(0.25),
+        'p75': percentile(0.75)
+    }
 
 
 class MarketAnalyzer:
     """Analyze market trends and identify arbitrage opportunities"""
 
-    def __init__(self, db: DatabaseManager):
+    def __init__(self, db: DatabaseManager, valuation: FairValueEstimator = None):
         self.db = db
         self.vehicle_repo = VehicleRepository(db)
         self.price_repo = MarketPriceRepository(db)
+        self.valuation = valuation or FairValueEstimator(db)
 
     def analyze_regional_pricing(self, make: str, model: str, year: int = None) -> Dict:
         """
         Analyze pricing differences across regions
         Returns price statistics by region
         """
-        # Get all listings for this vehicle
-        vehicles = self.vehicle_repo.find_vehicles(make=make, model=model)
-
-        if year:
-            vehicles = [v for v in vehicles if v['year'] == year]
-
-        if not vehicles:
-            return {'error': 'No vehicles found'}
+        return self.analyze_regional_pricing_bulk([(make, model)], year)[(make, model)]
 
-        vehicle_ids = [v['id'] for v in vehicles]
-
-        # Group listings by region
-        regional_data = defaultdict(list)
+    def analyze_regional_pricing_bulk(self, models: List[Tuple[str, str]],
+                                      year: int = None) -> Dict[Tuple[str, str], Dict]:
+        """
+        Regional price statistics for many (make, model) pairs at once
+        One query plus one NumPy pass; returns {(make, model): analyze_regional_pricing result}
+        """
+        rows = self.price_repo.get_price_rows_for_models(models, year)
+
+        found = {(r['make'], r['model']) for r in rows}
+        listings = [r for r in rows if r['region'] and r['asking_price'] is not None]
+
+        # Group key = (make, model, region), each group's rows contiguous and price-sorted
+        group_keys = [(r['make'], r['model'], r['region']) for r in listings]
+        unique_keys = sorted(set(group_keys))
+        key_index = {key: i for i, key in enumerate(unique_keys)}
+        group = np.array([key_index[k] for k in group_keys], dtype=int)
+        prices = np.array([r['asking_price'] for r in listings], dtype=float)
+        mileages = np.array([r['mileage'] or 0 for r in listings], dtype=float)
+        sale_prices = np.array([r['sale_price'] if r['sold'] and r['sale_price'] else np.nan
+                                for r in listings], dtype=float)
+
+        regional_stats = {pair: {} for pair in found}
+        if listings:
+            stats = _grouped_stats(group, prices, len(unique_keys))
+            mean_mileage = np.bincount(group, weights=mileages) / stats['count']
+            sold = ~np.isnan(sale_prices)
+            sold_count = np.bincount(group[sold], minlength=len(unique_keys))
+            sale_stats = _grouped_stats(group[sold], sale_prices[sold], len(unique_keys))
+
+            for i, (key_make, key_model, region) in enumerate(unique_keys):
+                regional_stats[(key_make, key_model)][region] = {
+                    'listing_count': int(stats['count'][i]),
+                    'avg_asking_price': round(float(stats['mean'][i]), 0),
+                    'median_asking_price': round(float(stats['median'][i]), 0),
+                    'p25_asking_price': round(float(stats['p25'][i]), 0),
+                    'p75_asking_price': round(float(stats['p75'][i]), 0),
+                    'min_price': round(float(stats['min'][i]), 0),
+                    'max_price': round(float(stats['max'][i]), 0),
+                    'price_std_dev': round(float(stats['std'][i]), 0),
+                    'avg_mileage': round(float(mean_mileage[i]), 0),
+                    'sold_count': int(sold_count[i]),
+                    'avg_sale_price': round(float(sale_stats['mean'][i]), 0) if sold_count[i] else None,
+                    'median_sale_price': round(float(sale_stats['median'][i]), 0) if sold_count[i] else None
+                }
+
+        results = {}
+        for make, model in models:
+            if (make, model) not in found:
+                results[(make, model)] = {'error': 'No vehicles found'}
+                continue
+            results[(make, model)] = {
+                'vehicle': f"{make} {model}" + (f" {year}" if year else ""),
+                'regional_stats': regional_stats[(make, model)],
+                'arbitrage_opportunity': self._best_region_spread(regional_stats[(make, model)])
+            }
+        return results
 
-        for vehicle_id in vehicle_ids:
-            listings = self.price_repo.get_listings(vehicle_id=vehicle_id)
+    def _best_region_spread(self, regional_stats: Dict) -> Optional[Dict]:
+        """Cheapest-to-most-expensive region pair by average asking price"""
+        if len(regional_stats) <= 1:
+            return None
 
-            for listing in listings:
-                if listing.get('region'):
-                    regional_data[listing['region']].append({
-                        'price': listing['asking_price'],
-                        'mileage': listing['mileage'],
-                        'condition': listing.get('condition', 'good'),
-                        'sold': listing.get('sold', False),
-                        'sale_price': listing.get('sale_price')
-                    })
+        # Find cheapest and most expensive markets
+        cheapest_region = min(regional_stats.items(), key=lambda x: x[1]['avg_asking_price'])
+        most_expensive_region = max(regional_stats.items(), key=lambda x: x[1]['avg_asking_price'])
 
-        # Calculate statistics for each region
-        regional_stats = {}
+        price_difference = most_expensive_region[1]['avg_asking_price'] - cheapest_region[1]['avg_asking_price']
+        arbitrage_percentage = (price_difference / cheapest_region[1]['avg_asking_price']) * 100
 
-        for region, listings in regional_data.items():
-            prices = [l['price'] for l in listings]
-            mileages = [l['mileage'] for l in listings]
+        return {
+            'buy_from': cheapest_region[0],
+            'buy_price': cheapest_region[1]['avg_asking_price'],
+            'sell_to': most_expensive_region[0],
+            'sell_price': most_expensive_region[1]['avg_asking_price'],
+            'potential_profit': price_difference,
+            'profit_percentage': round(arbitrage_percentage, 1)
+        }
 
-            sold_listings = [l for l in listings if l['sold'] and l['sale_price']]
-            sale_prices = [l['sale_price'] for l in sold_listings] if sold_listings else []
+    def build_arbitrage_matrix(self, cost_per_mile: float = TRANSPORT_COST_PER_MILE,
+                               min_listings: int = 1) -> Dict:
+        """
+        Region x region price spread matrix for every make/model/year at once
 
-            regional_stats[region] = {
-                'listing_count': len(listings),
-                'avg_asking_price': round(statistics.mean(prices), 0) if prices else 0,
-                'median_asking_price': round(statistics.median(prices), 0) if prices else 0,
-                'min_price': round(min(prices), 0) if prices else 0,
-                'max_price': round(max(prices), 0) if prices else 0,
-                'price_std_dev': round(statistics.stdev(prices), 0) if len(prices) > 1 else 0,
-                'avg_mileage': round(statistics.mean(mileages), 0) if mileages else 0,
-                'sold_count': len(sold_listings),
-                'avg_sale_price': round(statistics.mean(sale_prices), 0) if sale_prices else None
-            }
+        Prices are adjusted to each vehicle's mean mileage with a per-vehicle
+        price/mileage slope, then averaged per region. spread[v, b, s] is the
+        adjusted average in sell region s minus buy region b minus transport
+        cost between the region centroids (NaN where either side is missing).
 
-        # Identify arbitrage opportunities
-        if len(regional_stats) > 1:
-            # Find cheapest and most expensive markets
-            cheapest_region = min(regional_stats.items(), key=lambda x: x[1]['avg_asking_price'])
-            most_expensive_region = max(regional_stats.items(), key=lambda x: x[1]['avg_asking_price'])
-
-            price_difference = most_expensive_region[1]['avg_asking_price'] - cheapest_region[1]['avg_asking_price']
-            arbitrage_percentage = (price_difference / cheapest_region[1]['avg_asking_price']) * 100
-
-            arbitrage_opportunity = {
-                'buy_from': cheapest_region[0],
-                'buy_price': cheapest_region[1]['avg_asking_price'],
-                'sell_to': most_expensive_region[0],
-                'sell_price': most_expensive_region[1]['avg_asking_price'],
-                'potential_profit': price_difference,
-                'profit_percentage': round(arbitrage_percentage, 1)
-            }
-        else:
-            arbitrage_opportunity = None
+        Each region's centroid is the mean location of its geocoded listings,
+        falling back to REGION_CENTROIDS when it has none. Priced listings
+        with no region, or a region with no centroid, are left out and counted
+        in 'excluded_listings'.
+        """
+        centroids = dict(REGION_CENTROIDS)
+        centroids.update(self.price_repo.get_region_centroids())
+
+        priced = [r for r in self.price_repo.get_price_rows_for_models() if r['asking_price'] is not None]
+        rows = [r for r in priced if r['region'] in centroids]
+
+        vehicles = sorted({(r['make'], r['model'], r['year']) for r in rows})
+        regions = sorted({r['region'] for r in rows})
+        vehicle_index = {key: i for i, key in enumerate(vehicles)}
+        region_index = {region: i for i, region in enumerate(regions)}
+        n_vehicles, n_regions = len(vehicles), len(regions)
+
+        v = np.array([vehicle_index[(r['make'], r['model'], r['year'])] for r in rows], dtype=int)
+        reg = np.array([region_index[r['region']] for r in rows], dtype=int)
+        prices = np.array([r['asking_price'] for r in rows], dtype=float)
+        mileages = np.array([r['mileage'] or 0 for r in rows], dtype=float)
+
+        # Per-vehicle least-squares slope of price on mileage (never rewards more miles)
+        counts = np.bincount(v, minlength=n_vehicles)
+        safe_counts = np.maximum(counts, 1)
+        mean_mileage = np.bincount(v, weights=mileages, minlength=n_vehicles) / safe_counts
+        mean_price = np.bincount(v, weights=prices, minlength=n_vehicles) / safe_counts
+        dm = mileages - mean_mileage[v]
+        sxx = np.bincount(v, weights=dm ** 2, minlength=n_vehicles)
+        sxy = np.bincount(v, weights=dm * (prices - mean_price[v]), minlength=n_vehicles)
+        slope = np.where((counts >= 3) & (sxx > 0), sxy / np.where(sxx > 0, sxx, 1), 0.0)
+        slope = np.minimum(slope, 0.0)
+        adjusted = prices - slope[v] * dm
+
+        # Average adjusted price per (vehicle, region) cell
+        cell = v * n_regions + reg
+        listing_counts = np.bincount(cell, minlength=n_vehicles * n_regions).reshape(n_vehicles, n_regions)
+        sums = np.bincount(cell, weights=adjusted, minlength=n_vehicles * n_regions).reshape(n_vehicles, n_regions)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            avg_price = np.where(listing_counts >= max(min_listings, 1), sums / listing_counts, np.nan)
+
+        # Transport cost between region centroids
+        distances = np.array([[haversine_distance(*centroids[a], *centroids[b])
+                               for b in regions] for a in regions]).reshape(n_regions, n_regions)
+        transport_cost = distances * cost_per_mile
+
+        spread = avg_price[:, None, :] - avg_price[:, :, None] - transport_cost[None, :, :]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            profit_pct = spread / avg_price[:, :, None] * 100
 
         return {
-            'vehicle': f"{make} {model}" + (f" {year}" if year else ""),
-            'regional_stats': regional_stats,
-            'arbitrage_opportunity': arbitrage_opportunity
+            'vehicles': vehicles,
+            'regions': regions,
+            'avg_price': avg_price,
+            'listing_counts': listing_counts,
+            'distance_miles': distances,
+            'transport_cost': transport_cost,
+            'spread': spread,
+            'profit_pct': profit_pct,
+            'centroids': {region: centroids[region] for region in regions},
+            'excluded_listings': len(priced) - len(rows)
         }
 
+    def find_arbitrage_opportunities(self, limit: int = 20, min_profit: float = 0,
+                                     cost_per_mile: float = TRANSPORT_COST_PER_MILE,
+                                     min_listings: int = 1) -> List[Dict]:
+        """
+        Rank buy-region/sell-region opportunities across the whole inventory
+        Returns the best `limit` spreads after mileage adjustment and transport cost
+        """
+        matrix = self.build_arbitrage_matrix(cost_per_mile=cost_per_mile, min_listings=min_listings)
+        spread = matrix['spread']
+
+        candidates = np.flatnonzero(np.nan_to_num(spread, nan=-np.inf) > min_profit)
+        candidates = candidates[np.argsort(-spread.ravel()[candidates], kind='stable')][:limit]
+
+        opportunities = []
+        for v, buy, sell in zip(*np.unravel_index(candidates, spread.shape)):
+            make, model, year = matrix['vehicles'][v]
+            opportunities.append({
+                'vehicle': f"{year} {make} {model}",
+                'make': make,
+                'model': model,
+                'year': year,
+                'buy_from': matrix['regions'][buy],
+                'buy_price': round(float(matrix['avg_price'][v, buy]), 0),
+                'buy_listings': int(matrix['listing_counts'][v, buy]),
+                'sell_to': matrix['regions'][sell],
+                'sell_price': round(float(matrix['avg_price'][v, sell]), 0),
+                'sell_listings': int(matrix['listing_counts'][v, sell]),
+                'distance_miles': round(float(matrix['distance_miles'][buy, sell]), 0),
+                'transport_cost': round(float(matrix['transport_cost'][buy, sell]), 0),
+                'potential_profit': round(float(spread[v, buy, sell]), 0),
+                'profit_percentage': round(float(matrix['profit_pct'][v, buy, sell]), 1)
+            })
+
+        return opportunities
+
     def find_best_buy_markets(self, limit: int = 5) -> List[Dict]:
         """
         Identify markets with best prices (good for buying)
@@ -243,44 +399,42 @@ class MarketAnalyzer:
         Good candidates for quick purchases
         """
         underpriced = []
-
-        # Get all unique vehicles
-        vehicles = self.vehicle_repo.find_vehicles()
-
-        for vehicle in vehicles:
-            # Get market stats for this vehicle
-            stats = self.price_repo.get_market_statistics(
-                vehicle['make'],
-                vehicle['model'],
-                vehicle['year']
-            )
-
-            if not stats or not stats.get('avg_price'):
-                continue
-
-            avg_price = stats['avg_price']
-
-            # Get individual listings
-            listings = self.price_repo.get_listings(vehicle_id=vehicle['id'])
-
-            for listing in listings:
-                if listing.get('sold'):
-                    continue  # Skip sold listings
-
-                price_diff_pct = ((listing['asking_price'] - avg_price) / avg_price) * 100
-
-                if price_diff_pct <= -threshold_pct:
-                    underpriced.append({
-                        'vehicle': f"{vehicle['year']} {vehicle['make']} {vehicle['model']} {vehicle['trim']}",
-                        'asking_price': listing['asking_price'],
-                        'market_avg': round(avg_price, 0),
-                        'savings': round(avg_price - listing['asking_price'], 0),
-                        'savings_pct': round(-price_diff_pct, 1),
-                        'mileage': listing['mileage'],
-                        'condition': listing.get('condition', 'Unknown'),
-                        'location': f"{listing.get('city', 'Unknown')}, {listing.get('region', 'Unknown')}",
-                        'listing_id': listing['id']
-                    })
+        models = self.valuation.get_models()
+
+        for listing in self.price_repo.get_underpriced_listings(threshold_pct):
+            avg_price = listing['peer_avg']
+            price_diff_pct = ((listing['asking_price'] - avg_price) / avg_price) * 100
+
+            # Sample standard deviation of the peer group
+            peer_count = listing['peer_count']
+            std_dev = math.sqrt(listing['peer_sq_dev'] / (peer_count - 1)) if peer_count > 1 else 0
+            z_score = (listing['asking_price'] - avg_price) / std_dev if std_dev else None
+
+            # Mileage/age/region-adjusted value from the model's regression
+            fair_value = self.valuation.predict_fair_value(listing, models)
+            fit = models.get((listing['make'], listing['model'])) if fair_value else None
+
+            underpriced.append({
+                'vehicle': f"{listing['year']} {listing['make']} {listing['model']} {listing['trim']}",
+                'asking_price': listing['asking_price'],
+                'market_avg': round(avg_price, 0),
+                'savings': round(avg_price - listing['asking_price'], 0),
+                'savings_pct': round(-price_diff_pct, 1),
+                'peer_count': peer_count,
+                'z_score': round(z_score, 2) if z_score is not None else None,
+                'price_percentile': round(listing['price_percentile'] * 100, 1),
+                'fair_value': round(fair_value, 0) if fair_value else None,
+                'fair_value_sigmas': (round((listing['asking_price'] - fair_value) / fit['sigma'], 2)
+                                      if fit and fit['sigma'] else None),
+                'mileage': listing['mileage'],
+                'condition': listing.get('condition', 'Unknown'),
+                'location': f"{listing.get('city', 'Unknown')}, {listing.get('region', 'Unknown')}",
+                'distance_miles': listing.get('distance_miles'),
+                'coordinates': ((listing['latitude'], listing['longitude'])
+                                if listing.get('latitude') is not None else None),
+                'source_url': listing.get('source_url'),
+                'listing_id': listing['id']
+            })
 
         # Sort by savings percentage
         underpriced.sort(key=lambda x: x['savings_pct'], reverse=True)
@@ -292,6 +446,7 @@ def main():
     """Demo market analysis tools"""
     db = DatabaseManager()
     analyzer = MarketAnalyzer(db)
+    analyzer.valuation.refit()  # fit models whose listings changed since the last run
 
     print("=" * 80)
     print("MARKET ANALYSIS & ARBITRAGE TOOLS")
@@ -325,6 +480,20 @@ def main():
     else:
         print(regional['error'])
 
+    # Example 1b: Arbitrage across the whole inventory
+    print("\n\nTOP ARBITRAGE OPPORTUNITIES (mileage-adjusted, after transport)")
+    print("-" * 80)
+
+    excluded = analyzer.build_arbitrage_matrix()['excluded_listings']
+    if excluded:
+        print(f"({excluded} listings without a usable region are not included)")
+
+    for i, opp in enumerate(analyzer.find_arbitrage_opportunities(limit=5, min_listings=2), 1):
+        print(f"{i}. {opp['vehicle']}: buy in {opp['buy_from']} (~${opp['buy_price']:,.0f}), "
+              f"sell in {opp['sell_to']} (~${opp['sell_price']:,.0f})")
+        print(f"   Transport: ${opp['transport_cost']:,.0f} ({opp['distance_miles']:,.0f} mi) | "
+              f"Profit: ${opp['potential_profit']:,.0f} ({opp['profit_percentage']}%)")
+
     # Example 2: Best markets to buy
     print("\n\nBEST MARKETS TO BUY FROM")
     print("-" * 80)
@@ -6,9 +6,12 @@ Considers: budget, needs, driver fit, total cost of ownership
 
 from database import DatabaseManager, VehicleRepository, MarketPriceRepository, DriverFitRepository, ProblemRepository
 from scoring_engine import VehicleScorer, UserPreferences
+from valuation import FairValueEstimator
 from typing import List, Dict, Optional, Tuple
 from dataclasses import dataclass
+import heapq
 import json
+import numpy as np
 
 
 @dataclass
@@ -28,77 +31,68 @@ class UseCase:
 class RecommendationEngine:
     """Generate vehicle recommendations based on user needs"""
 
-    def __init__(self, db: DatabaseManager):
+    def __init__(self, db: DatabaseManager, valuation: FairValueEstimator = None):
         self.db = db
         self.vehicle_repo = VehicleRepository(db)
         self.price_repo = MarketPriceRepository(db)
         self.fit_repo = DriverFitRepository(db)
         self.problem_repo = ProblemRepository(db)
-        self.scorer = VehicleScorer(db)
+        self.scorer = VehicleScorer(db, valuation)
 
     def find_best_matches(self, preferences: UserPreferences, limit: int = 10) -> List[Dict]:
         """
         Find best vehicle matches for user preferences
         Returns scored and ranked listings
         """
-        # Get all available listings
-        listings = self.price_repo.get_listings()
-
-        # Filter by hard requirements
-        filtered_listings = []
-        for listing in listings:
-            vehicle = self.vehicle_repo.get_vehicle(listing['vehicle_id'])
-            fit_data = self.fit_repo.get_fit_data(listing['vehicle_id'])
-
-            # Budget check
-            if listing['asking_price'] > preferences.budget_max:
-                continue
-
-            # Mileage check
-            if listing['mileage'] > preferences.max_mileage:
-                continue
+        # Hard requirements are applied in SQL, so only candidates are loaded
+        filtered_listings = self.price_repo.get_filtered_listings(
+            budget_max=preferences.budget_max,
+            max_mileage=preferences.max_mileage,
+            require_4wd=preferences.require_4wd,
+            driver_height=preferences.driver_height,
+            require_tall_driver_suitable=preferences.require_tall_driver_suitable,
+            min_cargo_cuft=preferences.min_cargo_cuft,
+            min_towing_lbs=preferences.min_towing_lbs
+        )
 
-            # 4WD requirement
-            if preferences.require_4wd and vehicle['drivetrain'] not in ['4WD', 'AWD']:
-                continue
+        return self._rank_top_k(filtered_listings, preferences, limit)
 
-            # Tall driver requirement
-            if preferences.require_tall_driver_suitable and fit_data:
-                if not fit_data['tall_driver_suitable']:
-                    continue
-
-            # Height compatibility
-            if fit_data:
-                if preferences.driver_height < fit_data['recommended_height_min'] or \
-                   preferences.driver_height > fit_data['recommended_height_max']:
+    def _rank_top_k(self, listings: List[Dict], preferences: UserPreferences,
+                    limit: int, chunk_size: int = 256) -> List[Dict]:
+        """
+        Score listings best-bound-first and keep only the top `limit` in a heap
+        Stops once no remaining listing's upper bound can beat the current k-th score
+        """
+        if not listings or limit <= 0:
+            return []
+
+        bounds = self.scorer.score_upper_bounds(listings, preferences)
+        order = np.argsort(-bounds, kind='stable')
+
+        # Min-heap of (score, -position, match): the weakest kept match is on top,
+        # and ties keep the earlier listing like the old stable sort did
+        heap = []
+        for start in range(0, len(order), chunk_size):
+            chunk = order[start:start + chunk_size]
+            # total_score is rounded to 0.1, so allow for rounding up
+            if len(heap) == limit and heap[0][0] > bounds[chunk[0]] + 0.05:
+                break
+
+            chunk_listings = [listings[i] for i in chunk]
+            scores = self.scorer.score_listings_batch(chunk_listings, preferences)
+            for position, listing, score_result in zip(chunk, chunk_listings, scores):
+                if score_result is None:
+                    print(f"Error scoring listing {listing.get('id')}: no usable vehicle data")
                     continue
-
-            # Cargo requirement
-            if vehicle['cargo_capacity_cuft'] < preferences.min_cargo_cuft:
-                continue
-
-            # Towing requirement
-            if vehicle['towing_capacity_lbs'] < preferences.min_towing_lbs:
-                continue
-
-            filtered_listings.append(listing)
-
-        # Score remaining listings
-        scored_listings = []
-        for listing in filtered_listings:
-            try:
-                score_result = self.scorer.score_listing(listing, preferences)
-                scored_listings.append({
-                    'listing': listing,
-                    'score': score_result
-                })
-            except Exception as e:
-                print(f"Error scoring listing {listing.get('id')}: {e}")
-
-        # Sort by total score
-        scored_listings.sort(key=lambda x: x['score']['total_score'], reverse=True)
-
-        return scored_listings[:limit]
+                entry = (score_result['total_score'], -int(position),
+                         {'listing': listing, 'score': score_result})
+                if len(heap) < limit:
+                    heapq.heappush(heap, entry)
+                elif entry[:2] > heap[0][:2]:
+                    heapq.heapreplace(heap, entry)
+
+        heap.sort(key=lambda x: x[:2], reverse=True)
+        return [match for _, _, match in heap]
 
     def analyze_use_case(self, use_case: UseCase, budget: float, driver_height: int) -> Dict:
         """
@@ -4,9 +4,67 @@ Multi-factor scoring to identify best value vehicles
 """
 
 from database import DatabaseManager, VehicleRepository, MarketPriceRepository, ProblemRepository, DriverFitRepository
+from valuation import FairValueEstimator
 from typing import Dict, List, Optional
 from dataclasses import dataclass
 from datetime import datetime
+import numpy as np
+
+
+# Scoring tables shared by score_listing and score_listings_batch
+BRAND_RELIABILITY = {
+    'Toyota': 95,
+    'Lexus': 98,
+    'Ford': 70,
+    'Tesla': 65,
+    'Chevrolet': 68,
+    'GMC': 68,
+    'RAM': 65,
+    'Nissan': 72,
+    'Honda': 90,
+    'Acura': 88
+}
+
+SEVERITY_PENALTY = {'critical': 20, 'major': 10, 'moderate': 5, 'minor': 2}
+FREQUENCY_PENALTY = {'widespread': 5, 'common': 3}
+
+# Brands with strong resale
+BRAND_RESALE = {
+    'Toyota': 90,
+    'Lexus': 85,
+    'Honda': 85,
+    'Ford': 75,  # F-150 specifically holds value well
+    'Tesla': 60,  # Currently depreciating rapidly
+    'Chevrolet': 65,
+    'GMC': 70,
+}
+
+RESALE_CHAMPION_MODELS = ['Tacoma', '4Runner', 'Land Cruiser', 'GX', 'LX']
+
+# Brand maintenance cost (reliability correlates with lower maintenance)
+BRAND_MAINTENANCE = {
+    'Toyota': 90,
+    'Lexus': 75,  # More expensive than Toyota
+    'Honda': 88,
+    'Ford': 70,
+    'Tesla': 80,  # Low maintenance but expensive repairs
+    'Chevrolet': 68,
+    'GMC': 68
+}
+
+CONDITION_SCORES = {
+    'excellent': 100,
+    'good': 85,
+    'fair': 65,
+    'poor': 40
+}
+
+CONDITION_MULTIPLIERS = {
+    'excellent': 1.10,
+    'good': 1.00,
+    'fair': 0.85,
+    'poor': 0.65
+}
 
 
 @dataclass
@@ -34,12 +92,13 @@ class UserPreferences:
 class VehicleScorer:
     """Calculate comprehensive scores for vehicles"""
 
-    def __init__(self, db: DatabaseManager):
+    def __init__(self, db: DatabaseManager, valuation: FairValueEstimator = None):
         self.db = db
         self.vehicle_repo = VehicleRepository(db)
         self.price_repo = MarketPriceRepository(db)
         self.problem_repo = ProblemRepository(db)
         self.fit_repo = DriverFitRepository(db)
+        self.valuation = valuation or FairValueEstimator(db)
 
     def score_listing(self, listing: Dict, preferences: UserPreferences) -> Dict:
         """
@@ -103,6 +162,277 @@ class VehicleScorer:
             }
         }
 
+    def score_listings_batch(self, listings: List[Dict], preferences: UserPreferences) -> List[Optional[Dict]]:
+        """
+        Score many listings at once
+        Returns results in the same order and format as score_listing
+
+        Vehicles, fit data, problems and market statistics are loaded with a
+        few set-based queries, and every sub-score is computed as a NumPy
+        column operation. Missing vehicle specs are treated as the Vehicle
+        defaults instead of raising. Listings score_listing would reject
+        (unknown vehicle, no usable fair value) come back as None.
+        """
+        if not listings:
+            return []
+
+        vehicle_ids = list({l['vehicle_id'] for l in listings})
+        vehicles = self.vehicle_repo.get_vehicles_by_ids(vehicle_ids)
+        fits = self.fit_repo.get_fit_data_by_vehicle_ids(vehicle_ids)
+        problems = self.problem_repo.get_problems_for_models(
+            list({(v['make'], v['model']) for v in vehicles.values()})
+        )
+        market_stats = self.price_repo.get_market_statistics_bulk(
+            list({(v['make'], v['model'], v['year']) for v in vehicles.values()})
+        )
+
+        # Per-vehicle lookups (a handful of rows), then broadcast to listings
+        vehicle_rows = []
+        vehicle_index = {}
+        vehicle_problems = []
+        for vid, vehicle in vehicles.items():
+            vehicle_index[vid] = len(vehicle_rows)
+            vehicle_rows.append(vehicle)
+            vehicle_problems.append([
+                p for p in problems.get((vehicle['make'], vehicle['model']), [])
+                if p['year_start'] <= vehicle['year'] <= p['year_end']
+            ])
+
+        valid = np.array([l['vehicle_id'] in vehicle_index for l in listings])
+        idx = np.array([vehicle_index.get(l['vehicle_id'], 0) for l in listings])
+
+        def vcol(key, default=0.0):
+            """Vehicle column as a float array aligned with listings"""
+            values = np.array([
+                default if v.get(key) is None else v[key] for v in vehicle_rows
+            ], dtype=float) if vehicle_rows else np.zeros(1)
+            return values[idx]
+
+        def vmap(func):
+            """Per-vehicle Python value broadcast to listings"""
+            values = np.array([func(v) for v in vehicle_rows]) if vehicle_rows else np.zeros(1)
+            return values[idx]
+
+        def lflag(key):
+            return np.array([bool(l.get(key)) for l in listings])
+
+        asking = np.array([l['asking_price'] for l in listings], dtype=float)
+        mileage = np.array([l['mileage'] for l in listings], dtype=float)
+        conditions = [l.get('condition', 'good') for l in listings]
+        has_leather, has_tow, has_nav = lflag('has_leather'), lflag('has_tow_package'), lflag('has_nav')
+
+        years = vcol('year')
+
+        # 1. Price
+        budget_score = np.where(
+            asking > preferences.budget_max, 0.0,
+            100 * (1 - (asking / preferences.budget_max) * 0.7)
+        )
+        avg_price = vmap(lambda v: (market_stats.get((v['make'], v['model'], v['year'])) or {}).get('avg_price') or 0.0)
+        avg_price = avg_price.astype(float)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            price_vs_market = np.where(avg_price > 0, asking / np.where(avg_price > 0, avg_price, 1), np.nan)
+        market_score = np.select(
+            [np.isnan(price_vs_market), price_vs_market < 0.85, price_vs_market < 0.95,
+             price_vs_market < 1.05, price_vs_market < 1.15],
+            [50, 100, 80, 60, 40], default=20
+        )
+        price = (budget_score + market_score) / 2
+
+        # 2. Reliability
+        penalty = vmap(lambda v: sum(
+            SEVERITY_PENALTY.get(p['severity'], 0) + FREQUENCY_PENALTY.get(p['frequency'], 0)
+            for p in vehicle_problems[vehicle_index[v['id']]]
+        ))
+        reliability = np.clip(vmap(lambda v: BRAND_RELIABILITY.get(v['make'], 75)) - penalty, 0, 100)
+
+        # 3. Comfort
+        def fcol(key, default=0.0):
+            values = np.array([
+                default if (fits.get(v['id']) or {}).get(key) is None else fits[v['id']][key]
+                for v in vehicle_rows
+            ], dtype=float) if vehicle_rows else np.zeros(1)
+            return values[idx]
+
+        has_fit = vmap(lambda v: v['id'] in fits).astype(bool)
+        out_of_range = (preferences.driver_height < fcol('recommended_height_min')) | \
+                       (preferences.driver_height > fcol('recommended_height_max'))
+        not_tall = preferences.require_tall_driver_suitable & ~fcol('tall_driver_suitable').astype(bool)
+        height_score = np.select([out_of_range, not_tall], [30, 20], default=100)
+        comfort = np.where(
+            has_fit,
+            (height_score + fcol('seat_comfort_score') * 10 + fcol('lumbar_support_score') * 10 +
+             fcol('seat_adjustability_score') * 10) / 4,
+            50
+        )
+
+        # 4. Features
+        cargo = vcol('cargo_capacity_cuft')
+        towing = vcol('towing_capacity_lbs')
+        features = np.full(len(listings), 50.0)
+        features += np.where(cargo >= preferences.min_cargo_cuft,
+                             np.minimum(25, (cargo - preferences.min_cargo_cuft) / 2), 0)
+        features += np.where(towing >= preferences.min_towing_lbs,
+                             np.select([towing >= 8000, towing >= 5000], [25, 15], default=10), 0)
+        if preferences.require_4wd:
+            four_wd = vmap(lambda v: v.get('drivetrain') in ['4WD', 'AWD']).astype(bool)
+            features += np.where(four_wd, 10, -30)
+        features += has_leather * 5 + has_tow * 5 + has_nav * 3
+        features = np.clip(features, 0, 100)
+
+        # 5. Resale
+        brand_resale = vmap(lambda v: BRAND_RESALE.get(v['make'], 70)
+                            + (10 if v['model'] in RESALE_CHAMPION_MODELS else 0)
+                            + (5 if v['model'] == 'F-150' else 0))
+        resale_mileage = np.select(
+            [mileage < 20000, mileage < 50000, mileage < 75000, mileage < 100000],
+            [100, 85, 70, 55], default=40
+        )
+        condition_score = np.array([CONDITION_SCORES.get(c, 70) for c in conditions], dtype=float)
+        resale = brand_resale * 0.5 + resale_mileage * 0.3 + condition_score * 0.2
+
+        # 6. Maintenance
+        fuel_type = vmap(lambda v: v.get('fuel_type'))
+        mpg = vcol('mpg_combined', default=20)
+        electric, hybrid = fuel_type == 'electric', fuel_type == 'hybrid'
+        fuel_score = np.select([electric, hybrid], [100, np.minimum(100, mpg * 3)],
+                               default=np.minimum(100, mpg * 4))
+        maintenance_base = np.select([electric, hybrid], [90, 75], default=70)
+        age_score = np.select([mileage < 30000, mileage < 60000, mileage < 100000],
+                              [100, 85, 70], default=55)
+        maintenance = (fuel_score * 0.3 + maintenance_base * 0.3 +
+                       vmap(lambda v: BRAND_MAINTENANCE.get(v['make'], 70)) * 0.2 + age_score * 0.2)
+
+        total = (price * preferences.weight_price +
+                 reliability * preferences.weight_reliability +
+                 comfort * preferences.weight_comfort +
+                 features * preferences.weight_features +
+                 resale * preferences.weight_resale +
+                 maintenance * preferences.weight_maintenance)
+
+        # Fair value: the model's fitted regression where there is one,
+        # otherwise the same depreciation ladder as _calculate_fair_value
+        fitted_value = self.valuation.predict_fair_values([
+            {'make': vehicle_rows[idx[i]]['make'], 'model': vehicle_rows[idx[i]]['model'],
+             'year': vehicle_rows[idx[i]]['year'], 'mileage': l['mileage'], 'region': l.get('region')}
+            if valid[i] else {}
+            for i, l in enumerate(listings)
+        ])
+        msrp = vcol('msrp', default=50000)
+        age = datetime.now().year - years
+        base_value = msrp * np.select(
+            [age == 0, age == 1, age == 2, age == 3, age == 4],
+            [0.90, 0.75, 0.65, 0.55, 0.50],
+            default=np.maximum(0.30, 0.50 - (age - 4) * 0.04)
+        )
+        mileage_diff = mileage - age * 12000
+        base_value = np.where(
+            mileage_diff > 0,
+            base_value - np.minimum(mileage_diff * 0.10, base_value * 0.20),
+            base_value + np.minimum(np.abs(mileage_diff) * 0.08, base_value * 0.10)
+        )
+        base_value = np.where(np.isnan(fitted_value), base_value, fitted_value)
+        base_value *= np.array([CONDITION_MULTIPLIERS.get(c, 1.00) for c in conditions])
+        fair_value = base_value + has_leather * 1500 + has_tow * 1000 + has_nav * 800
+
+        valid &= fair_value != 0
+        safe_fair = np.where(valid, fair_value, 1)
+        price_diff = asking - fair_value
+        price_diff_pct = price_diff / safe_fair * 100
+
+        deal_quality = np.select(
+            [(price_diff_pct <= -15) & (total >= 75), (price_diff_pct <= -10) & (total >= 70),
+             (price_diff_pct <= -5) & (total >= 65), (price_diff_pct <= 5) & (total >= 60),
+             price_diff_pct <= 10],
+            ["Excellent Deal", "Very Good Deal", "Good Deal", "Fair Deal", "Slightly Overpriced"],
+            default="Overpriced"
+        )
+        has_major = vmap(lambda v: any(
+            p['severity'] in ['critical', 'major'] for p in vehicle_problems[vehicle_index[v['id']]]
+        )).astype(bool)
+        recommendation = np.select(
+            [(total >= 80) & (price_diff_pct <= -10), (total >= 70) & (price_diff_pct <= -5),
+             (total >= 65) & (price_diff_pct <= 5), total >= 60, has_major],
+            ["STRONG BUY - Excellent vehicle at great price",
+             "BUY - Good vehicle at fair price",
+             "CONSIDER - Decent option, negotiate lower",
+             "HOLD - Explore other options first",
+             "AVOID - Known major problems with this model"],
+            default="AVOID - Better options available"
+        )
+
+        breakdown = {'price': price, 'reliability': reliability, 'comfort': comfort,
+                     'features': features, 'resale': resale, 'maintenance': maintenance}
+
+        results = []
+        for i, listing in enumerate(listings):
+            if not valid[i]:
+                results.append(None)
+                continue
+            vehicle = vehicle_rows[idx[i]]
+            results.append({
+                'total_score': round(float(total[i]), 1),
+                'scores_breakdown': {k: round(float(v[i]), 1) for k, v in breakdown.items()},
+                'fair_market_value': round(float(fair_value[i]), 0),
+                'asking_price': listing['asking_price'],
+                'price_difference': round(float(price_diff[i]), 0),
+                'price_difference_pct': round(float(price_diff_pct[i]), 1),
+                'deal_quality': str(deal_quality[i]),
+                'recommendation': str(recommendation[i]),
+                'vehicle_details': {
+                    'make': vehicle['make'],
+                    'model': vehicle['model'],
+                    'year': vehicle['year'],
+                    'trim': vehicle['trim']
+                }
+            })
+
+        return results
+
+    def score_upper_bounds(self, listings: List[Dict], preferences: UserPreferences) -> np.ndarray:
+        """
+        Cheap upper bound on each listing's total_score, from listing columns only
+        Used to rank candidates best-first and stop scoring early
+        """
+        asking = np.array([l['asking_price'] for l in listings], dtype=float)
+        mileage = np.array([l['mileage'] for l in listings], dtype=float)
+
+        weights = [preferences.weight_price, preferences.weight_reliability, preferences.weight_comfort,
+                   preferences.weight_features, preferences.weight_resale, preferences.weight_maintenance]
+        if min(weights) < 0:
+            return np.full(len(listings), np.inf)  # bounds only hold for non-negative weights
+
+        # Price: budget part is exact, market part is at most 100
+        budget_score = np.where(
+            asking > preferences.budget_max, 0.0,
+            100 * (1 - (asking / preferences.budget_max) * 0.7)
+        )
+        price = (budget_score + 100) / 2
+
+        # Reliability: best brand baseline, problems only subtract
+        reliability = max(max(BRAND_RELIABILITY.values()), 75)
+
+        # Resale: best brand/model bonus, mileage and condition are exact
+        resale_mileage = np.select(
+            [mileage < 20000, mileage < 50000, mileage < 75000, mileage < 100000],
+            [100, 85, 70, 55], default=40
+        )
+        condition_score = np.array([CONDITION_SCORES.get(l.get('condition', 'good'), 70) for l in listings],
+                                   dtype=float)
+        resale = (max(max(BRAND_RESALE.values()), 70) + 15) * 0.5 + resale_mileage * 0.3 + condition_score * 0.2
+
+        # Maintenance: best fuel/base/brand scores, mileage part is exact
+        age_score = np.select([mileage < 30000, mileage < 60000, mileage < 100000],
+                              [100, 85, 70], default=55)
+        maintenance = 100 * 0.3 + 90 * 0.3 + max(max(BRAND_MAINTENANCE.values()), 70) * 0.2 + age_score * 0.2
+
+        return (price * preferences.weight_price +
+                reliability * preferences.weight_reliability +
+                100 * preferences.weight_comfort +
+                100 * preferences.weight_features +
+                resale * preferences.weight_resale +
+                maintenance * preferences.weight_maintenance)
+
     def _score_price(self, listing: Dict, vehicle: Dict, preferences: UserPreferences) -> float:
         """Score based on price relative to budget and market"""
         asking_price = listing['asking_price']
@@ -142,38 +472,13 @@ class VehicleScorer:
         """Score based on known problems and brand reputation"""
 
         # Brand reliability baseline
-        brand_scores = {
-            'Toyota': 95,
-            'Lexus': 98,
-            'Ford': 70,
-            'Tesla': 65,
-            'Chevrolet': 68,
-            'GMC': 68,
-            'RAM': 65,
-            'Nissan': 72,
-            'Honda': 90,
-            'Acura': 88
-        }
+        base_score = BRAND_RELIABILITY.get(vehicle['make'], 75)
 
-        base_score = brand_scores.get(vehicle['make'], 75)
-
-        # Deduct for known problems
+        # Deduct for known problems, with extra penalty for common/widespread ones
         problem_penalty = 0
         for problem in problems:
-            if problem['severity'] == 'critical':
-                problem_penalty += 20
-            elif problem['severity'] == 'major':
-                problem_penalty += 10
-            elif problem['severity'] == 'moderate':
-                problem_penalty += 5
-            elif problem['severity'] == 'minor':
-                problem_penalty += 2
-
-            # Extra penalty for common/widespread problems
-            if problem['frequency'] == 'widespread':
-                problem_penalty += 5
-            elif problem['frequency'] == 'common':
-                problem_penalty += 3
+            problem_penalty += SEVERITY_PENALTY.get(problem['severity'], 0)
+            problem_penalty += FREQUENCY_PENALTY.get(problem['frequency'], 0)
 
         final_score = base_score - problem_penalty
         return max(0, min(100, final_score))
@@ -241,21 +546,10 @@ class VehicleScorer:
     def _score_resale(self, vehicle: Dict, listing: Dict) -> float:
         """Score based on depreciation and resale value retention"""
 
-        # Brands with strong resale
-        strong_resale_brands = {
-            'Toyota': 90,
-            'Lexus': 85,
-            'Honda': 85,
-            'Ford': 75,  # F-150 specifically holds value well
-            'Tesla': 60,  # Currently depreciating rapidly
-            'Chevrolet': 65,
-            'GMC': 70,
-        }
-
-        brand_score = strong_resale_brands.get(vehicle['make'], 70)
+        brand_score = BRAND_RESALE.get(vehicle['make'], 70)
 
         # Model-specific adjustments
-        if vehicle['model'] in ['Tacoma', '4Runner', 'Land Cruiser', 'GX', 'LX']:
+        if vehicle['model'] in RESALE_CHAMPION_MODELS:
             brand_score += 10  # These are value retention champions
 
         if vehicle['model'] == 'F-150':
@@ -275,13 +569,7 @@ class VehicleScorer:
             mileage_score = 40
 
         # Condition factor
-        condition_scores = {
-            'excellent': 100,
-            'good': 85,
-            'fair': 65,
-            'poor': 40
-        }
-        condition_score = condition_scores.get(listing.get('condition', 'good'), 70)
+        condition_score = CONDITION_SCORES.get(listing.get('condition', 'good'), 70)
 
         # Average factors
         return (brand_score * 0.5 + mileage_score * 0.3 + condition_score * 0.2)
@@ -302,18 +590,7 @@ class VehicleScorer:
             fuel_score = min(100, mpg * 4)  # Up to 100 for 25+ mpg
             maintenance_base = 70
 
-        # Brand maintenance cost (reliability correlates with lower maintenance)
-        brand_maintenance = {
-            'Toyota': 90,
-            'Lexus': 75,  # More expensive than Toyota
-            'Honda': 88,
-            'Ford': 70,
-            'Tesla': 80,  # Low maintenance but expensive repairs
-            'Chevrolet': 68,
-            'GMC': 68
-        }
-
-        brand_score = brand_maintenance.get(vehicle['make'], 70)
+        brand_score = BRAND_MAINTENANCE.get(vehicle['make'], 70)
 
         # Age/mileage factor - older/higher mileage = more maintenance
         mileage = listing['mileage']
@@ -330,9 +607,33 @@ class VehicleScorer:
 
     def _calculate_fair_value(self, vehicle: Dict, listing: Dict) -> float:
         """Estimate fair market value"""
+        condition = listing.get('condition', 'good')
+
+        # Regression fitted on this model's listings, else the MSRP ladder
+        base_value = self.valuation.predict_fair_value({
+            'make': vehicle['make'], 'model': vehicle['model'], 'year': vehicle['year'],
+            'mileage': listing['mileage'], 'region': listing.get('region')
+        })
+        if base_value is None:
+            base_value = self._depreciation_value(vehicle, listing)
+
+        # Condition adjustment
+        base_value *= CONDITION_MULTIPLIERS.get(condition, 1.00)
+
+        # Feature adjustments
+        if listing.get('has_leather'):
+            base_value += 1500
+        if listing.get('has_tow_package'):
+            base_value += 1000
+        if listing.get('has_nav'):
+            base_value += 800
+
+        return base_value
+
+    def _depreciation_value(self, vehicle: Dict, listing: Dict) -> float:
+        """MSRP depreciation ladder with a mileage adjustment, before condition/options"""
         msrp = vehicle.get('msrp', 50000)
         mileage = listing['mileage']
-        condition = listing.get('condition', 'good')
 
         # Basic depreciation curve
         age = datetime.now().year - vehicle['year']
@@ -369,23 +670,6 @@ class VehicleScorer:
             mileage_bonus = min(abs(mileage_diff) * 0.08, base_value * 0.10)  # Max 10% bonus
             base_value += mileage_bonus
 
-        # Condition adjustment
-        condition_multipliers = {
-            'excellent': 1.10,
-            'good': 1.00,
-            'fair': 0.85,
-            'poor': 0.65
-        }
-        base_value *= condition_multipliers.get(condition, 1.00)
-
-        # Feature adjustments
-        if listing.get('has_leather'):
-            base_value += 1500
-        if listing.get('has_tow_package'):
-            base_value += 1000
-        if listing.get('has_nav'):
-            base_value += 800
-
         return base_value
 
     def _classify_deal(self, price_diff_pct: float, total_score: float) -> str:
@@ -423,6 +707,7 @@ def main():
     """Demo the scoring engine"""
     db = DatabaseManager()
     scorer = VehicleScorer(db)
+    scorer.valuation.refit()  # fit models whose listings changed since the last run
     price_repo = MarketPriceRepository(db)
 
     # Example user preferences
@@ -460,12 +745,11 @@ def main():
     print("=" * 80)
 
     scored_listings = []
-    for listing in listings:
-        try:
-            score_result = scorer.score_listing(listing, prefs)
+    for listing, score_result in zip(listings, scorer.score_listings_batch(listings, prefs)):
+        if score_result is None:
+            print(f"Error scoring listing {listing.get('id')}: no usable vehicle data")
+        else:
             scored_listings.append((listing, score_result))
-        except Exception as e:
-            print(f"Error scoring listing {listing.get('id')}: {e}")
 
     # Sort by total score
     scored_listings.sort(key=lambda x: x[1]['total_score'], reverse=True)
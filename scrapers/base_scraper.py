@@ -7,20 +7,45 @@ import requests
 from bs4 import BeautifulSoup
 import time
 import random
-from typing import Dict, List, Optional
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 from datetime import datetime
-import json
 from urllib.parse import urljoin, urlparse
 import re
 
+from fetch_engine import HostRateLimiter, run_concurrently
+from http_cache import HTTPCache, DEFAULT_CACHE_DIR
+from result_sink import JSONLSink
+from fixtures import RecordingTransport, ReplayTransport, DEFAULT_CORPUS_PATH
+from html_backend import DEFAULT_BACKEND
+
 
 class BaseScraper:
     """Base class for all scrapers"""
 
-    def __init__(self, delay_min=2, delay_max=5):
+    # Part of the cache key for fetch_parsed results; bump it whenever a
+    # parser's output changes so pages cached by older code are parsed again
+    PARSER_VERSION = 1
+
+    def __init__(self, delay_min=2, delay_max=5, max_workers=8,
+                 cache_dir: Optional[str] = DEFAULT_CACHE_DIR):
         self.delay_min = delay_min
         self.delay_max = delay_max
-        self.session = requests.Session()
+        self.max_workers = max_workers
+        self._local = threading.local()
+
+        # Pages are revalidated with ETag/Last-Modified; None disables caching
+        self.cache = HTTPCache(cache_dir) if cache_dir else None
+
+        # Set by record()/replay(); None means plain live requests
+        self.transport = None
+
+        # BeautifulSoup tree builder; 'lxml' also enables the selector-spec fast paths
+        self.parser_backend = DEFAULT_BACKEND
+
+        # Each host gets one request per average delay; different hosts
+        # (e.g. Craigslist subdomains) are fetched in parallel
+        self.rate_limiter = HostRateLimiter(rate_per_host=2 / (delay_min + delay_max))
 
         # Rotate user agents to avoid detection
         self.user_agents = [
@@ -30,6 +55,14 @@ class BaseScraper:
             'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
         ]
 
+    @property
+    def session(self) -> requests.Session:
+        """HTTP session for the calling thread (sessions are not shared across threads)"""
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        return session
+
     def get_headers(self) -> Dict:
         """Get randomized headers"""
         return {
@@ -46,14 +79,77 @@ class BaseScraper:
         """Random delay between requests"""
         time.sleep(random.uniform(self.delay_min, self.delay_max))
 
-    def fetch_page(self, url: str, max_retries: int = 3) -> Optional[BeautifulSoup]:
-        """Fetch and parse a page with retries"""
+    def record(self, corpus_path: str = DEFAULT_CORPUS_PATH):
+        """Fetch live and append every raw response to a compressed fixture corpus"""
+        self.cache = None  # cache hits would never reach the recorder
+        self.transport = RecordingTransport(self._live_get, corpus_path)
+
+    def replay(self, corpus_path: str = DEFAULT_CORPUS_PATH):
+        """Serve every fetch from a recorded corpus, with no network access or delays"""
+        self.cache = None
+        self.transport = ReplayTransport(corpus_path)
+
+    def _live_get(self, url: str, headers: Dict) -> requests.Response:
+        self.rate_limiter.acquire(url)
+        return self.session.get(url, headers=headers, timeout=30)
+
+    def http_get(self, url: str, headers: Dict):
+        """Issue one GET through the active transport"""
+        if self.transport is not None:
+            return self.transport.get(url, headers)
+        return self._live_get(url, headers)
+
+    def parse_html(self, body: bytes) -> BeautifulSoup:
+        """Build the parse tree for a fetched page"""
+        return BeautifulSoup(body, self.parser_backend)
+
+    def classify_url(self, url: str) -> str:
+        """Cache TTL class for a URL ('search', 'detail' or 'page'); override per site"""
+        return 'page'
+
+    def fetch_body(self, url: str, max_retries: int = 3,
+                   url_class: str = None) -> Optional[Tuple[bytes, bool]]:
+        """
+        Fetch raw page bytes through the cache with retries
+        Returns (body, changed); changed is False when the cached copy was reused
+        """
+        url_class = url_class or self.classify_url(url)
+        if self.transport is not None and not self.transport.live:
+            max_retries = 1  # a replayed miss will not change on retry
+
+        cached = self.cache.get(url) if self.cache else None
+        if cached and self.cache.is_fresh(cached):
+            return cached.body, False
+
         for attempt in range(max_retries):
             try:
-                response = self.session.get(url, headers=self.get_headers(), timeout=30)
+                headers = self.get_headers()
+                if cached:
+                    headers.update(cached.conditional_headers())
+
+                response = self.http_get(url, headers)
+
+                if response.status_code == 304:
+                    if cached:
+                        etag, last_modified = response.headers.get('ETag'), response.headers.get('Last-Modified')
+                        if not self.cache.revalidated(url, url_class, etag, last_modified):
+                            # Evicted while the request was in flight; the body in hand is still current
+                            self.cache.store(url, url_class, cached.body, etag or cached.etag,
+                                             last_modified or cached.last_modified)
+                        return cached.body, False
+
+                    # Nothing to revalidate: a 304 has no body, so treat it as a miss and ask again
+                    response = self.http_get(url, self.get_headers())
+                    if response.status_code == 304:
+                        raise requests.HTTPError(f"304 with no cached copy for url: {url}", response=response)
+
                 response.raise_for_status()
 
-                return BeautifulSoup(response.content, 'html.parser')
+                if self.cache:
+                    self.cache.store(url, url_class, response.content,
+                                     response.headers.get('ETag'),
+                                     response.headers.get('Last-Modified'))
+                return response.content, True
 
             except requests.RequestException as e:
                 print(f"Attempt {attempt + 1} failed for {url}: {e}")
@@ -63,6 +159,48 @@ class BaseScraper:
                     print(f"Failed to fetch {url} after {max_retries} attempts")
                     return None
 
+    def fetch_page(self, url: str, max_retries: int = 3, url_class: str = None) -> Optional[BeautifulSoup]:
+        """Fetch and parse a page with retries"""
+        fetched = self.fetch_body(url, max_retries, url_class)
+        if fetched is None:
+            return None
+
+        return self.parse_html(fetched[0])
+
+    def fetch_parsed(self, url: str, parse: Callable[[bytes], Any],
+                     url_class: str = None) -> Optional[Any]:
+        """
+        Fetch a page and return parse(body), reusing the cached parse result
+        while the page is unchanged. parse gets the raw bytes, so it can use a
+        selector spec or build a tree with parse_html; it must return
+        JSON-serializable data. Cached results are keyed by the parser's name
+        and PARSER_VERSION.
+        """
+        fetched = self.fetch_body(url, url_class=url_class)
+        if fetched is None:
+            return None
+
+        body, changed = fetched
+        parser = f"{parse.__qualname__}@v{self.PARSER_VERSION}"
+        if self.cache and not changed:
+            value = self.cache.get_parsed(url, parser)
+            if value is not None:
+                return value
+
+        value = parse(body)
+        if self.cache and value is not None:
+            self.cache.store_parsed(url, parser, value)
+        return value
+
+    def fetch_pages(self, urls: List[str]) -> Dict[str, Optional[BeautifulSoup]]:
+        """Fetch many pages concurrently, still rate limited per host"""
+        urls = list(dict.fromkeys(urls))
+        return dict(zip(urls, self.map_concurrent(self.fetch_page, urls)))
+
+    def map_concurrent(self, func: Callable, jobs: Iterable) -> List:
+        """Run func over jobs on up to max_workers threads, results in job order"""
+        return run_concurrently(func, jobs, max_workers=self.max_workers)
+
     def extract_price(self, text: str) -> Optional[float]:
         """Extract price from text"""
         if not text:
@@ -185,15 +323,19 @@ class BaseScraper:
 
         return 'Other CA'
 
-    def save_results(self, results: List[Dict], filename: str):
-        """Save scraping results to JSON"""
+    def open_results_sink(self, filename: str, compress: bool = False) -> JSONLSink:
+        """Timestamped JSONL file in scrapers/data to append results to as they arrive"""
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-        filepath = f"scrapers/data/{filename}_{timestamp}.json"
+        filepath = f"scrapers/data/{filename}_{timestamp}.jsonl" + ('.gz' if compress else '')
+        return JSONLSink(filepath)
 
-        with open(filepath, 'w') as f:
-            json.dump(results, f, indent=2, default=str)
+    def save_results(self, results: Iterable[Dict], filename: str, compress: bool = False) -> str:
+        """Save scraping results to JSONL (results may be any iterable)"""
+        with self.open_results_sink(filename, compress) as sink:
+            sink.write_many(results)
 
-        print(f"Saved {len(results)} results to {filepath}")
+        print(f"Saved {sink.count} results to {sink.path}")
+        return sink.path
 
     def scrape(self) -> List[Dict]:
         """Override in subclass"""
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Parser Benchmarks
+Offline parse throughput (pages/sec, listings/sec) for each scraper, measured
+on a response corpus: the committed synthetic one by default, or a live recording
+"""
+
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from craigslist_scraper import CraigslistScraper
+from google_scraper import GoogleScraper
+from fixtures import iter_corpus, DEFAULT_CORPUS_PATH
+from synthetic_corpus import SYNTHETIC_CORPUS_PATH, write_synthetic_corpus
+from html_backend import DEFAULT_BACKEND
+from typing import Callable, Dict, List, Optional
+from urllib.parse import urlparse
+import json
+import time
+
+
+def build_benchmarks(craigslist: CraigslistScraper, google: GoogleScraper) -> Dict[str, Callable]:
+    """
+    Benchmark name -> parse(response) returning the number of listings found
+    Each parse covers the whole path from raw bytes to listing dicts
+    """
+
+    def craigslist_search(response) -> int:
+        region = urlparse(response.url).netloc.split('.')[0]
+        return len(craigslist.parse_search_body(response.content, region)['results'])
+
+    def craigslist_detail(response) -> int:
+        craigslist.parse_detail_page(craigslist.parse_html(response.content), response.url)
+        return 1
+
+    def google_search(response) -> int:
+        return len(google.parse_search_body(response.content, '', '', 0))
+
+    return {
+        'craigslist_search': craigslist_search,
+        'craigslist_detail': craigslist_detail,
+        'google_search': google_search,
+    }
+
+
+def classify_response(response) -> Optional[str]:
+    """Benchmark a recorded response belongs to (None for pages no parser handles)"""
+    host = urlparse(response.url).netloc
+    if response.status_code != 200:
+        return None
+    if host.endswith('craigslist.org'):
+        return 'craigslist_search' if '/search/' in response.url else 'craigslist_detail'
+    if 'google.' in host:
+        return 'google_search'
+    return None
+
+
+def run_benchmarks(corpus_path: str = SYNTHETIC_CORPUS_PATH, repeat: int = 3,
+                   backend: str = DEFAULT_BACKEND) -> List[Dict]:
+    """Best-of-repeat parse timings per benchmark"""
+
+    # No HTTP cache: parsing is timed from the corpus bytes, never from cache hits
+    craigslist, google = CraigslistScraper(cache_dir=None), GoogleScraper(cache_dir=None)
+    craigslist.parser_backend = google.parser_backend = backend
+    benchmarks = build_benchmarks(craigslist, google)
+
+    pages = {name: [] for name in benchmarks}
+    for response in iter_corpus(corpus_path):
+        name = classify_response(response)
+        if name:
+            pages[name].append(response)
+
+    results = []
+    for name, parse in benchmarks.items():
+        if not pages[name]:
+            continue
+
+        best, listings = float('inf'), 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            listings = sum(parse(response) for response in pages[name])
+            best = min(best, time.perf_counter() - start)
+
+        results.append({
+            'benchmark': name,
+            'pages': len(pages[name]),
+            'listings': listings,
+            'seconds': best,
+            'pages_per_sec': len(pages[name]) / best,
+            'listings_per_sec': listings / best
+        })
+
+    return results
+
+
+def record_corpus(corpus_path: str = DEFAULT_CORPUS_PATH):
+    """Record a small live sample of every page type into the corpus"""
+
+    craigslist = CraigslistScraper(cache_dir=None)
+    craigslist.record(corpus_path)
+    listings = craigslist.search_region('sfbay', 'Toyota', 'Tacoma', min_year=2020, max_results=100)
+    for listing in listings[:10]:
+        craigslist.parse_listing_detail(listing['url'])
+    craigslist.transport.close()
+
+    google = GoogleScraper(cache_dir=None)
+    google.record(corpus_path)
+    google.search('Toyota', 'Tacoma', 2022, 'Bay Area California', num_results=20)
+    google.transport.close()
+
+    print(f"\n✓ Recorded corpus: {corpus_path}")
+
+
+def main():
+    """Run the parser benchmarks, or record a fresh corpus"""
+
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Offline scraper parser benchmarks')
+    parser.add_argument('--corpus',
+                       help='Response corpus (default: the synthetic corpus; with --record, '
+                            f'{DEFAULT_CORPUS_PATH})')
+    parser.add_argument('--record', action='store_true',
+                       help='Record a live sample into the corpus instead of benchmarking')
+    parser.add_argument('--generate', action='store_true',
+                       help='Regenerate the synthetic corpus instead of benchmarking')
+    parser.add_argument('--repeat', type=int, default=3,
+                       help='Timing runs per benchmark; the best is reported (default: 3)')
+    parser.add_argument('--backend', choices=['lxml', 'html.parser'], default=DEFAULT_BACKEND,
+                       help=f'HTML parser backend (default: {DEFAULT_BACKEND})')
+    parser.add_argument('--save', help='Write results to this JSON file')
+    parser.add_argument('--baseline', help='Compare against results saved with --save')
+
+    args = parser.parse_args()
+
+    if args.record:
+        record_corpus(args.corpus or DEFAULT_CORPUS_PATH)
+        return
+
+    if args.generate:
+        count = write_synthetic_corpus(args.corpus or SYNTHETIC_CORPUS_PATH)
+        print(f"✓ Wrote {count} synthetic pages to {args.corpus or SYNTHETIC_CORPUS_PATH}")
+        return
+
+    args.corpus = args.corpus or SYNTHETIC_CORPUS_PATH
+
+    if not os.path.exists(args.corpus):
+        print(f"No corpus at {args.corpus}; record one with --record")
+        return
+
+    results = run_benchmarks(args.corpus, args.repeat, args.backend)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = {r['benchmark']: r for r in json.load(f)}
+
+    print(f"\n{'Benchmark':<20} {'Pages':>6} {'Listings':>9} {'Pages/s':>10} {'Listings/s':>11} {'vs base':>8}")
+    print('-' * 68)
+    for r in results:
+        change = ''
+        if r['benchmark'] in baseline:
+            change = f"{(r['pages_per_sec'] / baseline[r['benchmark']]['pages_per_sec'] - 1) * 100:+.0f}%"
+        print(f"{r['benchmark']:<20} {r['pages']:>6} {r['listings']:>9} "
+              f"{r['pages_per_sec']:>10,.1f} {r['listings_per_sec']:>11,.1f} {change:>8}")
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n✓ Results saved to: {args.save}")
+
+
+if __name__ == "__main__":
+    main()
@@ -8,13 +8,46 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from base_scraper import BaseScraper
+from html_backend import SelectorSpec, has_class, LXML_AVAILABLE
+from vehicle_matcher import match_vehicle
 from typing import List, Dict, Optional
+from urllib.parse import urljoin
 import re
 
 
+# Search result previews, extracted in one streaming pass when lxml is installed
+SEARCH_SPEC = SelectorSpec(
+    'li', 'cl-search-result',
+    text_fields={
+        'title': f"(.//div[{has_class('title')}])[1]//text()",
+        'price': f"(.//div[{has_class('price')}])[1]//text()",
+        'meta': f"(.//div[{has_class('meta')}])[1]//text()",
+    },
+    attr_fields={'href': f"(.//a[{has_class('cl-app-anchor')}])[1]/@href"}
+) if LXML_AVAILABLE else None
+
+
 class CraigslistScraper(BaseScraper):
     """Scrape Craigslist car listings"""
 
+    # Override to point the scraper at a local stand-in server
+    SEARCH_URL = "https://{region}.craigslist.org/search/cta"
+
+    # 2: canonical make/model spellings and 'trim' from the shared title matcher
+    PARSER_VERSION = 2
+
+    def classify_url(self, url: str) -> str:
+        """Search result pages expire quickly; posting pages are cached longer"""
+        return 'search' if '/search/' in url else 'detail'
+
+    def search_regions(self, searches: List[Dict]) -> List[List[Dict]]:
+        """
+        Run many search_region calls concurrently (kwargs dicts, one per search)
+        Pages of one search stay sequential; each host is paced by the rate limiter
+        """
+        return [results or [] for results in
+                self.map_concurrent(lambda search: self.search_region(**search), searches)]
+
     def search_region(self, region: str, make: str, model: str,
                      min_year: int = 2020, max_results: int = 100) -> List[Dict]:
         """
@@ -22,50 +55,86 @@ class CraigslistScraper(BaseScraper):
         region: sfbay, losangeles, sandiego, sacramento, etc.
         """
 
-        base_url = f"https://{region}.craigslist.org/search/cta"
+        results = []
+        offset = 0
+
+        while len(results) < max_results:
+            page = self.search_page(region, make, model, min_year, offset)
+            if not page:
+                break
+
+            if not page['count']:
+                print("No more listings found")
+                break
+
+            for result in page['results']:
+                results.append(result)
+                price = f"${result['price']:,}" if result['price'] else "no price"
+                print(f"  Found: {result['year']} {result['make']} {result['model']} - {price}")
+
+            offset += page['count']
+
+        return results
+
+    def search_page(self, region: str, make: str, model: str,
+                    min_year: int = 2020, offset: int = 0) -> Optional[Dict]:
+        """Fetch one search results page; None if the fetch failed"""
+
+        base_url = self.SEARCH_URL.format(region=region)
 
         # Build search parameters
         search_query = f"{make} {model}"
 
-        results = []
-        offset = 0
+        # Craigslist search URL
+        params = f"?query={search_query}&min_auto_year={min_year}&sort=date"
+        if offset > 0:
+            params += f"&s={offset}"
 
-        while len(results) < max_results:
-            # Craigslist search URL
-            params = f"?query={search_query}&min_auto_year={min_year}&sort=date"
-            if offset > 0:
-                params += f"&s={offset}"
+        url = base_url + params
 
-            url = base_url + params
+        print(f"Scraping: {url}")
 
-            print(f"Scraping: {url}")
+        return self.fetch_parsed(url, lambda body: self.parse_search_body(body, region), 'search')
 
-            soup = self.fetch_page(url)
-            if not soup:
-                break
+    def parse_search_body(self, body: bytes, region: str) -> Dict:
+        """Parse a raw search results page, in one pass via SEARCH_SPEC when lxml is available"""
 
-            # Find listing results
-            listings = soup.find_all('li', class_='cl-search-result')
+        if SEARCH_SPEC is None or self.parser_backend != 'lxml':
+            return self.parse_search_page(self.parse_html(body), region)
 
-            if not listings:
-                print("No more listings found")
-                break
+        items = SEARCH_SPEC.extract(body)
 
-            for listing in listings:
-                try:
-                    result = self.parse_listing_preview(listing, region)
-                    if result:
-                        results.append(result)
-                        print(f"  Found: {result['year']} {result['make']} {result['model']} - ${result['price']:,}")
+        results = []
+        for item in items:
+            try:
+                if item['href'] is not None:
+                    results.append(self.build_listing_preview(
+                        item['href'], item['title'], item['price'], item['meta'], region))
 
-                except Exception as e:
-                    print(f"Error parsing listing: {e}")
-                    continue
+            except Exception as e:
+                print(f"Error parsing listing: {e}")
+                continue
 
-            offset += len(listings)
-            self.random_delay()
+        return {'count': len(items), 'results': results}
 
-        return results
+    def parse_search_page(self, soup, region: str) -> Dict:
+        """Parse one search results page: raw listing count and parsed previews"""
+
+        # Find listing results
+        listings = soup.find_all('li', class_='cl-search-result')
+
+        results = []
+        for listing in listings:
+            try:
+                result = self.parse_listing_preview(listing, region)
+                if result:
+                    results.append(result)
+
+            except Exception as e:
+                print(f"Error parsing listing: {e}")
+                continue
+
+        return {'count': len(listings), 'results': results}
 
     def parse_listing_preview(self, listing, region: str) -> Optional[Dict]:
         """Parse a listing from search results"""
@@ -75,10 +144,6 @@ class CraigslistScraper(BaseScraper):
         if not link_elem:
             return None
 
-        url = link_elem.get('href', '')
-        if not url.startswith('http'):
-            url = f"https://{region}.craigslist.org{url}"
-
         # Get title
         title_elem = listing.find('div', class_='title')
         title = title_elem.get_text(strip=True) if title_elem else ''
@@ -86,19 +151,29 @@ class CraigslistScraper(BaseScraper):
         # Get price
         price_elem = listing.find('div', class_='price')
         price_text = price_elem.get_text(strip=True) if price_elem else ''
-        price = self.extract_price(price_text)
 
         # Get meta info (mileage, location)
         meta_elem = listing.find('div', class_='meta')
         meta_text = meta_elem.get_text(strip=True) if meta_elem else ''
 
+        return self.build_listing_preview(link_elem.get('href', ''), title, price_text, meta_text, region)
+
+    def build_listing_preview(self, url: str, title: str, price_text: str, meta_text: str,
+                              region: str) -> Dict:
+        """Listing preview from the raw text of a search result (shared by both parse paths)"""
+
+        if not url.startswith('http'):
+            url = urljoin(self.SEARCH_URL.format(region=region), url)
+
+        price = self.extract_price(price_text)
+
         mileage = self.extract_mileage(meta_text)
 
         # Extract year from title
         year = self.extract_year(title)
 
         # Parse make/model from title
-        make, model = self.parse_make_model_from_title(title)
+        make, model, trim = self.parse_make_model_from_title(title)
 
         # Get location from meta
         location_parts = meta_text.split('·')
@@ -112,6 +187,7 @@ class CraigslistScraper(BaseScraper):
             'year': year,
             'make': make,
             'model': model,
+            'trim': trim,
             'mileage': mileage,
             'city': location['city'],
             'state': location['state'],
@@ -123,9 +199,10 @@ class CraigslistScraper(BaseScraper):
     def parse_listing_detail(self, url: str) -> Optional[Dict]:
         """Parse detailed listing page"""
 
-        soup = self.fetch_page(url)
-        if not soup:
-            return None
+        return self.fetch_parsed(url, lambda body: self.parse_detail_page(self.parse_html(body), url), 'detail')
+
+    def parse_detail_page(self, soup, url: str) -> Dict:
+        """Parse the fields of a listing detail page"""
 
         result = {
             'url': url,
@@ -181,33 +258,19 @@ class CraigslistScraper(BaseScraper):
         # Parse make/model from title
         if 'title' in result:
             result['year'] = self.extract_year(result['title'])
-            make, model = self.parse_make_model_from_title(result['title'])
+            make, model, trim = self.parse_make_model_from_title(result['title'])
             result['make'] = make
             result['model'] = model
+            result['trim'] = trim
 
         return result
 
     def parse_make_model_from_title(self, title: str) -> tuple:
-        """Extract make and model from title"""
-        title = title.lower()
-
-        # Known makes
-        makes = {
-            'toyota': ['tacoma', 'tundra', 'sequoia', '4runner', 'highlander'],
-            'lexus': ['gx', 'lx', 'rx', 'nx'],
-            'ford': ['f-150', 'f150', 'f-250', 'f250'],
-            'tesla': ['model y', 'model 3', 'model s', 'model x'],
-            'chevrolet': ['silverado', 'tahoe', 'suburban'],
-            'gmc': ['sierra', 'yukon']
-        }
-
-        for make, models in makes.items():
-            if make in title:
-                for model in models:
-                    if model in title:
-                        return make.title(), model.title()
-
-        return '', ''
+        """Extract canonical make, model and trim from title ('' when not found)"""
+        match = match_vehicle(title)
+        if match is None:
+            return '', '', ''
+        return match.make, match.model, match.trim or ''
 
     def region_from_craigslist(self, region_code: str) -> str:
         """Map Craigslist region code to our regions"""
@@ -249,32 +312,28 @@ def main():
         {'make': 'Toyota', 'model': 'Tundra'},
     ]
 
-    all_results = []
-
-    for region in regions:
-        for target in targets:
-            print(f"\n{'='*60}")
-            print(f"Searching {region} for {target['make']} {target['model']}")
-            print('='*60)
+    searches = [
+        {'region': region, 'make': target['make'], 'model': target['model'],
+         'min_year': 2020, 'max_results': 50}
+        for region in regions for target in targets
+    ]
 
-            results = scraper.search_region(
-                region=region,
-                make=target['make'],
-                model=target['model'],
-                min_year=2020,
-                max_results=50
-            )
+    print(f"Searching {len(searches)} region/vehicle combinations concurrently")
 
-            all_results.extend(results)
+    # Each search's listings are appended to the results file as soon as it finishes
+    with scraper.open_results_sink('craigslist_results') as sink:
+        def search_and_save(search: Dict) -> int:
+            results = scraper.search_region(**search)
+            sink.write_many(results)
+            print(f"Found {len(results)} {search['make']} {search['model']} listings in {search['region']}")
+            return len(results)
 
-            print(f"Found {len(results)} listings in {region}")
-            scraper.random_delay()
+        scraper.map_concurrent(search_and_save, searches)
 
-    # Save results
-    scraper.save_results(all_results, 'craigslist_results')
+    print(f"Saved {sink.count} results to {sink.path}")
 
     print(f"\n{'='*60}")
-    print(f"TOTAL: Found {len(all_results)} listings across all regions")
+    print(f"TOTAL: Found {sink.count} listings across all regions")
     print('='*60)
 
 
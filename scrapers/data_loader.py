@@ -8,12 +8,18 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database import DatabaseManager, VehicleRepository, MarketPriceRepository, MarketPrice
-from typing import List, Dict
+from result_sink import iter_jsonl, iter_batches
+from valuation import FairValueEstimator
+from typing import Iterable, List, Dict
 import json
 from datetime import datetime
 from glob import glob
 
 
+# Listings written per transaction when streaming from JSONL
+LOAD_BATCH_SIZE = 500
+
+
 class DataLoader:
     """Load scraped data into database"""
 
@@ -21,9 +27,10 @@ class DataLoader:
         self.db = DatabaseManager()
         self.vehicle_repo = VehicleRepository(self.db)
         self.price_repo = MarketPriceRepository(self.db)
+        self.valuation = FairValueEstimator(self.db)
 
-    def load_listings(self, listings: List[Dict]) -> Dict:
-        """Load listings into database"""
+    def load_listings(self, listings: List[Dict], refit: bool = True) -> Dict:
+        """Load listings into database, then refit the fair value models they touched"""
 
         stats = {
             'total': len(listings),
@@ -33,6 +40,9 @@ class DataLoader:
             'new_vehicles': 0
         }
 
+        vehicle_ids = {}  # (make, model, year) -> vehicle_id
+        batch = []  # (listing, MarketPrice)
+
         for listing in listings:
             try:
                 # Validate required fields
@@ -46,8 +56,11 @@ class DataLoader:
                     stats['skipped'] += 1
                     continue
 
-                # Find or create vehicle
-                vehicle_id = self.get_or_create_vehicle(listing)
+                # Find or create vehicle (once per make/model/year)
+                key = (listing['make'], listing['model'], listing['year'])
+                if key not in vehicle_ids:
+                    vehicle_ids[key] = self.get_or_create_vehicle(listing)
+                vehicle_id = vehicle_ids[key]
                 if not vehicle_id:
                     print(f"Could not create vehicle for {listing.get('year')} {listing.get('make')} {listing.get('model')}")
                     stats['skipped'] += 1
@@ -56,7 +69,7 @@ class DataLoader:
                 # Create market price entry
                 market_listing = MarketPrice(
                     vehicle_id=vehicle_id,
-                    listing_date=listing.get('listing_date', datetime.now().strftime('%Y-%m-%d')),
+                    listing_date=listing.get('listing_date') or datetime.now().strftime('%Y-%m-%d'),
                     mileage=listing.get('mileage', 0),
                     asking_price=listing['price'],
                     condition=listing.get('condition', 'good'),
@@ -69,16 +82,52 @@ class DataLoader:
                     source=listing.get('source', 'scraped'),
                     source_url=listing.get('url', '')
                 )
-
-                listing_id = self.price_repo.add_listing(market_listing)
-                stats['loaded'] += 1
-
-                print(f"✓ Loaded: {listing['year']} {listing['make']} {listing['model']} - ${listing['price']:,} (ID: {listing_id})")
+                batch.append((listing, market_listing))
 
             except Exception as e:
                 print(f"✗ Error loading listing: {e}")
                 stats['errors'] += 1
 
+        # Write every listing in one transaction
+        if batch:
+            try:
+                listing_ids = self.price_repo.add_listings_bulk([m for _, m in batch])
+            except Exception as e:
+                # One bad row rolls back the batch; retry row by row to isolate it
+                print(f"✗ Bulk load failed ({e}), retrying listings one at a time")
+                listing_ids = []
+                for listing, market_listing in batch:
+                    try:
+                        listing_ids.append(self.price_repo.add_listing(market_listing))
+                    except Exception as e:
+                        print(f"✗ Error loading listing: {e}")
+                        stats['errors'] += 1
+                        listing_ids.append(None)
+
+            for (listing, _), listing_id in zip(batch, listing_ids):
+                if listing_id is None:
+                    continue
+                stats['loaded'] += 1
+                print(f"✓ Loaded: {listing['year']} {listing['make']} {listing['model']} - ${listing['price']:,} (ID: {listing_id})")
+
+        if refit and stats['loaded']:
+            self.valuation.refit()
+
+        return stats
+
+    def load_batches(self, listings: Iterable[Dict], batch_size: int = LOAD_BATCH_SIZE) -> Dict:
+        """Load a listing stream in fixed-size batches so memory stays flat"""
+
+        stats = {'total': 0, 'loaded': 0, 'skipped': 0, 'errors': 0, 'new_vehicles': 0}
+
+        for batch in iter_batches(listings, batch_size):
+            for key, value in self.load_listings(batch, refit=False).items():
+                stats[key] += value
+
+        # One refit for the whole stream
+        if stats['loaded']:
+            self.valuation.refit()
+
         return stats
 
     def get_or_create_vehicle(self, listing: Dict) -> int:
@@ -114,8 +163,18 @@ class DataLoader:
 
         return vehicle_id
 
+    def load_from_jsonl(self, filepath: str, batch_size: int = LOAD_BATCH_SIZE) -> Dict:
+        """Stream listings from a JSONL (or .jsonl.gz) file in batches"""
+
+        print(f"\nLoading data from: {filepath}")
+
+        return self.load_batches(iter_jsonl(filepath), batch_size)
+
     def load_from_json(self, filepath: str) -> Dict:
-        """Load listings from JSON file"""
+        """Load listings from JSON file (JSONL files are streamed)"""
+
+        if filepath.endswith(('.jsonl', '.jsonl.gz')):
+            return self.load_from_jsonl(filepath)
 
         print(f"\nLoading data from: {filepath}")
 
@@ -133,9 +192,14 @@ class DataLoader:
         return self.load_listings(listings)
 
     def load_all_scraped_data(self, data_dir: str = "scrapers/data") -> Dict:
-        """Load all JSON files from data directory"""
+        """Load all JSON/JSONL files from data directory"""
 
-        json_files = glob(f"{data_dir}/*.json")
+        # Master scrape runs load their own listings
+        json_files = sorted(
+            path for pattern in ('*.json', '*.jsonl', '*.jsonl.gz')
+            for path in glob(f"{data_dir}/{pattern}")
+            if not os.path.basename(path).startswith('master_scrape_')
+        )
 
         if not json_files:
             print(f"No JSON files found in {data_dir}")
@@ -8,9 +8,13 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from database import DatabaseManager, Vehicle, MarketPrice, VehicleRepository, MarketPriceRepository
+from vehicle_matcher import match_vehicle
+from valuation import FairValueEstimator
 import re
+import sqlite3
+from collections import deque
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Iterable, Iterator, List, Dict, Optional
 import subprocess
 
 # Import geolocation if available
@@ -32,92 +36,139 @@ class FacebookParser:
         self.db = DatabaseManager(db_path)
         self.vehicle_repo = VehicleRepository(self.db)
         self.price_repo = MarketPriceRepository(self.db)
+        self.valuation = FairValueEstimator(self.db)
 
-    def extract_urls_from_rtf(self, rtf_filepath: str) -> List[str]:
-        """Extract Facebook Marketplace URLs from RTF file"""
-        urls = []
+    # RTF hyperlink field; TextEdit writes one per marketplace listing
+    RTF_HYPERLINK = re.compile(r'\{\\field\{\\\*\\fldinst\{HYPERLINK "([^"]+)"\}\}')
 
-        try:
-            with open(rtf_filepath, 'r', encoding='utf-8', errors='ignore') as f:
-                content = f.read()
+    # Longest hyperlink field kept between chunks when streaming an RTF
+    RTF_FIELD_MAX = 8192
 
-            # Find all HYPERLINK patterns
-            pattern = r'\{\\field\{\\\*\\fldinst\{HYPERLINK "([^"]+)"\}\}'
-            matches = re.findall(pattern, content)
+    # Lines per listing block: price, title, location, mileage
+    BLOCK_LINES = 4
 
-            # Filter for marketplace item URLs only
-            for url in matches:
-                if 'facebook.com/marketplace/item/' in url:
-                    # Clean up the URL
-                    clean_url = url.split('?')[0] if '?' in url else url
-                    urls.append(url)  # Keep full URL with tracking params
+    # Listings per insert batch while loading (all batches share one transaction)
+    LOAD_BATCH_SIZE = 500
 
-        except Exception as e:
-            print(f"Error extracting URLs from RTF: {e}")
+    def iter_rtf_urls(self, rtf_filepath: str, chunk_size: int = 1 << 20) -> Iterator[str]:
+        """Stream Facebook Marketplace item URLs out of an RTF file in document order"""
+        buffer = ''
+        with open(rtf_filepath, 'r', encoding='utf-8', errors='ignore') as f:
+            while True:
+                chunk = f.read(chunk_size)
+                buffer += chunk
 
-        return urls
+                consumed = 0
+                for match in self.RTF_HYPERLINK.finditer(buffer):
+                    consumed = match.end()
+                    # Filter for marketplace item URLs only (full URL kept, with tracking params)
+                    if 'facebook.com/marketplace/item/' in match.group(1):
+                        yield match.group(1)
 
-    def parse_facebook_text(self, filepath: str, min_price: int = 3000, max_price: int = 50000) -> List[Dict]:
-        """Parse Facebook Marketplace text file with price filtering"""
+                if not chunk:
+                    return
+
+                # Keep only a tail that could hold a field split across chunks
+                buffer = buffer[max(consumed, len(buffer) - self.RTF_FIELD_MAX):]
+
+    def extract_urls_from_rtf(self, rtf_filepath: str) -> List[str]:
+        """Extract Facebook Marketplace URLs from RTF file"""
+        try:
+            return list(self.iter_rtf_urls(rtf_filepath))
+        except Exception as e:
+            print(f"Error extracting URLs from RTF: {e}")
+            return []
 
-        # Check if this is an RTF file path (original) or text file
-        rtf_filepath = None
+    def find_rtf_for(self, filepath: str) -> Optional[str]:
+        """RTF export carrying the listing URLs for a text dump, if it can be found"""
+        if filepath.endswith('.rtf'):
+            return filepath
         if filepath.endswith('.txt'):
             # Try to find original RTF file
             potential_rtf = filepath.replace('/tmp/', '/Users/macmini/Desktop/').replace('_scrape.txt', ' scrape 1:30.rtfd/TXT.rtf')
             if os.path.exists(potential_rtf):
-                rtf_filepath = potential_rtf
-        elif filepath.endswith('.rtf'):
-            rtf_filepath = filepath
+                return potential_rtf
+        return None
+
+    def iter_lines(self, filepath: str) -> Iterator[str]:
+        """Stripped, non-empty lines of a text dump"""
+        with open(filepath, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield line
 
-        # Extract URLs if RTF file is available
-        urls = []
+    def iter_facebook_listings(self, filepath: str, min_price: int = 3000, max_price: int = 50000,
+                               rtf_filepath: Optional[str] = None) -> Iterator[Dict]:
+        """
+        Stream listings out of a Facebook Marketplace text dump in one pass
+
+        Only a BLOCK_LINES window of the text is held at a time, and URLs are
+        read from the RTF export in step: each listing (including ones
+        filtered out by price) consumes the next URL.
+        """
+        rtf_filepath = rtf_filepath or self.find_rtf_for(filepath)
+        urls = iter(())
         if rtf_filepath:
             print(f"Extracting URLs from: {rtf_filepath}")
-            urls = self.extract_urls_from_rtf(rtf_filepath)
-            print(f"Found {len(urls)} listing URLs")
+            urls = self.iter_rtf_urls(rtf_filepath)
 
-        with open(filepath, 'r') as f:
-            lines = [line.strip() for line in f.readlines() if line.strip()]
-
-        listings = []
         filtered_count = 0
-        url_index = 0
-        i = 0
+        window = deque(maxlen=self.BLOCK_LINES)
+        line_number = 0
 
-        while i < len(lines):
-            line = lines[i]
+        def scan(block: List[str]) -> Optional[Dict]:
+            nonlocal filtered_count
+            line = block[0]
 
             # Look for price pattern
-            if line.startswith('$') and ',' in line:
-                try:
-                    listing = self.parse_listing_block(lines, i, min_price, max_price)
-                    if listing:
-                        # Attach URL if available
-                        if url_index < len(urls):
-                            listing['source_url'] = urls[url_index]
-                            url_index += 1
-
-                        listings.append(listing)
-                        url_status = "with URL" if listing.get('source_url') else "no URL"
-                        print(f"Parsed: {listing.get('year')} {listing.get('make')} {listing.get('model')} - ${listing.get('price'):,} ({url_status})")
-                    else:
-                        # Check if it was filtered by price
-                        price_check = self.extract_price(line)
-                        if price_check and (price_check < min_price or price_check > max_price):
-                            filtered_count += 1
-                            # Still increment URL index for filtered listings
-                            if url_index < len(urls):
-                                url_index += 1
-                except Exception as e:
-                    print(f"Error parsing listing at line {i}: {e}")
-
-            i += 1
+            if not (line.startswith('$') and ',' in line):
+                return None
+
+            try:
+                listing = self.parse_listing_block(block, 0, min_price, max_price)
+                if listing:
+                    # Attach URL if available
+                    url = next(urls, None)
+                    if url:
+                        listing['source_url'] = url
+
+                    url_status = "with URL" if listing.get('source_url') else "no URL"
+                    print(f"Parsed: {listing.get('year')} {listing.get('make')} {listing.get('model')} - ${listing.get('price'):,} ({url_status})")
+                    return listing
+
+                # Check if it was filtered by price
+                price_check = self.extract_price(line)
+                if price_check and (price_check < min_price or price_check > max_price):
+                    filtered_count += 1
+                    # Still consume a URL for filtered listings
+                    next(urls, None)
+            except Exception as e:
+                print(f"Error parsing listing at line {line_number - len(block)}: {e}")
+            return None
+
+        for line in self.iter_lines(filepath):
+            window.append(line)
+            line_number += 1
+            if len(window) == self.BLOCK_LINES:
+                listing = scan(list(window))
+                if listing:
+                    yield listing
+
+        # The last lines have a shorter lookahead
+        while window:
+            if len(window) < self.BLOCK_LINES:
+                listing = scan(list(window))
+                if listing:
+                    yield listing
+            window.popleft()
 
         if filtered_count > 0:
             print(f"\n⊗ Filtered out {filtered_count} listings (price < ${min_price:,} or > ${max_price:,})")
 
-        return listings
+    def parse_facebook_text(self, filepath: str, min_price: int = 3000, max_price: int = 50000) -> List[Dict]:
+        """Parse Facebook Marketplace text file with price filtering"""
+        return list(self.iter_facebook_listings(filepath, min_price, max_price))
 
     def parse_listing_block(self, lines: List[str], start_idx: int, min_price: int = 3000, max_price: int = 50000) -> Optional[Dict]:
         """Parse a single listing block with price filtering"""
@@ -140,7 +191,7 @@ class FacebookParser:
 
         # Extract year, make, model
         year = self.extract_year(title_line)
-        make, model = self.extract_make_model(title_line)
+        make, model, trim = self.extract_make_model(title_line)
 
         if not (year and make and model):
             return None
@@ -158,6 +209,7 @@ class FacebookParser:
             'year': year,
             'make': make,
             'model': model,
+            'trim': trim,
             'city': city,
             'state': state,
             'mileage': mileage if mileage else 0,
@@ -191,89 +243,11 @@ class FacebookParser:
         return None
 
     def extract_make_model(self, text: str) -> tuple:
-        """Extract make and model from text with normalized capitalization"""
-        text = text.lower()
-
-        # Known makes and their common models
-        makes_models = {
-            'lexus': {
-                'models': ['gx', 'lx', 'rx', 'nx', 'es', 'is', 'gs', 'rc', 'ls'],
-                'full_names': {
-                    'gx 460': 'GX',
-                    'gx 550': 'GX',
-                    'lx 570': 'LX',
-                    'lx 600': 'LX',
-                    'rx 350': 'RX',
-                    'rx 400h': 'RX',
-                    'es 350': 'ES',
-                    'is 350': 'IS',
-                    'gs 350': 'GS',
-                    'gs f': 'GS',
-                    'rc 350': 'RC',
-                    'ls 500': 'LS',
-                    'nx 350': 'NX'
-                }
-            },
-            'toyota': {
-                'models': ['tacoma', 'tundra', 'sequoia', '4runner', 'highlander', 'camry', 'corolla', 'hilux'],
-                'full_names': {
-                    'hilux surf': 'Hilux',
-                    'hilux': 'Hilux'
-                }
-            },
-            'ford': {
-                'models': ['f-150', 'f150', 'f-250', 'f250', 'explorer', 'expedition'],
-                'full_names': {
-                    'f-150': 'F-150',
-                    'f150': 'F-150',
-                    'f-250': 'F-250',
-                    'f250': 'F-250'
-                }
-            },
-            'tesla': {
-                'models': ['model y', 'model 3', 'model s', 'model x'],
-                'full_names': {
-                    'model y': 'Model Y',
-                    'model 3': 'Model 3',
-                    'model s': 'Model S',
-                    'model x': 'Model X'
-                }
-            },
-            'chevrolet': {
-                'models': ['silverado', 'tahoe', 'suburban'],
-                'full_names': {}
-            },
-            'gmc': {
-                'models': ['sierra', 'yukon'],
-                'full_names': {}
-            }
-        }
-
-        # Find make
-        for make, info in makes_models.items():
-            if make in text:
-                # Check full names first (e.g., "gx 460" -> "GX")
-                for full_name, short_model in info['full_names'].items():
-                    if full_name in text:
-                        return make.title(), short_model
-
-                # Check simple models
-                for model in info['models']:
-                    if model in text:
-                        # Normalize capitalization by make
-                        if make == 'lexus':
-                            # Lexus: all uppercase (GX, RX, ES, etc.)
-                            return 'Lexus', model.upper()
-                        elif make == 'tesla':
-                            # Tesla: Model X format
-                            if model.startswith('model '):
-                                return 'Tesla', 'Model ' + model[-1].upper()
-                            return 'Tesla', model.title()
-                        else:
-                            # Others: Title Case
-                            return make.title(), model.title()
-
-        return '', ''
+        """Extract canonical make, model and trim from text ('' when not found)"""
+        match = match_vehicle(text)
+        if match is None:
+            return '', '', ''
+        return match.make, match.model, match.trim or ''
 
     def extract_location(self, text: str) -> tuple:
         """Extract city and state"""
@@ -295,23 +269,34 @@ class FacebookParser:
             return num
         return None
 
-    def load_to_database(self, listings: List[Dict], deduplicate: bool = True) -> Dict:
-        """Load parsed listings into database with deduplication"""
+    def load_to_database(self, listings: Iterable[Dict], deduplicate: bool = True) -> Dict:
+        """
+        Load parsed listings into database with deduplication
+        listings may be a stream (e.g. iter_facebook_listings); it is consumed once.
+        Vehicles and existing listings are preloaded, and every new row is
+        written in one transaction, so a failed write leaves the database as it was.
+        """
 
         stats = {
-            'total': len(listings),
+            'total': 0,
             'loaded': 0,
             'skipped': 0,
             'duplicates': 0,
             'errors': 0
         }
+        repeated = 0
 
         # Deduplicate by price + mileage combination
-        if deduplicate:
-            unique_listings = []
+        def unique(listings: Iterable[Dict]) -> Iterator[Dict]:
+            nonlocal repeated
             seen = set()
 
             for listing in listings:
+                stats['total'] += 1
+                if not deduplicate:
+                    yield listing
+                    continue
+
                 # Create unique key from price, mileage, make, model, year
                 key = (
                     listing.get('price'),
@@ -323,112 +308,116 @@ class FacebookParser:
 
                 if key not in seen:
                     seen.add(key)
-                    unique_listings.append(listing)
+                    yield listing
                 else:
+                    repeated += 1
                     stats['duplicates'] += 1
                     print(f"⊗ Duplicate skipped: {listing['year']} {listing['make']} {listing['model']} - ${listing['price']:,} @ {listing.get('mileage', 0)} mi")
 
-            listings = unique_listings
-            print(f"\n✓ Removed {stats['duplicates']} duplicates, {len(listings)} unique listings remain")
-
-        # Also check against existing database entries
-        for listing in listings:
-            try:
-                # Get or create vehicle
-                vehicle_id = self.get_or_create_vehicle(listing)
-                if not vehicle_id:
-                    stats['skipped'] += 1
-                    continue
-
-                # Check if this exact listing already exists in database
-                if self.listing_exists(vehicle_id, listing['price'], listing.get('mileage', 0)):
-                    stats['duplicates'] += 1
-                    print(f"⊗ Already in DB: {listing['year']} {listing['make']} {listing['model']} - ${listing['price']:,}")
-                    continue
-
-                # Determine region
-                region = self.determine_region(listing.get('city', ''), listing.get('state', ''))
-
-                # Calculate distance if geolocation available
-                distance = None
-                if GEOLOCATION_AVAILABLE and listing.get('city') and listing.get('state'):
-                    distance = get_closest_distance(listing['city'], listing['state'])
-
-                # Create market listing
-                market_listing = MarketPrice(
-                    vehicle_id=vehicle_id,
-                    listing_date=listing.get('listing_date', datetime.now().strftime('%Y-%m-%d')),
-                    mileage=listing.get('mileage', 0),
-                    asking_price=listing['price'],
-                    condition='good',  # Default, adjust if needed
-                    city=listing.get('city', ''),
-                    state=listing.get('state', 'CA'),
-                    region=region,
-                    source='facebook_marketplace',
-                    source_url=listing.get('source_url', '')
-                )
+        batch = []  # (listing, MarketPrice) awaiting insert
+        distances = {}  # (city, state) -> distance_miles
 
-                listing_id = self.price_repo.add_listing(market_listing)
-
-                # Update distance if calculated
-                if distance is not None:
-                    with self.db.get_connection() as conn:
-                        conn.execute("UPDATE market_prices SET distance_miles = ? WHERE id = ?",
-                                   (distance, listing_id))
+        def flush():
+            listing_ids = self.price_repo.add_listings_bulk([m for _, m in batch])
+            for (listing, _), listing_id in zip(batch, listing_ids):
                 stats['loaded'] += 1
-
                 print(f"✓ Loaded: {listing['year']} {listing['make']} {listing['model']} - ${listing['price']:,} (ID: {listing_id})")
+            batch.clear()
 
-            except Exception as e:
-                print(f"✗ Error loading: {e}")
-                stats['errors'] += 1
+        try:
+            # One transaction for the whole import; lookups are answered from memory
+            with self.db.get_connection():
+                vehicle_ids = self.vehicle_repo.get_vehicle_id_map()
+                fingerprints = self.price_repo.get_listing_fingerprints()
+
+                for listing in unique(listings):
+                    try:
+                        # Get or create vehicle
+                        vehicle_id = self.get_or_create_vehicle(listing, vehicle_ids)
+                        if not vehicle_id:
+                            stats['skipped'] += 1
+                            continue
+
+                        # Check against existing database entries (and this import's own rows)
+                        fingerprint = (vehicle_id, listing['price'], listing.get('mileage', 0))
+                        if fingerprint in fingerprints:
+                            stats['duplicates'] += 1
+                            print(f"⊗ Already in DB: {listing['year']} {listing['make']} {listing['model']} - ${listing['price']:,}")
+                            continue
+                        fingerprints.add(fingerprint)
+
+                        # Determine region
+                        region = self.determine_region(listing.get('city', ''), listing.get('state', ''))
+
+                        # Calculate distance if geolocation available (once per city)
+                        distance = None
+                        if GEOLOCATION_AVAILABLE and listing.get('city') and listing.get('state'):
+                            place = (listing['city'], listing['state'])
+                            if place not in distances:
+                                distances[place] = get_closest_distance(*place)
+                            distance = distances[place]
+
+                        # Create market listing
+                        batch.append((listing, MarketPrice(
+                            vehicle_id=vehicle_id,
+                            listing_date=listing.get('listing_date', datetime.now().strftime('%Y-%m-%d')),
+                            mileage=listing.get('mileage', 0),
+                            asking_price=listing['price'],
+                            condition='good',  # Default, adjust if needed
+                            city=listing.get('city', ''),
+                            state=listing.get('state', 'CA'),
+                            region=region,
+                            distance_miles=distance,
+                            source='facebook_marketplace',
+                            source_url=listing.get('source_url', '')
+                        )))
+
+                    except Exception as e:
+                        print(f"✗ Error loading: {e}")
+                        stats['errors'] += 1
+
+                    if len(batch) >= self.LOAD_BATCH_SIZE:
+                        flush()
+
+                if batch:
+                    flush()
+
+        except sqlite3.Error as e:
+            # Nothing from this import was committed
+            print(f"✗ Import rolled back: {e}")
+            stats['errors'] += stats['loaded'] + len(batch)
+            stats['loaded'] = 0
+
+        if stats['loaded']:
+            self.valuation.refit()
 
-        return stats
+        if deduplicate:
+            print(f"\n✓ Removed {repeated} duplicates within the import, {stats['total'] - repeated} unique listings")
 
-    def get_or_create_vehicle(self, listing: Dict) -> Optional[int]:
-        """Get existing vehicle or create new one"""
+        return stats
 
-        # Try to find existing
-        vehicles = self.vehicle_repo.find_vehicles(
-            make=listing['make'],
-            model=listing['model'],
-            year_min=listing['year'],
-            year_max=listing['year']
-        )
+    def get_or_create_vehicle(self, listing: Dict, vehicle_ids: Dict) -> Optional[int]:
+        """Get existing vehicle from the preloaded {(make, model, year): id} map or create new one"""
 
-        if vehicles:
-            return vehicles[0]['id']
+        key = (listing['make'], listing['model'], listing['year'])
+        if key in vehicle_ids:
+            return vehicle_ids[key]
 
         # Create new vehicle
         vehicle = Vehicle(
             make=listing['make'],
             model=listing['model'],
             year=listing['year'],
-            trim='',
+            trim=listing.get('trim', ''),
             fuel_type='gasoline'
         )
 
         vehicle_id = self.vehicle_repo.create_vehicle(vehicle)
+        vehicle_ids[key] = vehicle_id
         print(f"  Created vehicle: {vehicle.year} {vehicle.make} {vehicle.model}")
 
         return vehicle_id
 
-    def listing_exists(self, vehicle_id: int, price: float, mileage: int) -> bool:
-        """Check if listing with same price and mileage already exists"""
-
-        query = """
-            SELECT COUNT(*) as count
-            FROM market_prices
-            WHERE vehicle_id = ?
-              AND asking_price = ?
-              AND mileage = ?
-        """
-
-        with self.db.get_connection() as conn:
-            cursor = conn.execute(query, (vehicle_id, price, mileage))
-            result = cursor.fetchone()
-            return result[0] > 0 if result else False
-
     def determine_region(self, city: str, state: str) -> str:
         """Determine region from city/state"""
 
@@ -475,29 +464,25 @@ def main():
     print("FACEBOOK MARKETPLACE IMPORT")
     print("="*80)
 
-    # Parse the file
-    print(f"\nParsing: {filepath}")
-    listings = parser.parse_facebook_text(filepath)
-
-    print(f"\n✓ Parsed {len(listings)} listings")
+    # Parse and load in one streaming pass
+    print(f"\nParsing and loading: {filepath}")
 
-    # Show summary
     makes = {}
-    for listing in listings:
-        make = listing.get('make', 'Unknown')
-        makes[make] = makes.get(make, 0) + 1
+
+    def counted(listings):
+        for listing in listings:
+            make = listing.get('make', 'Unknown')
+            makes[make] = makes.get(make, 0) + 1
+            yield listing
+
+    stats = parser.load_to_database(counted(parser.iter_facebook_listings(filepath)))
+
+    print(f"\n✓ Parsed {stats['total']} listings")
 
     print("\nBy Make:")
     for make, count in sorted(makes.items(), key=lambda x: x[1], reverse=True):
         print(f"  {make}: {count}")
 
-    # Load to database
-    print(f"\n{'='*80}")
-    print("LOADING TO DATABASE")
-    print('='*80)
-
-    stats = parser.load_to_database(listings)
-
     print(f"\n{'='*80}")
     print("IMPORT COMPLETE")
     print('='*80)
@@ -0,0 +1,89 @@
+"""
+Scraper Fixtures
+Record raw HTTP responses to a compressed corpus and replay them offline, so
+parsers can be exercised and benchmarked without network access
+"""
+
+import base64
+import threading
+from typing import Callable, Dict, Iterator
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from result_sink import JSONLSink, iter_jsonl
+
+
+DEFAULT_CORPUS_PATH = "scrapers/corpus/responses.jsonl.gz"
+
+# Response headers worth keeping (caching validators and content type)
+RECORDED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+
+class RecordedResponse:
+    """The parts of a requests.Response the scrapers use"""
+
+    def __init__(self, url: str, status_code: int, headers: Dict[str, str], content: bytes):
+        self.url = url
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers)
+        self.content = content
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} for url: {self.url}", response=self)
+
+
+class RecordingTransport:
+    """Pass requests through to the live site and append every response to a corpus"""
+
+    live = True
+
+    def __init__(self, get: Callable, corpus_path: str = DEFAULT_CORPUS_PATH):
+        self._get = get
+        self.sink = JSONLSink(corpus_path)
+
+    def get(self, url: str, headers: Dict[str, str]):
+        response = self._get(url, headers)
+        self.sink.write({
+            'url': url,
+            'status': response.status_code,
+            'headers': {name: response.headers[name] for name in RECORDED_HEADERS
+                        if name in response.headers},
+            'body': base64.b64encode(response.content).decode('ascii')
+        })
+        return response
+
+    def close(self):
+        self.sink.close()
+
+
+def iter_corpus(corpus_path: str = DEFAULT_CORPUS_PATH) -> Iterator[RecordedResponse]:
+    """Yield every recorded response in recording order"""
+    for record in iter_jsonl(corpus_path):
+        yield RecordedResponse(record['url'], record['status'], record['headers'],
+                               base64.b64decode(record['body']))
+
+
+class ReplayTransport:
+    """Serve recorded responses by URL; unknown URLs get a 404"""
+
+    live = False
+
+    def __init__(self, corpus_path: str = DEFAULT_CORPUS_PATH):
+        # Later recordings of a URL replace earlier ones
+        self.responses = {response.url: response for response in iter_corpus(corpus_path)}
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, url: str, headers: Dict[str, str]) -> RecordedResponse:
+        response = self.responses.get(url)
+        if response is None:
+            with self._lock:
+                self.misses += 1
+            return RecordedResponse(url, 404, {}, b'')
+        return response
+
+    def close(self):
+        pass
+
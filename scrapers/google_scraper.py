@@ -8,16 +8,26 @@ import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from base_scraper import BaseScraper
-from typing import List, Dict
+from http_cache import DEFAULT_CACHE_DIR
+from html_backend import SelectorSpec, LXML_AVAILABLE
+from typing import Iterable, List, Dict, Optional, Tuple
 import urllib.parse
 import re
 
 
+# Every link on a results page, extracted in one streaming pass when lxml is installed
+RESULTS_SPEC = SelectorSpec(
+    'a', None,
+    text_fields={'title': './/text()'},
+    attr_fields={'href': '@href'}
+) if LXML_AVAILABLE else None
+
+
 class GoogleScraper(BaseScraper):
     """Scrape Google search results for car listings"""
 
-    def __init__(self):
-        super().__init__(delay_min=3, delay_max=7)  # Longer delays for Google
+    def __init__(self, cache_dir: Optional[str] = DEFAULT_CACHE_DIR):
+        super().__init__(delay_min=3, delay_max=7, cache_dir=cache_dir)  # Longer delays for Google
         self.base_url = "https://www.google.com/search"
 
     def build_search_query(self, make: str, model: str, year: int, location: str = "") -> str:
@@ -54,52 +64,71 @@ class GoogleScraper(BaseScraper):
 
             url = f"{self.base_url}?{urllib.parse.urlencode(params)}"
 
-            soup = self.fetch_page(url)
-            if not soup:
+            fetched = self.fetch_body(url)
+            if not fetched:
                 break
 
-            # Find search result links
-            links = soup.find_all('a', href=True)
-
             page_results = 0
-            for link in links:
-                href = link['href']
-
-                # Extract actual URL from Google redirect
-                if '/url?q=' in href:
-                    match = re.search(r'/url\?q=([^&]+)', href)
-                    if match:
-                        actual_url = urllib.parse.unquote(match.group(1))
-
-                        # Filter for car listing sites
-                        if self.is_car_listing(actual_url):
-                            # Get title text
-                            title = link.get_text(strip=True)
-
-                            result = {
-                                'url': actual_url,
-                                'title': title,
-                                'make': make,
-                                'model': model,
-                                'year': year,
-                                'search_location': location,
-                                'found_via': 'google_search'
-                            }
-
-                            if result not in results:
-                                results.append(result)
-                                page_results += 1
-                                print(f"  Found: {actual_url[:80]}...")
+            for result in self.parse_search_body(fetched[0], make, model, year, location):
+                if result not in results:
+                    results.append(result)
+                    page_results += 1
+                    print(f"  Found: {result['url'][:80]}...")
 
             if page_results == 0:
                 break  # No more results
 
             start += 10
-            self.random_delay()
 
         print(f"Found {len(results)} unique listings")
         return results
 
+    def parse_search_body(self, body: bytes, make: str, model: str, year: int,
+                          location: str = "") -> List[Dict]:
+        """Parse a raw results page, in one pass via RESULTS_SPEC when lxml is available"""
+
+        if RESULTS_SPEC is None or self.parser_backend != 'lxml':
+            return self.parse_search_page(self.parse_html(body), make, model, year, location)
+
+        links = ((item['href'], item['title']) for item in RESULTS_SPEC.extract(body)
+                 if item['href'] is not None)
+        return self.parse_search_links(links, make, model, year, location)
+
+    def parse_search_page(self, soup, make: str, model: str, year: int,
+                          location: str = "") -> List[Dict]:
+        """Extract car listing links from one Google results page"""
+
+        # Find search result links
+        links = ((link['href'], link.get_text(strip=True)) for link in soup.find_all('a', href=True))
+        return self.parse_search_links(links, make, model, year, location)
+
+    def parse_search_links(self, links: Iterable[Tuple[str, str]], make: str, model: str,
+                           year: int, location: str = "") -> List[Dict]:
+        """Car listing results from (href, link text) pairs"""
+
+        results = []
+
+        for href, title in links:
+            # Extract actual URL from Google redirect
+            if '/url?q=' in href:
+                match = re.search(r'/url\?q=([^&]+)', href)
+                if match:
+                    actual_url = urllib.parse.unquote(match.group(1))
+
+                    # Filter for car listing sites
+                    if self.is_car_listing(actual_url):
+                        results.append({
+                            'url': actual_url,
+                            'title': title,
+                            'make': make,
+                            'model': model,
+                            'year': year,
+                            'search_location': location,
+                            'found_via': 'google_search'
+                        })
+
+        return results
+
     def is_car_listing(self, url: str) -> bool:
         """Check if URL is from a car listing site"""
         car_sites = [
@@ -126,23 +155,23 @@ class GoogleScraper(BaseScraper):
 
         all_results = []
 
-        for vehicle in vehicles:
-            make = vehicle['make']
-            model = vehicle['model']
-            year = vehicle['year']
-
-            for location in locations:
-                print(f"\n{'='*60}")
-                print(f"Searching: {year} {make} {model}" + (f" in {location}" if location else " nationwide"))
-                print('='*60)
+        # Results are saved as each search finishes
+        with self.open_results_sink('google_search_results') as sink:
+            for vehicle in vehicles:
+                make = vehicle['make']
+                model = vehicle['model']
+                year = vehicle['year']
 
-                results = self.search(make, model, year, location, num_results=30)
-                all_results.extend(results)
+                for location in locations:
+                    print(f"\n{'='*60}")
+                    print(f"Searching: {year} {make} {model}" + (f" in {location}" if location else " nationwide"))
+                    print('='*60)
 
-                self.random_delay()
+                    results = self.search(make, model, year, location, num_results=30)
+                    sink.write_many(results)
+                    all_results.extend(results)
 
-        # Save all results
-        self.save_results(all_results, 'google_search_results')
+        print(f"Saved {sink.count} results to {sink.path}")
 
         return all_results
 
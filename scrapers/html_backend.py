@@ -0,0 +1,84 @@
+"""
+HTML Parser Backends
+Pluggable tree builders for BeautifulSoup plus precompiled, single-pass
+extraction specs for listing pages when lxml is installed
+"""
+
+import io
+from typing import Dict, List, Optional
+
+from bs4.dammit import EncodingDetector
+
+# lxml is optional: without it everything falls back to BeautifulSoup's html.parser
+try:
+    from lxml import etree
+    LXML_AVAILABLE = True
+except ImportError:
+    etree = None
+    LXML_AVAILABLE = False
+
+
+DEFAULT_BACKEND = 'lxml' if LXML_AVAILABLE else 'html.parser'
+
+
+def detect_encoding(body: bytes) -> str:
+    """Declared charset, else UTF-8 if the bytes decode as UTF-8, else Windows-1252"""
+    declared = EncodingDetector.find_declared_encoding(body, is_html=True)
+    if declared:
+        return declared
+    try:
+        body.decode('utf-8')
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'windows-1252'
+
+
+def has_class(class_name: str) -> str:
+    """XPath predicate matching one class among several, like BeautifulSoup's class_="""
+    return f"contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')"
+
+
+class SelectorSpec:
+    """
+    Precompiled extraction for the repeated items of a page (search results)
+
+    Items are <item_tag> elements, optionally with item_class. They are
+    streamed out of the document in one pass and dropped once extracted, so
+    the full tree is never held. Each field is an XPath relative to the item:
+    'text' fields join the stripped text nodes, the same as get_text(strip=True),
+    and 'attr' fields take the first value.
+    """
+
+    def __init__(self, item_tag: str, item_class: Optional[str], text_fields: Dict[str, str] = None,
+                 attr_fields: Dict[str, str] = None):
+        self.item_tag = item_tag
+        self.item_class = item_class
+        self.text_fields = {name: etree.XPath(xpath, smart_strings=False)
+                            for name, xpath in (text_fields or {}).items()}
+        self.attr_fields = {name: etree.XPath(xpath, smart_strings=False)
+                            for name, xpath in (attr_fields or {}).items()}
+
+    def extract(self, body: bytes) -> List[Dict[str, str]]:
+        """Field dicts for every matching item, in document order"""
+        items = []
+        for _, element in etree.iterparse(io.BytesIO(body), events=('end',), tag=self.item_tag,
+                                          html=True, recover=True, no_network=True,
+                                          encoding=detect_encoding(body)):
+            if self.item_class and self.item_class not in (element.get('class') or '').split():
+                continue
+
+            item = {name: ''.join(text.strip() for text in xpath(element))
+                    for name, xpath in self.text_fields.items()}
+            for name, xpath in self.attr_fields.items():
+                values = xpath(element)
+                item[name] = values[0] if values else None
+            items.append(item)
+
+            # Drop the extracted item and everything before it
+            element.clear(keep_tail=True)
+            parent = element.getparent()
+            if parent is not None:
+                while element.getprevious() is not None:
+                    del parent[0]
+
+        return items
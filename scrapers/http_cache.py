@@ -0,0 +1,171 @@
+"""
+HTTP Response Cache
+On-disk cache for scraper fetches: conditional revalidation, per-class TTLs,
+size-bounded LRU eviction, and memoized parse results per page version
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+
+DEFAULT_CACHE_DIR = "scrapers/cache"
+
+# Seconds a cached page is served without contacting the site. Search pages
+# change as listings come and go; detail pages rarely change once posted.
+DEFAULT_TTLS = {
+    'search': 6 * 3600,
+    'detail': 7 * 24 * 3600,
+    'page': 24 * 3600,
+}
+
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+@dataclass
+class CachedResponse:
+    """One cached page (body is decompressed)"""
+    url: str
+    url_class: str
+    body: bytes
+    etag: Optional[str]
+    last_modified: Optional[str]
+    validated_at: float
+
+    def conditional_headers(self) -> Dict[str, str]:
+        """If-None-Match / If-Modified-Since headers for revalidation"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HTTPCache:
+    """SQLite-backed page cache, safe to share between fetch threads"""
+
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES,
+                 ttls: Dict[str, float] = None):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self._lock = threading.Lock()
+
+        self.conn = sqlite3.connect(os.path.join(cache_dir, "http_cache.db"), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                url_class TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                validated_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            );
+
+            -- Parser output for the cached body; dropped when the body changes
+            CREATE TABLE IF NOT EXISTS parsed (
+                url TEXT NOT NULL REFERENCES responses(url) ON DELETE CASCADE,
+                parser TEXT NOT NULL,
+                value TEXT NOT NULL,
+                PRIMARY KEY (url, parser)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at);
+        """)
+        self.conn.execute("PRAGMA foreign_keys=ON")
+
+    def get(self, url: str) -> Optional[CachedResponse]:
+        with self._lock:
+            row = self.conn.execute("""
+                SELECT url, url_class, body, etag, last_modified, validated_at
+                FROM responses WHERE url = ?
+            """, (url,)).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (time.time(), url))
+            self.conn.commit()
+
+        return CachedResponse(row[0], row[1], zlib.decompress(row[2]), row[3], row[4], row[5])
+
+    def is_fresh(self, entry: CachedResponse) -> bool:
+        """True if the entry is within its URL class TTL and needs no request"""
+        ttl = self.ttls.get(entry.url_class, self.ttls['page'])
+        return time.time() - entry.validated_at < ttl
+
+    def store(self, url: str, url_class: str, body: bytes,
+              etag: Optional[str] = None, last_modified: Optional[str] = None):
+        """Save a freshly downloaded page, replacing any previous version"""
+        compressed = zlib.compress(body)
+        now = time.time()
+        with self._lock:
+            self.conn.execute("DELETE FROM parsed WHERE url = ?", (url,))
+            self.conn.execute("""
+                INSERT OR REPLACE INTO responses
+                    (url, url_class, body, size, etag, last_modified, fetched_at, validated_at, accessed_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """, (url, url_class, compressed, len(compressed), etag, last_modified, now, now, now))
+            self.conn.commit()
+            self._evict()
+
+    def revalidated(self, url: str, url_class: str,
+                    etag: Optional[str] = None, last_modified: Optional[str] = None) -> bool:
+        """Record a 304: the cached body is current again. False if the page was evicted meanwhile"""
+        with self._lock:
+            updated = self.conn.execute("""
+                UPDATE responses
+                SET url_class = ?, etag = COALESCE(?, etag),
+                    last_modified = COALESCE(?, last_modified), validated_at = ?
+                WHERE url = ?
+            """, (url_class, etag, last_modified, time.time(), url)).rowcount
+            self.conn.commit()
+        return bool(updated)
+
+    def get_parsed(self, url: str, parser: str) -> Optional[Any]:
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM parsed WHERE url = ? AND parser = ?",
+                                    (url, parser)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def store_parsed(self, url: str, parser: str, value: Any):
+        with self._lock:
+            self.conn.execute("""
+                INSERT OR REPLACE INTO parsed (url, parser, value)
+                SELECT url, ?, ? FROM responses WHERE url = ?
+            """, (parser, json.dumps(value, default=str), url))
+            self.conn.commit()
+
+    def _evict(self):
+        """Drop least recently used pages until the cache fits in max_bytes (lock held)"""
+        total = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        excess = total - self.max_bytes
+        victims = []
+        for url, size in self.conn.execute("SELECT url, size FROM responses ORDER BY accessed_at"):
+            victims.append((url,))
+            excess -= size
+            if excess <= 0:
+                break
+
+        self.conn.executemany("DELETE FROM responses WHERE url = ?", victims)
+        self.conn.commit()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            count, size = self.conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {'pages': count, 'bytes': size}
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,311 @@
+"""
+Scrape Job Queue
+Persistent SQLite queue of scrape tasks with leases, retries and checkpointed
+results, so any number of worker threads or processes can drain a run and a
+crashed run resumes where it stopped
+"""
+
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Iterator, List, Optional
+
+
+DEFAULT_QUEUE_PATH = "scrapers/data/scrape_jobs.db"
+
+# A leased task not completed within this many seconds is handed to another worker
+LEASE_SECONDS = 600
+
+# Loading a run into the database may take a while; an unfinished load is
+# claimable again after this many seconds (e.g. the loading process crashed)
+LOAD_LEASE_SECONDS = 3600
+
+MAX_ATTEMPTS = 3
+
+TASK_FIELDS = ('source', 'region', 'make', 'model', 'year', 'page')
+
+
+class ScrapeJobQueue:
+    """
+    Tasks are keyed by (run_id, source, region, make, model, year, page) and move
+    pending -> leased -> done, or back to pending on failure until MAX_ATTEMPTS.
+    Loading a finished run is leased the same way and only marked loaded once
+    the load succeeds.
+    """
+
+    def __init__(self, db_path: str = DEFAULT_QUEUE_PATH, lease_seconds: float = LEASE_SECONDS,
+                 max_attempts: int = MAX_ATTEMPTS, load_lease_seconds: float = LOAD_LEASE_SECONDS):
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.load_lease_seconds = load_lease_seconds
+
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS scrape_runs (
+                    run_id TEXT PRIMARY KEY,
+                    phase TEXT,
+                    created_at REAL NOT NULL,
+                    loaded_at REAL,
+                    load_owner TEXT,
+                    load_expires REAL
+                );
+
+                CREATE TABLE IF NOT EXISTS scrape_tasks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    run_id TEXT NOT NULL REFERENCES scrape_runs(run_id),
+                    source TEXT NOT NULL,
+                    region TEXT NOT NULL DEFAULT '',
+                    make TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    year INTEGER NOT NULL,
+                    page INTEGER NOT NULL DEFAULT 0,
+                    params TEXT NOT NULL DEFAULT '{}',
+                    status TEXT NOT NULL DEFAULT 'pending'
+                        CHECK (status IN ('pending', 'leased', 'done', 'failed')),
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    lease_owner TEXT,
+                    lease_expires REAL,
+                    result TEXT,
+                    error TEXT,
+                    updated_at REAL,
+                    UNIQUE (run_id, source, region, make, model, year, page)
+                );
+
+                CREATE INDEX IF NOT EXISTS idx_scrape_tasks_status ON scrape_tasks(run_id, status);
+            """)
+
+            # Queues created before load leases
+            columns = {row['name'] for row in conn.execute("PRAGMA table_info(scrape_runs)")}
+            for column, column_type in (('load_owner', 'TEXT'), ('load_expires', 'REAL')):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE scrape_runs ADD COLUMN {column} {column_type}")
+        finally:
+            conn.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Autocommit mode: every write below opens its own BEGIN IMMEDIATE so
+        # claims are atomic across processes
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _begin(self, conn: sqlite3.Connection):
+        conn.execute("BEGIN IMMEDIATE")
+
+    def create_run(self, run_id: str, phase: str, tasks: List[Dict]) -> int:
+        """
+        Register a run and its initial tasks; tasks already queued are kept as-is
+        Returns the number of new tasks
+        """
+        conn = self._connect()
+        try:
+            self._begin(conn)
+            conn.execute("INSERT OR IGNORE INTO scrape_runs (run_id, phase, created_at) VALUES (?, ?, ?)",
+                         (run_id, phase, time.time()))
+            added = self._enqueue(conn, run_id, tasks)
+            conn.execute("COMMIT")
+            return added
+        finally:
+            conn.close()
+
+    def _enqueue(self, conn: sqlite3.Connection, run_id: str, tasks: List[Dict]) -> int:
+        before = conn.total_changes
+        conn.executemany(f"""
+            INSERT OR IGNORE INTO scrape_tasks (run_id, {', '.join(TASK_FIELDS)}, params, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (run_id, task['source'], task.get('region', ''), task['make'], task['model'],
+             task['year'], task.get('page', 0), json.dumps(task.get('params', {})), time.time())
+            for task in tasks
+        ])
+        return conn.total_changes - before
+
+    def claim(self, run_id: str, worker: str) -> Optional[Dict]:
+        """Lease the next runnable task (pending, or leased with an expired lease)"""
+        now = time.time()
+        conn = self._connect()
+        try:
+            self._begin(conn)
+
+            # Expired leases that used up their attempts will not be retried
+            conn.execute("""
+                UPDATE scrape_tasks
+                SET status = 'failed', error = COALESCE(error, 'lease expired'), updated_at = ?
+                WHERE run_id = ? AND status = 'leased' AND lease_expires < ? AND attempts >= ?
+            """, (now, run_id, now, self.max_attempts))
+
+            row = conn.execute("""
+                SELECT * FROM scrape_tasks
+                WHERE run_id = ?
+                  AND (status = 'pending' OR (status = 'leased' AND lease_expires < ?))
+                ORDER BY id
+                LIMIT 1
+            """, (run_id, now)).fetchone()
+
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+
+            conn.execute("""
+                UPDATE scrape_tasks
+                SET status = 'leased', lease_owner = ?, lease_expires = ?,
+                    attempts = attempts + 1, updated_at = ?
+                WHERE id = ?
+            """, (worker, now + self.lease_seconds, now, row['id']))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+        task = dict(row)
+        task['params'] = json.loads(task['params'])
+        task['attempts'] += 1
+        return task
+
+    def complete(self, task: Dict, worker: str, result, follow_ups: List[Dict] = None) -> bool:
+        """
+        Checkpoint a task's result and queue its follow-up tasks (e.g. the next
+        page) in one transaction. False if the lease was lost to another worker.
+        """
+        conn = self._connect()
+        try:
+            self._begin(conn)
+            updated = conn.execute("""
+                UPDATE scrape_tasks
+                SET status = 'done', result = ?, error = NULL, lease_owner = NULL,
+                    lease_expires = NULL, updated_at = ?
+                WHERE id = ? AND status = 'leased' AND lease_owner = ?
+            """, (json.dumps(result, default=str), time.time(), task['id'], worker)).rowcount
+
+            if updated and follow_ups:
+                self._enqueue(conn, task['run_id'], follow_ups)
+
+            conn.execute("COMMIT")
+            return bool(updated)
+        finally:
+            conn.close()
+
+    def fail(self, task: Dict, worker: str, error: str):
+        """Release a failed task for retry, or mark it failed after max_attempts"""
+        status = 'failed' if task['attempts'] >= self.max_attempts else 'pending'
+        conn = self._connect()
+        try:
+            self._begin(conn)
+            conn.execute("""
+                UPDATE scrape_tasks
+                SET status = ?, error = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ?
+                WHERE id = ? AND status = 'leased' AND lease_owner = ?
+            """, (status, error, time.time(), task['id'], worker))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def release(self, task: Dict, worker: str):
+        """Hand an interrupted task back without counting the attempt"""
+        conn = self._connect()
+        try:
+            self._begin(conn)
+            conn.execute("""
+                UPDATE scrape_tasks
+                SET status = 'pending', attempts = attempts - 1, lease_owner = NULL,
+                    lease_expires = NULL, updated_at = ?
+                WHERE id = ? AND status = 'leased' AND lease_owner = ?
+            """, (time.time(), task['id'], worker))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def progress(self, run_id: str) -> Dict[str, int]:
+        """Task counts by status"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("""
+                SELECT status, COUNT(*) FROM scrape_tasks WHERE run_id = ? GROUP BY status
+            """, (run_id,)).fetchall()
+        finally:
+            conn.close()
+
+        counts = {'pending': 0, 'leased': 0, 'done': 0, 'failed': 0}
+        counts.update({status: count for status, count in rows})
+        return counts
+
+    def iter_results(self, run_id: str, source: str) -> Iterator[Dict]:
+        """Stream the results of the finished tasks of one source, in task order"""
+        conn = self._connect()
+        try:
+            rows = conn.execute("""
+                SELECT result FROM scrape_tasks
+                WHERE run_id = ? AND source = ? AND status = 'done'
+                ORDER BY id
+            """, (run_id, source))
+            for (result,) in rows:
+                yield from json.loads(result)
+        finally:
+            conn.close()
+
+    def results(self, run_id: str, source: str) -> List:
+        """Concatenated results of the finished tasks of one source, in task order"""
+        return list(self.iter_results(run_id, source))
+
+    def claim_load(self, run_id: str, worker: str) -> bool:
+        """
+        Lease loading a run's listings into the database, once no task is
+        pending or leased. True for one caller at a time; a run stays claimable
+        until finish_load, and a lease older than load_lease_seconds can be
+        claimed again.
+        """
+        now = time.time()
+        conn = self._connect()
+        try:
+            self._begin(conn)
+            claimed = conn.execute("""
+                UPDATE scrape_runs SET load_owner = ?, load_expires = ?
+                WHERE run_id = ? AND loaded_at IS NULL
+                  AND (load_owner IS NULL OR load_expires < ?)
+                  AND NOT EXISTS (SELECT 1 FROM scrape_tasks
+                                  WHERE run_id = ? AND status IN ('pending', 'leased'))
+            """, (worker, now + self.load_lease_seconds, run_id, now, run_id)).rowcount
+            conn.execute("COMMIT")
+            return bool(claimed)
+        finally:
+            conn.close()
+
+    def finish_load(self, run_id: str, worker: str) -> bool:
+        """Mark a run loaded; False if the load lease was lost to another worker"""
+        conn = self._connect()
+        try:
+            self._begin(conn)
+            updated = conn.execute("""
+                UPDATE scrape_runs SET loaded_at = ?, load_owner = NULL, load_expires = NULL
+                WHERE run_id = ? AND loaded_at IS NULL AND load_owner = ?
+            """, (time.time(), run_id, worker)).rowcount
+            conn.execute("COMMIT")
+            return bool(updated)
+        finally:
+            conn.close()
+
+    def release_load(self, run_id: str, worker: str):
+        """Hand back a load that did not finish, so it can be claimed again at once"""
+        conn = self._connect()
+        try:
+            self._begin(conn)
+            conn.execute("""
+                UPDATE scrape_runs SET load_owner = NULL, load_expires = NULL
+                WHERE run_id = ? AND loaded_at IS NULL AND load_owner = ?
+            """, (run_id, worker))
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def is_loaded(self, run_id: str) -> bool:
+        """True once a run's load has finished"""
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT loaded_at FROM scrape_runs WHERE run_id = ?", (run_id,)).fetchone()
+        finally:
+            conn.close()
+        return bool(row and row['loaded_at'] is not None)
@@ -11,18 +11,24 @@ sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from google_scraper import GoogleScraper
 from craigslist_scraper import CraigslistScraper
 from data_loader import DataLoader
-from typing import List, Dict
+from job_queue import ScrapeJobQueue, DEFAULT_QUEUE_PATH
+from result_sink import JSONLSink
+from typing import List, Dict, Optional, Tuple
 from datetime import datetime
 import json
+import socket
+import threading
 
 
 class MasterScraper:
     """Orchestrate all scrapers"""
 
-    def __init__(self):
+    def __init__(self, queue_path: str = DEFAULT_QUEUE_PATH):
         self.google_scraper = GoogleScraper()
         self.craigslist_scraper = CraigslistScraper()
         self.data_loader = DataLoader()
+        self.job_queue = ScrapeJobQueue(queue_path)
+        self._stop = threading.Event()
 
         # Target vehicles from database
         self.target_vehicles = [
@@ -56,110 +62,193 @@ class MasterScraper:
             'modesto'
         ]
 
-    def run_full_scrape(self, phase: str = 'all'):
+    def plan_tasks(self, phase: str) -> List[Dict]:
+        """Initial queue tasks for a phase; Craigslist tasks queue their next page as they finish"""
+        tasks = []
+
+        # Phase 1: Google Search (find listing URLs)
+        if phase in ['google', 'all']:
+            google_locations = [
+                'Bay Area California',
+                'Los Angeles California',
+                'San Diego California',
+                'Sacramento California',
+                ''  # Nationwide
+            ]
+
+            for vehicle in self.target_vehicles:
+                for year in vehicle['years']:
+                    for location in google_locations:
+                        tasks.append({'source': 'google', 'region': location, 'make': vehicle['make'],
+                                      'model': vehicle['model'], 'year': year})
+
+        # Phase 2: Craigslist Direct Scraping (first result page of each search)
+        if phase in ['craigslist', 'all']:
+            for region in self.craigslist_regions:
+                for vehicle in self.target_vehicles:
+                    tasks.append({'source': 'craigslist', 'region': region, 'make': vehicle['make'],
+                                  'model': vehicle['model'], 'year': min(vehicle['years']), 'page': 0,
+                                  'params': {'offset': 0, 'collected': 0, 'max_results': 50}})
+
+        return tasks
+
+    def run_task(self, task: Dict) -> Tuple[List[Dict], List[Dict]]:
+        """Execute one queue task; returns (listings, follow-up tasks)"""
+
+        if task['source'] == 'google':
+            results = self.google_scraper.search(task['make'], task['model'], task['year'],
+                                                 task['region'], num_results=30)
+            return results, []
+
+        params = task['params']
+        page = self.craigslist_scraper.search_page(task['region'], task['make'], task['model'],
+                                                   task['year'], params['offset'])
+        if page is None:
+            raise RuntimeError("search page could not be fetched")
+
+        collected = params['collected'] + len(page['results'])
+        follow_ups = []
+        if page['count'] and collected < params['max_results']:
+            follow_ups.append({
+                'source': 'craigslist', 'region': task['region'], 'make': task['make'],
+                'model': task['model'], 'year': task['year'], 'page': task['page'] + 1,
+                'params': {**params, 'offset': params['offset'] + page['count'], 'collected': collected}
+            })
+
+        return page['results'], follow_ups
+
+    def drain_queue(self, run_id: str, worker: str) -> int:
+        """Claim and run tasks until the queue is empty or a stop is requested"""
+        completed = 0
+
+        while not self._stop.is_set():
+            task = self.job_queue.claim(run_id, worker)
+            if task is None:
+                break
+
+            label = f"{task['source']} {task['region'] or 'nationwide'}: {task['year']} {task['make']} {task['model']} p{task['page']}"
+            try:
+                listings, follow_ups = self.run_task(task)
+            except Exception as e:
+                print(f"✗ {label} failed (attempt {task['attempts']}): {e}")
+                self.job_queue.fail(task, worker, str(e))
+                continue
+            except BaseException:
+                self.job_queue.release(task, worker)
+                raise
+
+            if self.job_queue.complete(task, worker, listings, follow_ups):
+                completed += 1
+                print(f"  {label} - {len(listings)} listings")
+
+        return completed
+
+    def work(self, run_id: str, workers: int = 4):
+        """
+        Drain a run with several worker threads. More processes can drain the
+        same run at once by running the scraper with the same --run-id.
+        """
+        self._stop.clear()
+        worker_prefix = f"{socket.gethostname()}-{os.getpid()}"
+
+        threads = [
+            threading.Thread(target=self.drain_queue, args=(run_id, f"{worker_prefix}-{i}"), daemon=True)
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for thread in threads:
+                while thread.is_alive():
+                    thread.join(timeout=0.5)
+        except KeyboardInterrupt:
+            # Let in-flight tasks checkpoint, then stop; rerun with the same run id to resume
+            print("\nInterrupted - finishing in-flight tasks (rerun with the same --run-id to resume)")
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            raise
+
+    def run_full_scrape(self, phase: str = 'all', run_id: Optional[str] = None, workers: int = 4):
         """
-        Run complete scraping operation
+        Run complete scraping operation through the persistent job queue
         phase: 'google', 'craigslist', 'all'
+        run_id: reuse to resume an interrupted run (default: one run per phase per day)
         """
 
+        run_id = run_id or f"{phase}-{datetime.now().strftime('%Y%m%d')}"
+
         print("="*80)
         print("MASTER SCRAPER - Building Price Database Time Capsule".center(80))
         print("="*80)
         print(f"\nStart Time: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
         print(f"Phase: {phase}")
+        print(f"Run: {run_id}")
         print(f"Target Vehicles: {len(self.target_vehicles)}")
         print(f"Regions: {len(self.craigslist_regions)} Craigslist regions")
 
         results = {
             'start_time': datetime.now().isoformat(),
+            'run_id': run_id,
             'phase': phase,
-            'google_results': [],
-            'craigslist_results': [],
             'loaded_count': 0
         }
 
-        # Phase 1: Google Search (find listing URLs)
-        if phase in ['google', 'all']:
-            print(f"\n{'='*80}")
-            print("PHASE 1: GOOGLE SEARCH - Finding Listings")
-            print('='*80)
+        added = self.job_queue.create_run(run_id, phase, self.plan_tasks(phase))
+        progress = self.job_queue.progress(run_id)
+        print(f"Tasks: {added} new, {progress['done']} already done, {progress['pending']} pending")
 
-            google_vehicles = []
-            for vehicle in self.target_vehicles:
-                for year in vehicle['years']:
-                    google_vehicles.append({
-                        'make': vehicle['make'],
-                        'model': vehicle['model'],
-                        'year': year
-                    })
-
-            google_locations = [
-                'Bay Area California',
-                'Los Angeles California',
-                'San Diego California',
-                'Sacramento California',
-                ''  # Nationwide
-            ]
-
-            results['google_results'] = self.google_scraper.scrape_multiple_vehicles(
-                google_vehicles,
-                google_locations
-            )
-
-            print(f"\n✓ Google search complete: {len(results['google_results'])} URLs found")
-
-        # Phase 2: Craigslist Direct Scraping
-        if phase in ['craigslist', 'all']:
-            print(f"\n{'='*80}")
-            print("PHASE 2: CRAIGSLIST - Direct Scraping")
-            print('='*80)
-
-            for region in self.craigslist_regions:
-                for vehicle in self.target_vehicles:
-                    print(f"\nScraping {region}: {vehicle['make']} {vehicle['model']}")
+        print(f"\n{'='*80}")
+        print(f"SCRAPING - {workers} workers")
+        print('='*80)
 
-                    # Get listings for this vehicle in this region
-                    listings = self.craigslist_scraper.search_region(
-                        region=region,
-                        make=vehicle['make'],
-                        model=vehicle['model'],
-                        min_year=min(vehicle['years']),
-                        max_results=50
-                    )
+        self.work(run_id, workers)
 
-                    results['craigslist_results'].extend(listings)
+        progress = self.job_queue.progress(run_id)
+        results['task_progress'] = progress
 
-                    print(f"  Found {len(listings)} listings")
+        print(f"\n✓ Scraping complete: {progress['done']} tasks done, {progress['failed']} failed")
 
-                    # Polite delay between regions
-                    self.craigslist_scraper.random_delay()
+        if progress['leased'] or progress['pending']:
+            print(f"\n{progress['leased'] + progress['pending']} tasks still held by other workers; "
+                  "the last worker to finish loads the database")
+            return
 
-            print(f"\n✓ Craigslist scraping complete: {len(results['craigslist_results'])} listings")
+        # Phase 3: Load into Database (once per run, even with several workers)
+        load_worker = f"{socket.gethostname()}-{os.getpid()}-load"
+        if not self.job_queue.claim_load(run_id, load_worker):
+            if self.job_queue.is_loaded(run_id):
+                print(f"\nRun {run_id} was already loaded into the database")
+            else:
+                print(f"\nRun {run_id} is being loaded by another worker")
+            return
 
-        # Phase 3: Load into Database
         print(f"\n{'='*80}")
         print("PHASE 3: LOADING INTO DATABASE")
         print('='*80)
 
-        # Combine and deduplicate results
-        all_listings = results['craigslist_results']  # Craigslist has full data
-
+        # Craigslist has full data; listings stream from the queue in batches.
         # Filter out entries without required fields
-        valid_listings = [
-            l for l in all_listings
+        valid_listings = (
+            l for l in self.job_queue.iter_results(run_id, 'craigslist')
             if l.get('price') and l.get('year') and l.get('make') and l.get('model')
-        ]
-
-        print(f"\nValid listings to load: {len(valid_listings)}")
-
-        if valid_listings:
-            load_stats = self.data_loader.load_listings(valid_listings)
-            results['loaded_count'] = load_stats.get('loaded', 0)
-
-            print(f"\n✓ Database loading complete:")
-            print(f"  Loaded: {load_stats['loaded']}")
-            print(f"  Skipped: {load_stats['skipped']}")
-            print(f"  Errors: {load_stats['errors']}")
+        )
+
+        try:
+            load_stats = self.data_loader.load_batches(valid_listings)
+        except BaseException:
+            # Not marked loaded: rerun with the same --run-id to load it again
+            self.job_queue.release_load(run_id, load_worker)
+            raise
+        self.job_queue.finish_load(run_id, load_worker)
+        results['loaded_count'] = load_stats.get('loaded', 0)
+
+        print(f"\n✓ Database loading complete:")
+        print(f"  Valid listings: {load_stats['total']}")
+        print(f"  Loaded: {load_stats['loaded']}")
+        print(f"  Skipped: {load_stats['skipped']}")
+        print(f"  Errors: {load_stats['errors']}")
 
         # Save master results
         results['end_time'] = datetime.now().isoformat()
@@ -183,22 +272,16 @@ class MasterScraper:
 
         sample_regions = ['sfbay', 'losangeles']
 
-        all_listings = []
-
-        for region in sample_regions:
-            for vehicle in sample_vehicles:
-                print(f"\nScraping {region}: {vehicle['make']} {vehicle['model']}")
-
-                listings = self.craigslist_scraper.search_region(
-                    region=region,
-                    make=vehicle['make'],
-                    model=vehicle['model'],
-                    min_year=min(vehicle['years']),
-                    max_results=20
-                )
+        searches = [
+            {'region': region, 'make': vehicle['make'], 'model': vehicle['model'],
+             'min_year': min(vehicle['years']), 'max_results': 20}
+            for region in sample_regions
+            for vehicle in sample_vehicles
+        ]
 
-                all_listings.extend(listings)
-                self.craigslist_scraper.random_delay()
+        all_listings = []
+        for listings in self.craigslist_scraper.search_regions(searches):
+            all_listings.extend(listings)
 
         print(f"\n✓ Found {len(all_listings)} listings")
 
@@ -210,14 +293,35 @@ class MasterScraper:
             print(f"\n✓ Loaded {load_stats['loaded']} listings into database")
 
     def save_master_results(self, results: Dict):
-        """Save master scraping results"""
+        """
+        Save master scraping results: the run's listings are streamed from the
+        job queue to master_scrape_<ts>.jsonl.gz, the run summary to a .json
+        """
         timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         filepath = f"scrapers/data/master_scrape_{timestamp}.json"
 
+        results['google_count'] = 0
+        results['craigslist_count'] = 0
+        results['by_vehicle'] = {}
+
+        with JSONLSink(f"scrapers/data/master_scrape_{timestamp}.jsonl.gz") as sink:
+            for source in ('google', 'craigslist'):
+                def counted(listings):
+                    for listing in listings:
+                        results[f'{source}_count'] += 1
+                        if source == 'craigslist':
+                            key = f"{listing.get('make', 'Unknown')} {listing.get('model', 'Unknown')}"
+                            results['by_vehicle'][key] = results['by_vehicle'].get(key, 0) + 1
+                        yield listing
+
+                sink.write_many(counted(self.job_queue.iter_results(results['run_id'], source)))
+
+        results['listings_file'] = sink.path
+
         with open(filepath, 'w') as f:
             json.dump(results, f, indent=2, default=str)
 
-        print(f"\n✓ Results saved to: {filepath}")
+        print(f"\n✓ Results saved to: {filepath} ({sink.count} listings in {sink.path})")
 
     def print_summary(self, results: Dict):
         """Print final summary"""
@@ -229,22 +333,17 @@ class MasterScraper:
         print(f"\nStart Time: {results['start_time']}")
         print(f"End Time: {results['end_time']}")
 
-        if results.get('google_results'):
+        if results.get('google_count'):
             print(f"\nGoogle Search:")
-            print(f"  URLs Found: {len(results['google_results'])}")
+            print(f"  URLs Found: {results['google_count']}")
 
-        if results.get('craigslist_results'):
+        if results.get('craigslist_count'):
             print(f"\nCraigslist Scraping:")
-            print(f"  Listings Found: {len(results['craigslist_results'])}")
+            print(f"  Listings Found: {results['craigslist_count']}")
 
             # Breakdown by vehicle
-            by_vehicle = {}
-            for listing in results['craigslist_results']:
-                key = f"{listing.get('make', 'Unknown')} {listing.get('model', 'Unknown')}"
-                by_vehicle[key] = by_vehicle.get(key, 0) + 1
-
             print(f"\n  By Vehicle:")
-            for vehicle, count in sorted(by_vehicle.items(), key=lambda x: x[1], reverse=True):
+            for vehicle, count in sorted(results['by_vehicle'].items(), key=lambda x: x[1], reverse=True):
                 print(f"    {vehicle}: {count}")
 
         print(f"\nDatabase:")
@@ -264,6 +363,10 @@ def main():
     parser.add_argument('--mode', choices=['full', 'quick', 'google', 'craigslist'],
                        default='quick',
                        help='Scraping mode (default: quick)')
+    parser.add_argument('--run-id',
+                       help='Job queue run to create or resume (default: one per mode per day)')
+    parser.add_argument('--workers', type=int, default=4,
+                       help='Worker threads draining the job queue (default: 4)')
 
     args = parser.parse_args()
 
@@ -282,12 +385,12 @@ def main():
 
         confirm = input("Continue? (yes/no): ")
         if confirm.lower() == 'yes':
-            scraper.run_full_scrape(phase='all')
+            scraper.run_full_scrape(phase='all', run_id=args.run_id, workers=args.workers)
         else:
             print("Cancelled")
 
     elif args.mode in ['google', 'craigslist']:
-        scraper.run_full_scrape(phase=args.mode)
+        scraper.run_full_scrape(phase=args.mode, run_id=args.run_id, workers=args.workers)
 
 
 if __name__ == "__main__":
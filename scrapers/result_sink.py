@@ -0,0 +1,149 @@
+"""
+Result Sink
+Append-only JSON Lines files (optionally gzip-compressed) for scrape results,
+written as results arrive and read back as a stream
+"""
+
+import gzip
+import json
+import os
+import threading
+import zlib
+from itertools import islice
+from typing import Dict, Iterable, Iterator, List
+
+
+# Records serialized per write/flush
+WRITE_BATCH_SIZE = 500
+
+# Compressed bytes read at a time when checking a .gz file
+GZIP_CHUNK_SIZE = 1 << 20
+
+# Errors from reading a gzip stream that was cut short or appended to after a cut
+# (a broken member can inflate to garbage before zlib notices, hence UnicodeDecodeError)
+GZIP_READ_ERRORS = (EOFError, zlib.error, gzip.BadGzipFile, UnicodeDecodeError)
+
+
+def open_text(path: str, mode: str):
+    """Open a .jsonl or .jsonl.gz file in text mode"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+class JSONLSink:
+    """
+    One JSON record per line, appended and flushed as it is written, so a
+    crash loses at most the batch in flight. A .gz file left by a crash has
+    no gzip trailer; iter_jsonl still reads every complete record in it, and
+    opening it for append first rewrites it to end at the last complete
+    record, so the new gzip member is not appended to a broken one.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.path = path
+        self.count = 0
+        if path.endswith('.gz') and os.path.exists(path) and not gzip_is_complete(path):
+            print(f"⚠️  {path} is truncated; rewriting it up to the last complete record before appending")
+            truncate_to_complete_records(path)
+        self._file = open_text(path, 'a')
+        self._lock = threading.Lock()
+
+    def write(self, record: Dict):
+        self.write_many([record])
+
+    def write_many(self, records: Iterable[Dict]):
+        for batch in iter_batches(records, WRITE_BATCH_SIZE):
+            lines = ''.join(json.dumps(record, default=str) + '\n' for record in batch)
+            with self._lock:
+                self._file.write(lines)
+                self._file.flush()
+                self.count += len(batch)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def iter_jsonl(path: str) -> Iterator[Dict]:
+    """
+    Yield the records of a JSONL file one at a time (blank lines skipped)
+    A file cut short by a crash (truncated gzip stream, or a partial last
+    line) yields its complete records, then stops with a warning.
+    """
+    with open_text(path, 'r') as f:
+        lines = iter(f)
+        while True:
+            try:
+                line = next(lines)
+            except StopIteration:
+                return
+            except GZIP_READ_ERRORS:
+                print(f"⚠️  {path} is truncated (incomplete gzip stream); stopped after the last complete record")
+                return
+
+            if not line.strip():
+                continue
+            # In a .gz file a bad line can only be garbage inflated from a broken member
+            if path.endswith('.gz') or not line.endswith('\n'):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    print(f"⚠️  {path} ends with a partial or corrupt record; stopped before it")
+                    return
+                yield record
+                continue
+            yield json.loads(line)
+
+
+def gzip_is_complete(path: str) -> bool:
+    """True if every gzip member in the file ends with its trailer (one streaming pass)"""
+    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    in_member = False
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(GZIP_CHUNK_SIZE)
+            if not chunk:
+                return not in_member
+            while chunk:
+                try:
+                    decompressor.decompress(chunk)
+                except zlib.error:
+                    return False
+                if decompressor.eof:
+                    chunk = decompressor.unused_data
+                    decompressor = zlib.decompressobj(zlib.MAX_WBITS | 16)
+                    in_member = False
+                else:
+                    chunk = b''
+                    in_member = True
+
+
+def truncate_to_complete_records(path: str):
+    """Rewrite a cut-short .gz file so it holds only its complete lines"""
+    temp_path = path + '.tmp'
+    with gzip.open(path, 'rt', encoding='utf-8') as src, gzip.open(temp_path, 'wt', encoding='utf-8') as dst:
+        try:
+            for line in src:
+                if line.endswith('\n'):
+                    dst.write(line)
+        except GZIP_READ_ERRORS:
+            pass
+    os.replace(temp_path, path)
+
+
+def iter_batches(records: Iterable[Dict], batch_size: int) -> Iterator[List[Dict]]:
+    """Group a record stream into lists of at most batch_size"""
+    records = iter(records)
+    while True:
+        batch = list(islice(records, batch_size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,74 @@
+"""
+Shared fixtures: a small seeded database in a temp directory
+"""
+
+import os
+import random
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, 'scrapers')]
+
+from database import (DatabaseManager, Vehicle, MarketPrice, VehicleProblem, DriverFit,
+                      VehicleRepository, MarketPriceRepository, ProblemRepository, DriverFitRepository)
+
+
+VEHICLES = [
+    Vehicle(make='Toyota', model='Tacoma', year=2019, drivetrain='4WD', cargo_capacity_cuft=38,
+            towing_capacity_lbs=6800, msrp=36000, legroom_front_in=42.9, headroom_front_in=39.7),
+    Vehicle(make='Toyota', model='Tacoma', year=2021, drivetrain='4WD', cargo_capacity_cuft=38,
+            towing_capacity_lbs=6800, msrp=39000, legroom_front_in=42.9, headroom_front_in=39.7),
+    Vehicle(make='Lexus', model='GX', year=2016, drivetrain='AWD', cargo_capacity_cuft=64,
+            towing_capacity_lbs=6500, msrp=52000, legroom_front_in=41.7, headroom_front_in=38.0),
+    Vehicle(make='Tesla', model='Model Y', year=2022, drivetrain='AWD', fuel_type='electric',
+            cargo_capacity_cuft=76, towing_capacity_lbs=3500, msrp=54000, mpge=122),
+    Vehicle(make='Honda', model='Civic', year=2018, drivetrain='FWD', cargo_capacity_cuft=15,
+            msrp=22000, mpg_combined=36),
+]
+
+CITIES = [('San Jose', 'CA', 'Bay Area'), ('Fresno', 'CA', 'Central Valley'),
+          ('Los Angeles', 'CA', 'SoCal'), ('Reno', 'NV', 'Nevada'), ('Santa Cruz', 'CA', 'Other CA')]
+
+
+@pytest.fixture
+def db(tmp_path):
+    """DatabaseManager on a fresh, fully migrated file with vehicles, listings, problems and fit data"""
+    manager = DatabaseManager(str(tmp_path / 'test.db'))
+    rng = random.Random(7)
+
+    vehicle_ids = VehicleRepository(manager).create_vehicles_bulk(VEHICLES)
+
+    listings = []
+    for vehicle_id, vehicle in zip(vehicle_ids, VEHICLES):
+        for _ in range(12):
+            city, state, region = rng.choice(CITIES)
+            listings.append(MarketPrice(
+                vehicle_id=vehicle_id, listing_date='2026-01-15',
+                mileage=rng.randint(5, 120) * 1000,
+                asking_price=round(vehicle.msrp * rng.uniform(0.55, 1.0), -2),
+                condition=rng.choice(['excellent', 'good', 'fair']),
+                city=city, state=state, region=region,
+                has_leather=rng.random() < 0.5, has_tow_package=rng.random() < 0.3,
+                source='test', source_url=f'https://example.com/{len(listings)}'
+            ))
+    MarketPriceRepository(manager).add_listings_bulk(listings)
+
+    problems = ProblemRepository(manager)
+    problems.add_problem(VehicleProblem(make='Toyota', model='Tacoma', year_start=2016, year_end=2020,
+                                        problem_category='transmission', problem_description='Gear hunting',
+                                        severity='moderate', frequency='common', avg_repair_cost=800))
+    problems.add_problem(VehicleProblem(make='Tesla', model='Model Y', year_start=2020, year_end=2022,
+                                        problem_category='body', problem_description='Panel gaps',
+                                        severity='minor', frequency='widespread', avg_repair_cost=300))
+
+    fits = DriverFitRepository(manager)
+    fits.add_fit_data(DriverFit(vehicle_id=vehicle_ids[0], recommended_height_max=78, seat_comfort_score=7))
+    fits.add_fit_data(DriverFit(vehicle_id=vehicle_ids[2], recommended_height_max=77, seat_comfort_score=9,
+                                tall_driver_suitable=True))
+    fits.add_fit_data(DriverFit(vehicle_id=vehicle_ids[4], recommended_height_max=72, seat_comfort_score=6,
+                                tall_driver_suitable=False))
+
+    yield manager
+    manager.close()
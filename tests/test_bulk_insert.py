@@ -0,0 +1,115 @@
+"""
+Bulk inserts: conflict handling and IDs returned in input order
+"""
+
+import sqlite3
+
+import pytest
+
+from database import DatabaseManager, MarketPrice, MarketPriceRepository, Vehicle, VehicleRepository
+
+
+@pytest.fixture
+def manager(tmp_path):
+    manager = DatabaseManager(str(tmp_path / 'bulk.db'))
+    yield manager
+    manager.close()
+
+
+def listing(vehicle_id, url, price=30000):
+    return MarketPrice(vehicle_id=vehicle_id, listing_date='2026-01-15', mileage=40000,
+                       asking_price=price, city='Fresno', state='CA', region='Central Valley',
+                       source='test', source_url=url)
+
+
+def count(manager, table):
+    return manager.execute_query(f"SELECT COUNT(*) as n FROM {table}")[0]['n']
+
+
+def test_vehicle_ids_follow_input_order(manager):
+    repo = VehicleRepository(manager)
+    vehicles = [Vehicle(make=make, model=model, year=2020)
+                for make, model in [('Toyota', 'Tacoma'), ('Lexus', 'GX'), ('Honda', 'Civic')]]
+
+    ids = repo.create_vehicles_bulk(vehicles)
+
+    assert [repo.get_vehicle(i)['make'] for i in ids] == ['Toyota', 'Lexus', 'Honda']
+
+
+def test_vehicle_conflict_without_a_mode_rolls_back_the_batch(manager):
+    repo = VehicleRepository(manager)
+    repo.create_vehicles_bulk([Vehicle(make='Toyota', model='Tacoma', year=2020)])
+
+    with pytest.raises(sqlite3.IntegrityError):
+        repo.create_vehicles_bulk([Vehicle(make='Lexus', model='GX', year=2016),
+                                   Vehicle(make='Toyota', model='Tacoma', year=2020)])
+    assert count(manager, 'vehicles') == 1
+
+
+@pytest.mark.parametrize('mode, msrp', [('ignore', 36000), ('update', 41000)])
+def test_vehicle_conflicts_resolve_to_the_existing_id(manager, mode, msrp):
+    repo = VehicleRepository(manager)
+    [tacoma] = repo.create_vehicles_bulk([Vehicle(make='Toyota', model='Tacoma', year=2020, msrp=36000)])
+
+    ids = repo.create_vehicles_bulk([Vehicle(make='Lexus', model='GX', year=2016),
+                                     Vehicle(make='Toyota', model='Tacoma', year=2020, msrp=41000),
+                                     Vehicle(make='Toyota', model='Tacoma', year=2020, trim='TRD Pro')],
+                                    on_conflict=mode)
+
+    assert ids[1] == tacoma
+    assert len(set(ids)) == 3
+    assert [repo.get_vehicle(i)['model'] for i in ids] == ['GX', 'Tacoma', 'Tacoma']
+    assert repo.get_vehicle(tacoma)['msrp'] == msrp
+    assert count(manager, 'vehicles') == 3
+
+
+@pytest.fixture
+def vehicle_id(manager):
+    return VehicleRepository(manager).create_vehicle(Vehicle(make='Toyota', model='Tacoma', year=2020))
+
+
+def test_listings_without_a_mode_always_insert(manager, vehicle_id):
+    repo = MarketPriceRepository(manager)
+    first = repo.add_listings_bulk([listing(vehicle_id, 'https://example.com/1')])
+    again = repo.add_listings_bulk([listing(vehicle_id, 'https://example.com/1')])
+
+    assert first != again
+    assert count(manager, 'market_prices') == 2
+
+
+@pytest.mark.parametrize('mode, price', [('ignore', 30000), ('update', 27500)])
+def test_listing_conflicts_keep_input_order(manager, vehicle_id, mode, price):
+    repo = MarketPriceRepository(manager)
+    [existing] = repo.add_listings_bulk([listing(vehicle_id, 'https://example.com/old')])
+
+    batch = [listing(vehicle_id, 'https://example.com/a', 31000),
+             listing(vehicle_id, 'https://example.com/old', 27500),
+             listing(vehicle_id, 'https://example.com/b', 32000),
+             listing(vehicle_id, 'https://example.com/a', 31500),  # duplicate within the batch
+             listing(vehicle_id, None, 33000),
+             listing(vehicle_id, None, 33000)]  # no URL, so never a conflict
+    ids = repo.add_listings_bulk(batch, on_conflict=mode)
+
+    assert ids[1] == existing and ids[3] == ids[0]
+    assert len(set(ids)) == 5
+    assert count(manager, 'market_prices') == 5
+
+    rows = {row['id']: row for row in repo.get_listings()}
+    assert [rows[i]['source_url'] for i in ids] == [l.source_url for l in batch]
+    assert rows[existing]['asking_price'] == price
+    # 'update' keeps the last copy of an in-batch duplicate, 'ignore' the first
+    assert rows[ids[0]]['asking_price'] == (31500 if mode == 'update' else 31000)
+    assert rows[ids[2]]['asking_price'] == 32000
+
+
+def test_bulk_listings_are_geocoded(manager, vehicle_id):
+    [listing_id] = MarketPriceRepository(manager).add_listings_bulk([listing(vehicle_id, None)])
+    row = manager.execute_query("SELECT latitude, longitude FROM market_prices WHERE id = ?", (listing_id,))[0]
+    assert row['latitude'] is not None and row['longitude'] is not None
+
+
+def test_unknown_conflict_mode_is_rejected(manager):
+    with pytest.raises(ValueError):
+        VehicleRepository(manager).create_vehicles_bulk([], on_conflict='replace')
+    with pytest.raises(ValueError):
+        MarketPriceRepository(manager).add_listings_bulk([], on_conflict='replace')
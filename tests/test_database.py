@@ -0,0 +1,86 @@
+"""
+Schema migrations, materialized aggregates and connection pooling
+"""
+
+import sqlite3
+import threading
+from pathlib import Path
+
+from database import (DatabaseManager, MarketPriceRepository, VehicleRepository, Vehicle,
+                      SCHEMA_VERSION, _column_exists)
+
+
+def test_fresh_database_is_at_current_schema(db):
+    with db.get_connection(read_only=True) as conn:
+        assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+        for column in ('distance_miles', 'latitude', 'longitude'):
+            assert _column_exists(conn, 'market_prices', column)
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert {'market_stats', 'fair_value_models', 'fair_value_dirty', 'market_prices_geo'} <= tables
+
+
+def test_baseline_database_upgrades_in_place(tmp_path):
+    # A database created from the original schema file, before any migrations
+    path = tmp_path / 'baseline.db'
+    conn = sqlite3.connect(path)
+    conn.executescript((Path(__file__).parent.parent / 'database_schema.sql').read_text())
+    conn.execute("INSERT INTO vehicles (make, model, year) VALUES ('Toyota', 'Tacoma', 2019)")
+    conn.executemany(
+        "INSERT INTO market_prices (vehicle_id, listing_date, mileage, asking_price, city, state, region) "
+        "VALUES (1, '2026-01-01', ?, ?, 'San Jose', 'CA', 'Bay Area')",
+        [(40000, 30000), (60000, 26000)]
+    )
+    conn.commit()
+    conn.close()
+
+    manager = DatabaseManager(str(path))
+    try:
+        with manager.get_connection(read_only=True) as conn:
+            assert conn.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+            stats = conn.execute("SELECT listing_count, sum_price FROM market_stats").fetchone()
+            assert tuple(stats) == (2, 56000)
+            dirty = [tuple(row) for row in conn.execute("SELECT make, model FROM fair_value_dirty")]
+            assert dirty == [('Toyota', 'Tacoma')]
+            assert conn.execute("SELECT COUNT(*) FROM market_prices WHERE latitude IS NOT NULL").fetchone()[0] == 2
+            assert conn.execute("SELECT COUNT(*) FROM market_prices_geo").fetchone()[0] == 2
+    finally:
+        manager.close()
+
+
+def test_market_stats_match_listing_aggregates(db):
+    repo = MarketPriceRepository(db)
+    direct = db.execute_query("""
+        SELECT v.make, v.model, v.year, COUNT(*) as n, AVG(mp.asking_price) as avg_price,
+               MIN(mp.asking_price) as min_price, MAX(mp.asking_price) as max_price
+        FROM market_prices mp JOIN vehicles v ON mp.vehicle_id = v.id
+        GROUP BY v.make, v.model, v.year
+    """)
+    bulk = repo.get_market_statistics_bulk([(r['make'], r['model'], r['year']) for r in direct])
+    for row in direct:
+        stats = repo.get_market_statistics(row['make'], row['model'], row['year'])
+        assert stats == bulk[(row['make'], row['model'], row['year'])]
+        assert stats['listing_count'] == row['n']
+        assert abs(stats['avg_price'] - row['avg_price']) < 1e-6
+        assert (stats['min_price'], stats['max_price']) == (row['min_price'], row['max_price'])
+
+
+def test_readers_of_exited_threads_are_closed(db):
+    for _ in range(20):
+        thread = threading.Thread(target=lambda: db.execute_query("SELECT COUNT(*) FROM vehicles"))
+        thread.start()
+        thread.join()
+    assert len(db._pool) <= 1
+
+
+def test_memory_database_reads_see_writes_from_other_threads():
+    manager = DatabaseManager(":memory:")
+    VehicleRepository(manager).create_vehicle(Vehicle(make='Toyota', model='Tacoma', year=2020))
+
+    counts = []
+    thread = threading.Thread(
+        target=lambda: counts.append(manager.execute_query("SELECT COUNT(*) as n FROM vehicles")[0]['n']))
+    thread.start()
+    thread.join()
+    manager.close()
+
+    assert counts == [1]
@@ -0,0 +1,131 @@
+"""
+Streaming Facebook Marketplace parsing and the single-transaction bulk load
+"""
+
+import sqlite3
+
+import pytest
+
+from database import MarketPriceRepository, VehicleRepository
+from facebook_parser import FacebookParser
+from valuation import FairValueEstimator
+
+
+LISTINGS_TEXT = """
+$25,000
+2019 Toyota Tacoma TRD Off-Road
+San Jose, CA
+60K miles
+$1,500
+2016 Lexus GX 460
+Fresno, CA
+$38,500
+2016 Lexus GX 460 Premium
+Fresno, CA
+98K miles
+$25,000
+2019 Toyota Tacoma TRD Off-Road
+San Jose, CA
+60K miles
+$12,000
+2012 Honda Element
+Reno, NV
+$31,000
+2020 Toyota 4Runner SR5
+Santa Cruz, CA
+"""
+
+RTF_TEXT = "".join(
+    '{\\field{\\*\\fldinst{HYPERLINK "https://www.facebook.com/marketplace/item/%d/"}}{\\fldrslt x}}\n' % n
+    for n in range(1, 7)
+)
+
+
+@pytest.fixture
+def dump(tmp_path):
+    text, rtf = tmp_path / 'listings.txt', tmp_path / 'listings.rtf'
+    text.write_text(LISTINGS_TEXT)
+    rtf.write_text(RTF_TEXT)
+    return str(text), str(rtf)
+
+
+@pytest.fixture
+def parser(db):
+    # Pointed at the temp database instead of the committed one
+    parser = FacebookParser.__new__(FacebookParser)
+    parser.db = db
+    parser.vehicle_repo = VehicleRepository(db)
+    parser.price_repo = MarketPriceRepository(db)
+    parser.valuation = FairValueEstimator(db)
+    return parser
+
+
+def test_rtf_urls_do_not_depend_on_chunk_size(parser, dump):
+    _, rtf = dump
+    expected = list(parser.iter_rtf_urls(rtf))
+    assert len(expected) == 6
+    for chunk_size in (1, 7, 64):
+        assert list(parser.iter_rtf_urls(rtf, chunk_size=chunk_size)) == expected
+
+
+def test_streamed_listings_pair_with_urls(parser, dump):
+    text, rtf = dump
+    listings = list(parser.iter_facebook_listings(text, rtf_filepath=rtf))
+
+    summary = [(l['year'], l['make'], l['model'], l['price'], l['mileage'], l['city'], l['source_url'])
+               for l in listings]
+    # The $1,500 listing is filtered but still consumes item 2's URL
+    assert summary == [
+        (2019, 'Toyota', 'Tacoma', 25000.0, 60000, 'San Jose', 'https://www.facebook.com/marketplace/item/1/'),
+        (2016, 'Lexus', 'GX', 38500.0, 98000, 'Fresno', 'https://www.facebook.com/marketplace/item/3/'),
+        (2019, 'Toyota', 'Tacoma', 25000.0, 60000, 'San Jose', 'https://www.facebook.com/marketplace/item/4/'),
+        (2020, 'Toyota', '4runner', 31000.0, 0, 'Santa Cruz', 'https://www.facebook.com/marketplace/item/5/'),
+    ]
+    assert listings[1]['trim'] == 'Premium'
+
+
+def test_parse_facebook_text_matches_stream(parser, dump):
+    text, _ = dump
+    assert parser.parse_facebook_text(text) == list(parser.iter_facebook_listings(text))
+
+
+def count_rows(db):
+    return (db.execute_query("SELECT COUNT(*) as n FROM market_prices")[0]['n'],
+            db.execute_query("SELECT COUNT(*) as n FROM vehicles")[0]['n'])
+
+
+def test_bulk_load_and_rerun(parser, dump):
+    text, _ = dump
+    listings_before, vehicles_before = count_rows(parser.db)
+
+    stats = parser.load_to_database(parser.iter_facebook_listings(text))
+    assert stats == {'total': 4, 'loaded': 3, 'skipped': 0, 'duplicates': 1, 'errors': 0}
+    # 2019 Tacoma and 2016 GX are seeded; the 2020 4runner is new
+    assert count_rows(parser.db) == (listings_before + 3, vehicles_before + 1)
+
+    rerun = parser.load_to_database(parser.iter_facebook_listings(text))
+    assert rerun == {'total': 4, 'loaded': 0, 'skipped': 0, 'duplicates': 4, 'errors': 0}
+    assert count_rows(parser.db) == (listings_before + 3, vehicles_before + 1)
+
+
+def test_failed_write_rolls_back_the_whole_import(parser, dump, monkeypatch):
+    text, _ = dump
+    before = count_rows(parser.db)
+    add_listings_bulk = parser.price_repo.add_listings_bulk
+    calls = []
+
+    def fail_on_last_batch(listings):
+        calls.append(len(listings))
+        if len(calls) == 3:
+            raise sqlite3.OperationalError("disk I/O error")
+        return add_listings_bulk(listings)
+
+    monkeypatch.setattr(parser, 'LOAD_BATCH_SIZE', 1)
+    monkeypatch.setattr(parser.price_repo, 'add_listings_bulk', fail_on_last_batch)
+
+    stats = parser.load_to_database(parser.iter_facebook_listings(text))
+
+    assert calls == [1, 1, 1]
+    assert stats['loaded'] == 0 and stats['errors'] == 3
+    # Earlier batches and the vehicle created for the failed one are gone too
+    assert count_rows(parser.db) == before
@@ -0,0 +1,150 @@
+"""
+Concurrent fetching with per-host rate limits, against local stand-in servers
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from base_scraper import BaseScraper
+from fetch_engine import HostRateLimiter, TokenBucket, run_concurrently
+
+
+# Seconds each stand-in request takes, so requests overlap
+RESPONSE_SECONDS = 0.2
+
+RATE_PER_HOST = 20.0
+
+
+class InFlight:
+    """Requests being served right now, across every stand-in site"""
+
+    def __init__(self):
+        self.count = 0
+        self.peak = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        with self.lock:
+            self.count += 1
+            self.peak = max(self.peak, self.count)
+
+    def __exit__(self, *exc):
+        with self.lock:
+            self.count -= 1
+
+
+class StandInSite:
+    """A local HTTP server recording when each request arrived"""
+
+    def __init__(self, in_flight: InFlight):
+        self.arrivals = []
+        self.lock = threading.Lock()
+        site = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                with in_flight:
+                    with site.lock:
+                        site.arrivals.append(time.monotonic())
+                    time.sleep(RESPONSE_SECONDS)
+                    body = self.path.encode()
+                    self.send_response(200)
+                    self.send_header('Content-Type', 'text/plain')
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def in_flight():
+    return InFlight()
+
+
+@pytest.fixture
+def sites(in_flight):
+    sites = [StandInSite(in_flight), StandInSite(in_flight)]
+    yield sites
+    for site in sites:
+        site.close()
+
+
+def test_map_concurrent_against_local_sites(sites, in_flight):
+    scraper = BaseScraper(delay_min=0, delay_max=1, max_workers=4, cache_dir=None)
+    scraper.rate_limiter = HostRateLimiter(rate_per_host=RATE_PER_HOST)
+
+    # Two hosts (ports), interleaved
+    urls = [f"{site.url}/listing/{n}" for n in range(6) for site in sites]
+    results = scraper.map_concurrent(lambda url: scraper.fetch_body(url)[0].decode(), urls)
+
+    assert results == [url[url.index('/listing'):] for url in urls]
+
+    for site in sites:
+        assert len(site.arrivals) == 6
+        gaps = [b - a for a, b in zip(site.arrivals, site.arrivals[1:])]
+        assert min(gaps) >= 1 / RATE_PER_HOST * 0.8
+
+    # Slow responses overlapped, but never beyond max_workers
+    assert in_flight.peak == scraper.max_workers
+
+
+def test_run_concurrently_bounds_threads_and_keeps_order():
+    lock = threading.Lock()
+    active, peak = 0, 0
+
+    def job(n):
+        nonlocal active, peak
+        with lock:
+            active += 1
+            peak = max(peak, active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+        if n == 5:
+            raise ValueError("bad page")
+        return n * n
+
+    results = run_concurrently(job, range(12), max_workers=3)
+
+    assert results == [n * n if n != 5 else None for n in range(12)]
+    assert peak == 3
+
+
+def test_token_bucket_paces_to_its_rate():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=2.0, capacity=1.0, clock=lambda: now[0], sleep=sleep)
+
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(0.5)
+    now[0] += 5.0  # idle time banks at most `capacity` tokens
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(0.5)
+    assert sleeps == [pytest.approx(0.5), pytest.approx(0.5)]
+
+
+def test_hosts_are_limited_independently():
+    limiter = HostRateLimiter(rate_per_host=1.0, host_rates={'slow.example.com': 0.1})
+
+    assert limiter.bucket('https://a.example.com/x') is limiter.bucket('https://A.example.com/y')
+    assert limiter.bucket('https://a.example.com/x') is not limiter.bucket('https://b.example.com/x')
+    assert limiter.bucket('https://slow.example.com/').rate == 0.1
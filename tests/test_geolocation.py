@@ -0,0 +1,171 @@
+"""
+Listing distances and the city gazetteer
+"""
+
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+import geolocation
+from database import DatabaseManager, MarketPrice, MarketPriceRepository
+from geolocation import (REFERENCE_LOCATIONS, _normalize_place, get_city_coordinates, get_closest_distance,
+                         haversine_distance, update_listing_distances)
+
+
+GAZETTEER = """city,state,latitude,longitude,aliases
+Saint Helena,CA,38.5052,-122.4703,
+Mount Shasta,CA,41.3099,-122.3106,Mt. Shasta City
+Fort Bragg,CA,39.4457,-123.8053,
+Fresno,CA,36.7378,-119.7871,
+San Francisco,CA,37.7749,-122.4194,SF|San Fran
+Reno,NV,39.5296,-119.8138,
+"""
+
+
+class CountingConnection:
+    """Wraps a connection to count the statements update_listing_distances sends"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.calls = []
+
+    def execute(self, sql, *args):
+        self.calls.append('execute')
+        return self.conn.execute(sql, *args)
+
+    def executemany(self, sql, rows):
+        self.calls.append('executemany')
+        return self.conn.executemany(sql, rows)
+
+
+def listing_rows(db):
+    return {row['id']: row for row in db.execute_query(
+        "SELECT id, city, state, latitude, longitude, distance_miles FROM market_prices")}
+
+
+def test_distances_are_recomputed_in_one_write(db):
+    with db.get_connection() as conn:
+        counting = CountingConnection(conn)
+        stats = update_listing_distances(counting)
+
+    rows = listing_rows(db)
+    assert counting.calls == ['execute', 'executemany']
+    assert stats['updated'] == stats['newly_calculated'] == len(rows)
+    assert stats['failed'] == stats['cleared'] == 0
+    for row in rows.values():
+        assert row['distance_miles'] == pytest.approx(get_closest_distance(row['city'], row['state']))
+
+
+def test_stored_coordinates_win_over_the_city(db):
+    vehicle_id = db.execute_query("SELECT id FROM vehicles LIMIT 1")[0]['id']
+    point = (36.6002, -121.8947)  # Monterey, listed with a San Jose city
+    [listing_id] = MarketPriceRepository(db).add_listings_bulk([MarketPrice(
+        vehicle_id=vehicle_id, listing_date='2026-01-20', mileage=1000, asking_price=30000,
+        city='San Jose', state='CA', latitude=point[0], longitude=point[1])])
+
+    with db.get_connection() as conn:
+        update_listing_distances(conn)
+
+    row = listing_rows(db)[listing_id]
+    assert (row['latitude'], row['longitude']) == point
+    assert row['distance_miles'] == pytest.approx(
+        min(haversine_distance(*point, *ref) for ref in REFERENCE_LOCATIONS.values()))
+
+
+def test_listings_that_no_longer_geocode_are_cleared(db):
+    with db.get_connection() as conn:
+        update_listing_distances(conn)
+        # Cities the gazetteer cannot place, still carrying distances from an older run
+        conn.execute("UPDATE market_prices SET city = 'Atlantis', latitude = NULL, longitude = NULL "
+                     "WHERE id IN (SELECT id FROM market_prices ORDER BY id LIMIT 3)")
+        conn.execute("UPDATE market_prices SET city = 'Lemuria', latitude = NULL, longitude = NULL, "
+                     "distance_miles = NULL WHERE id = (SELECT MAX(id) FROM market_prices)")
+        stats = update_listing_distances(conn)
+
+    rows = listing_rows(db)
+    assert stats['failed'] == 4 and stats['cleared'] == 3
+    assert stats['updated'] == len(rows) - 4 and stats['newly_calculated'] == 0
+    assert stats['failed_cities'] == sorted({f"{row['city']}, {row['state']}" for row in rows.values()
+                                             if row['city'] in ('Atlantis', 'Lemuria')})
+    assert sum(row['distance_miles'] is None for row in rows.values()) == 4
+
+
+def test_migration_backfills_coordinates_from_the_city(tmp_path):
+    path = tmp_path / 'baseline.db'
+    conn = sqlite3.connect(path)
+    conn.executescript((Path(__file__).parent.parent / 'database_schema.sql').read_text())
+    conn.execute("INSERT INTO vehicles (make, model, year) VALUES ('Toyota', 'Tacoma', 2019)")
+    conn.executemany(
+        "INSERT INTO market_prices (vehicle_id, listing_date, mileage, asking_price, city, state) "
+        "VALUES (1, '2026-01-01', 40000, 30000, ?, ?)",
+        [('Fresno', 'CA'), ('Reno', 'NV'), ('Atlantis', 'CA'), ('', 'CA')]
+    )
+    conn.commit()
+    conn.close()
+
+    manager = DatabaseManager(str(path))
+    try:
+        rows = manager.execute_query("SELECT id, city, state, latitude, longitude FROM market_prices ORDER BY id")
+        geo = {row['id'] for row in manager.execute_query("SELECT id FROM market_prices_geo")}
+    finally:
+        manager.close()
+
+    for row in rows[:2]:
+        assert (row['latitude'], row['longitude']) == get_city_coordinates(row['city'], row['state'])
+    assert all(row['latitude'] is None for row in rows[2:])
+    assert geo == {rows[0]['id'], rows[1]['id']}
+
+
+@pytest.fixture
+def gazetteer(tmp_path, monkeypatch):
+    """A small stand-in city_coordinates.csv, loaded fresh for the test"""
+    path = tmp_path / 'city_coordinates.csv'
+    path.write_text(GAZETTEER)
+    monkeypatch.setattr(geolocation, 'GAZETTEER_PATH', path)
+    monkeypatch.setattr(geolocation, '_gazetteer', None)
+    monkeypatch.setattr(geolocation, '_gazetteer_names', None)
+    geolocation._fuzzy_city_lookup.cache_clear()
+    yield
+    geolocation._fuzzy_city_lookup.cache_clear()
+
+
+@pytest.mark.parametrize('name, key', [
+    ('St. Helena', 'saint helena'), ('ST HELENA', 'saint helena'), ('Mt. Shasta', 'mount shasta'),
+    ('Ft Bragg', 'fort bragg'), ("Coeur d'Alene", 'coeur dalene'), ('  San   Jose ', 'san jose'),
+    ('Stanton', 'stanton'),
+])
+def test_place_names_normalize_to_one_key(name, key):
+    assert _normalize_place(name) == key
+
+
+@pytest.mark.parametrize('city, state', [
+    ('Saint Helena', 'CA'), ('St. Helena', 'CA'), ('st helena', 'california'), ('ST. HELENA', ' ca '),
+])
+def test_spellings_and_state_names_share_coordinates(gazetteer, city, state):
+    assert get_city_coordinates(city, state) == (38.5052, -122.4703)
+
+
+def test_aliases_resolve_to_their_city(gazetteer):
+    san_francisco = get_city_coordinates('San Francisco', 'CA')
+    assert get_city_coordinates('SF', 'CA') == get_city_coordinates('san fran', 'California') == san_francisco
+    # Aliases are normalized like city names
+    assert get_city_coordinates('Mount Shasta City', 'CA') == (41.3099, -122.3106)
+
+
+@pytest.mark.parametrize('city, state, expected', [
+    ('Fresnoo', 'CA', (36.7378, -119.7871)),    # ratio 0.92
+    ('St. Helen', 'CA', (38.5052, -122.4703)),  # 0.96 once expanded
+    ('Frezno', 'CA', None),                     # 0.83, under the 0.85 cutoff
+    ('Fres', 'CA', None),                       # 0.80
+    ('Fresnoo', 'NV', None),                    # only cities in the same state match
+    ('Renoo', 'Nevada', (39.5296, -119.8138)),
+])
+def test_fuzzy_matches_need_a_close_spelling_in_the_same_state(gazetteer, city, state, expected):
+    assert get_city_coordinates(city, state) == expected
+
+
+def test_unknown_places_do_not_geocode(gazetteer):
+    assert get_city_coordinates('', 'CA') is None
+    assert get_city_coordinates('Atlantis', 'CA') is None
+    assert get_city_coordinates('Fresno', 'ZZ') is None
@@ -0,0 +1,141 @@
+"""
+HTTP cache: conditional revalidation, TTL classes, LRU eviction and parse memos
+"""
+
+import time
+
+import pytest
+
+from base_scraper import BaseScraper
+from fixtures import RecordedResponse
+from http_cache import HTTPCache, CachedResponse
+
+
+URL = 'https://sfbay.craigslist.org/search/cta?query=tacoma'
+
+
+class StandInSite:
+    """Transport answering from a queue of (status, headers, body); records request headers"""
+
+    live = True
+
+    def __init__(self, *responses, before_response=None):
+        self.responses = list(responses)
+        self.requests = []
+        self.before_response = before_response
+
+    def get(self, url, headers):
+        self.requests.append(dict(headers))
+        if self.before_response:
+            self.before_response()
+        status, response_headers, body = self.responses.pop(0)
+        return RecordedResponse(url, status, response_headers, body)
+
+
+@pytest.fixture
+def scraper(tmp_path):
+    scraper = BaseScraper(delay_min=0, delay_max=1, cache_dir=str(tmp_path / 'cache'))
+    yield scraper
+    scraper.cache.close()
+
+
+def expire(cache, url):
+    cache.conn.execute("UPDATE responses SET validated_at = 0 WHERE url = ?", (url,))
+    cache.conn.commit()
+
+
+def test_conditional_headers_come_from_the_validators():
+    entry = CachedResponse(URL, 'search', b'', '"abc"', 'Tue, 01 Sep 2026 10:00:00 GMT', 0)
+    assert entry.conditional_headers() == {'If-None-Match': '"abc"',
+                                           'If-Modified-Since': 'Tue, 01 Sep 2026 10:00:00 GMT'}
+    assert CachedResponse(URL, 'search', b'', None, None, 0).conditional_headers() == {}
+
+
+def test_fresh_pages_are_served_without_a_request(scraper):
+    scraper.transport = StandInSite((200, {'ETag': '"v1"'}, b'<html>v1</html>'))
+
+    assert scraper.fetch_body(URL) == (b'<html>v1</html>', True)
+    assert scraper.fetch_body(URL) == (b'<html>v1</html>', False)
+    assert len(scraper.transport.requests) == 1
+
+
+def test_stale_pages_are_revalidated_with_a_304(scraper):
+    scraper.transport = StandInSite((200, {'ETag': '"v1"'}, b'<html>v1</html>'),
+                                    (304, {}, b''))
+    scraper.fetch_body(URL)
+    expire(scraper.cache, URL)
+
+    assert scraper.fetch_body(URL) == (b'<html>v1</html>', False)
+    assert scraper.transport.requests[-1]['If-None-Match'] == '"v1"'
+    assert scraper.cache.is_fresh(scraper.cache.get(URL))
+
+
+def test_changed_pages_replace_the_body_and_drop_parse_memos(scraper):
+    scraper.transport = StandInSite((200, {'ETag': '"v1"'}, b'v1'), (200, {'ETag': '"v2"'}, b'v2'))
+    assert scraper.fetch_parsed(URL, lambda body: body.decode()) == 'v1'
+    expire(scraper.cache, URL)
+
+    assert scraper.fetch_parsed(URL, lambda body: body.decode()) == 'v2'
+    assert scraper.cache.get(URL).etag == '"v2"'
+
+
+def test_ttl_depends_on_the_url_class(tmp_path):
+    cache = HTTPCache(str(tmp_path), ttls={'search': 60})
+    cache.store('https://a/search', 'search', b'x')
+    cache.store('https://a/detail', 'detail', b'x')
+    cache.conn.execute("UPDATE responses SET validated_at = ?", (time.time() - 3600,))
+    cache.conn.commit()
+
+    assert not cache.is_fresh(cache.get('https://a/search'))
+    assert cache.is_fresh(cache.get('https://a/detail'))  # a week by default
+    cache.close()
+
+
+def test_least_recently_used_pages_are_evicted_first(tmp_path):
+    cache = HTTPCache(str(tmp_path), max_bytes=10 ** 9)
+    for name in ('a', 'b', 'c'):
+        cache.store(f'https://x/{name}', 'page', name.encode() * 1000)
+        time.sleep(0.01)
+    cache.get('https://x/a')  # 'b' is now the least recently used
+    cache.store_parsed('https://x/b', 'parse@v1', ['memo'])
+
+    cache.max_bytes = cache.stats()['bytes'] - 1
+    cache.store('https://x/c', 'page', b'c' * 1000)
+
+    assert cache.get('https://x/b') is None
+    assert cache.get('https://x/a') is not None and cache.get('https://x/c') is not None
+    assert cache.conn.execute("SELECT COUNT(*) FROM parsed").fetchone()[0] == 0
+    cache.close()
+
+
+def test_304_without_a_cached_copy_is_refetched(scraper):
+    scraper.transport = StandInSite((304, {}, b''), (200, {'ETag': '"v1"'}, b'<html>v1</html>'))
+
+    assert scraper.fetch_body(URL) == (b'<html>v1</html>', True)
+    assert 'If-None-Match' not in scraper.transport.requests[-1]
+    assert scraper.cache.get(URL).body == b'<html>v1</html>'
+
+
+def test_repeated_304_without_a_cached_copy_is_never_cached(scraper, monkeypatch):
+    monkeypatch.setattr('base_scraper.time.sleep', lambda seconds: None)
+    scraper.transport = StandInSite(*[(304, {}, b'')] * 6)
+
+    assert scraper.fetch_body(URL) is None
+    assert scraper.cache.get(URL) is None
+
+
+def test_304_after_eviction_keeps_the_page_cached(scraper):
+    scraper.transport = StandInSite((200, {'ETag': '"v1"'}, b'<html>v1</html>'))
+    scraper.fetch_body(URL)
+    expire(scraper.cache, URL)
+
+    def evict():
+        scraper.cache.conn.execute("DELETE FROM responses")
+        scraper.cache.conn.commit()
+
+    scraper.transport = StandInSite((304, {}, b''), before_response=evict)
+
+    assert scraper.fetch_body(URL) == (b'<html>v1</html>', False)
+    entry = scraper.cache.get(URL)
+    assert entry.body == b'<html>v1</html>' and entry.etag == '"v1"'
+    assert scraper.cache.is_fresh(entry)
@@ -0,0 +1,203 @@
+"""
+Persistent scrape job queue: leases, retries, resume and the run load lease
+"""
+
+import sqlite3
+
+import pytest
+
+from job_queue import ScrapeJobQueue
+from master_scraper import MasterScraper
+
+
+TASKS = [
+    {'source': 'craigslist', 'region': 'sfbay', 'make': 'Toyota', 'model': 'Tacoma', 'year': 2021},
+    {'source': 'craigslist', 'region': 'fresno', 'make': 'Toyota', 'model': 'Tacoma', 'year': 2021},
+    {'source': 'google', 'make': 'Lexus', 'model': 'GX', 'year': 2016, 'params': {'location': 'CA'}},
+]
+
+
+@pytest.fixture
+def queue_path(tmp_path):
+    return str(tmp_path / 'jobs.db')
+
+
+def drain(queue, run_id, worker='w1'):
+    while True:
+        task = queue.claim(run_id, worker)
+        if task is None:
+            return
+        queue.complete(task, worker, [{'region': task['region'], 'page': task['page']}])
+
+
+def test_claims_follow_task_order_and_are_exclusive(queue_path):
+    queue = ScrapeJobQueue(queue_path)
+    assert queue.create_run('run', 'all', TASKS) == 3
+
+    first, second = queue.claim('run', 'w1'), queue.claim('run', 'w2')
+    assert (first['region'], second['region']) == ('sfbay', 'fresno')
+    assert first['attempts'] == 1 and first['lease_owner'] is None
+
+    third = queue.claim('run', 'w1')
+    assert third['params'] == {'location': 'CA'}
+    assert queue.claim('run', 'w1') is None
+    assert queue.progress('run') == {'pending': 0, 'leased': 3, 'done': 0, 'failed': 0}
+
+
+def test_expired_lease_is_claimed_by_another_worker(queue_path):
+    queue = ScrapeJobQueue(queue_path, lease_seconds=-1)
+    queue.create_run('run', 'all', TASKS[:1])
+
+    stale = queue.claim('run', 'w1')
+    retried = queue.claim('run', 'w2')
+    assert retried['id'] == stale['id'] and retried['attempts'] == 2
+
+    # The first worker lost its lease, so its late result is dropped
+    assert not queue.complete(stale, 'w1', ['late'])
+    assert queue.complete(retried, 'w2', ['fresh'])
+    assert queue.results('run', 'craigslist') == ['fresh']
+
+
+def test_expired_lease_past_max_attempts_fails(queue_path):
+    queue = ScrapeJobQueue(queue_path, lease_seconds=-1, max_attempts=2)
+    queue.create_run('run', 'all', TASKS[:1])
+
+    queue.claim('run', 'w1')
+    queue.claim('run', 'w2')
+    assert queue.claim('run', 'w3') is None
+    assert queue.progress('run')['failed'] == 1
+
+
+def test_failed_tasks_retry_until_max_attempts(queue_path):
+    queue = ScrapeJobQueue(queue_path, max_attempts=2)
+    queue.create_run('run', 'all', TASKS[:1])
+
+    queue.fail(queue.claim('run', 'w1'), 'w1', 'HTTP 503')
+    assert queue.progress('run')['pending'] == 1
+
+    queue.fail(queue.claim('run', 'w1'), 'w1', 'HTTP 503')
+    assert queue.progress('run') == {'pending': 0, 'leased': 0, 'done': 0, 'failed': 1}
+    assert queue.claim('run', 'w1') is None
+
+
+def test_released_task_keeps_its_attempts(queue_path):
+    queue = ScrapeJobQueue(queue_path, max_attempts=1)
+    queue.create_run('run', 'all', TASKS[:1])
+
+    queue.release(queue.claim('run', 'w1'), 'w1')
+    task = queue.claim('run', 'w2')
+    assert task['attempts'] == 1
+
+
+def test_follow_ups_are_queued_with_the_checkpoint(queue_path):
+    queue = ScrapeJobQueue(queue_path)
+    queue.create_run('run', 'all', TASKS[:1])
+
+    task = queue.claim('run', 'w1')
+    next_page = {**TASKS[0], 'page': 120}
+    assert queue.complete(task, 'w1', [{'page': 0}], follow_ups=[next_page])
+
+    follow_up = queue.claim('run', 'w1')
+    assert follow_up['page'] == 120
+    queue.complete(follow_up, 'w1', [{'page': 120}])
+    assert queue.results('run', 'craigslist') == [{'page': 0}, {'page': 120}]
+
+
+def test_rerun_resumes_without_repeating_finished_tasks(queue_path):
+    queue = ScrapeJobQueue(queue_path)
+    queue.create_run('run', 'all', TASKS)
+    queue.complete(queue.claim('run', 'w1'), 'w1', [{'region': 'sfbay', 'page': 0}])
+    queue.release(queue.claim('run', 'w1'), 'w1')  # interrupted mid-task
+
+    # A new process with the same run id picks up where the last one stopped
+    resumed = ScrapeJobQueue(queue_path)
+    assert resumed.create_run('run', 'all', TASKS) == 0
+    assert resumed.progress('run') == {'pending': 2, 'leased': 0, 'done': 1, 'failed': 0}
+
+    drain(resumed, 'run')
+    assert [r['region'] for r in resumed.results('run', 'craigslist')] == ['sfbay', 'fresno']
+
+
+def test_load_is_claimable_only_once_every_task_settles(queue_path):
+    queue = ScrapeJobQueue(queue_path)
+    queue.create_run('run', 'all', TASKS)
+    assert not queue.claim_load('run', 'loader')
+
+    drain(queue, 'run')
+    assert queue.claim_load('run', 'loader')
+    assert not queue.claim_load('run', 'other')
+
+    assert queue.finish_load('run', 'loader')
+    assert queue.is_loaded('run')
+    assert not queue.claim_load('run', 'other')
+
+
+def test_failed_load_can_be_claimed_again(queue_path):
+    queue = ScrapeJobQueue(queue_path)
+    queue.create_run('run', 'all', TASKS)
+    drain(queue, 'run')
+
+    assert queue.claim_load('run', 'loader')
+    queue.release_load('run', 'loader')
+    assert not queue.is_loaded('run')
+    assert queue.claim_load('run', 'retry')
+    assert not queue.finish_load('run', 'loader')
+    assert queue.finish_load('run', 'retry')
+
+
+def test_crashed_load_is_claimable_after_its_lease_expires(queue_path):
+    ScrapeJobQueue(queue_path).create_run('run', 'all', TASKS)
+    drain(ScrapeJobQueue(queue_path), 'run')
+
+    # The loading process died without releasing its lease
+    assert ScrapeJobQueue(queue_path, load_lease_seconds=-1).claim_load('run', 'crashed')
+    assert ScrapeJobQueue(queue_path).claim_load('run', 'rerun')
+    assert not ScrapeJobQueue(queue_path).claim_load('run', 'third')
+
+
+def test_existing_queue_gains_load_lease_columns(queue_path):
+    conn = sqlite3.connect(queue_path)
+    conn.execute("CREATE TABLE scrape_runs (run_id TEXT PRIMARY KEY, phase TEXT, "
+                 "created_at REAL NOT NULL, loaded_at REAL)")
+    conn.commit()
+    conn.close()
+
+    queue = ScrapeJobQueue(queue_path)
+    queue.create_run('run', 'all', [])
+    assert queue.claim_load('run', 'loader')
+
+
+class FlakyLoader:
+    """Stands in for DataLoader: the first load hits a database error"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def load_batches(self, listings):
+        self.calls += 1
+        if self.calls == 1:
+            raise sqlite3.OperationalError("database is locked")
+        listings = list(listings)
+        return {'total': len(listings), 'loaded': len(listings), 'skipped': 0, 'errors': 0}
+
+
+def test_run_with_a_failed_load_is_loaded_on_rerun(queue_path, monkeypatch):
+    scraper = MasterScraper.__new__(MasterScraper)
+    scraper.job_queue = ScrapeJobQueue(queue_path)
+    scraper.data_loader = FlakyLoader()
+    scraper.target_vehicles, scraper.craigslist_regions = [], []
+    monkeypatch.setattr(scraper, 'plan_tasks', lambda phase: TASKS[:1])
+    monkeypatch.setattr(scraper, 'work', lambda run_id, workers: drain(scraper.job_queue, run_id))
+    monkeypatch.setattr(scraper, 'save_master_results', lambda results: None)
+    monkeypatch.setattr(scraper, 'print_summary', lambda results: None)
+
+    with pytest.raises(sqlite3.OperationalError):
+        scraper.run_full_scrape(run_id='run')
+    assert not scraper.job_queue.is_loaded('run')
+
+    scraper.run_full_scrape(run_id='run')
+    assert scraper.data_loader.calls == 2
+    assert scraper.job_queue.is_loaded('run')
+
+    scraper.run_full_scrape(run_id='run')
+    assert scraper.data_loader.calls == 2
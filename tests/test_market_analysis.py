@@ -0,0 +1,222 @@
+"""
+Market analysis: vectorized and SQL paths against plain Python computations
+"""
+
+import math
+import statistics
+from collections import defaultdict
+
+import pytest
+
+from database import MarketPrice, MarketPriceRepository
+from geolocation import REGION_CENTROIDS, haversine_distance
+from market_analysis import MarketAnalyzer, TRANSPORT_COST_PER_MILE
+
+
+MODELS = [('Toyota', 'Tacoma'), ('Lexus', 'GX'), ('Tesla', 'Model Y'), ('Honda', 'Civic'), ('Ford', 'F-150')]
+
+
+@pytest.fixture
+def market(db):
+    """The seeded database with a few sales recorded"""
+    with db.get_connection() as conn:
+        conn.execute("UPDATE market_prices SET sold = 1, sale_price = asking_price - 750 WHERE id % 5 = 0")
+    return db
+
+
+def listings_by_region(db, make, model, year=None):
+    """Baseline: {region: [listing rows]} for one make/model, fetched vehicle by vehicle"""
+    regional = defaultdict(list)
+    for vehicle in db.execute_query("SELECT id, year FROM vehicles WHERE make = ? AND model = ?", (make, model)):
+        if year and vehicle['year'] != year:
+            continue
+        for listing in db.execute_query("SELECT * FROM market_prices WHERE vehicle_id = ?", (vehicle['id'],)):
+            if listing['region']:
+                regional[listing['region']].append(listing)
+    return regional
+
+
+def quartiles(values):
+    if len(values) == 1:
+        return values[0], values[0]
+    q = statistics.quantiles(values, n=4, method='inclusive')
+    return q[0], q[2]
+
+
+def baseline_regional_stats(listings):
+    prices = [l['asking_price'] for l in listings]
+    sales = [l['sale_price'] for l in listings if l['sold'] and l['sale_price']]
+    p25, p75 = quartiles(prices)
+    return {
+        'listing_count': len(prices),
+        'avg_asking_price': round(statistics.mean(prices), 0),
+        'median_asking_price': round(statistics.median(prices), 0),
+        'p25_asking_price': round(p25, 0),
+        'p75_asking_price': round(p75, 0),
+        'min_price': round(min(prices), 0),
+        'max_price': round(max(prices), 0),
+        'price_std_dev': round(statistics.stdev(prices), 0) if len(prices) > 1 else 0,
+        'avg_mileage': round(statistics.mean(l['mileage'] for l in listings), 0),
+        'sold_count': len(sales),
+        'avg_sale_price': round(statistics.mean(sales), 0) if sales else None,
+        'median_sale_price': round(statistics.median(sales), 0) if sales else None,
+    }
+
+
+@pytest.mark.parametrize('year', [None, 2021])
+def test_bulk_regional_pricing_matches_the_per_region_loop(market, year):
+    analyzer = MarketAnalyzer(market)
+    bulk = analyzer.analyze_regional_pricing_bulk(MODELS, year)
+
+    assert bulk[('Ford', 'F-150')] == {'error': 'No vehicles found'}
+    for make, model in MODELS[:-1]:
+        regional = listings_by_region(market, make, model, year)
+        result = bulk[(make, model)]
+        if year and not regional:
+            assert result == {'error': 'No vehicles found'}
+            continue
+
+        assert result['regional_stats'].keys() == regional.keys()
+        for region, listings in regional.items():
+            assert result['regional_stats'][region] == pytest.approx(baseline_regional_stats(listings))
+        assert result == analyzer.analyze_regional_pricing(make, model, year)
+
+        if len(regional) > 1:
+            averages = {region: stats['avg_asking_price'] for region, stats in result['regional_stats'].items()}
+            spread = result['arbitrage_opportunity']
+            assert spread['buy_price'] == min(averages.values())
+            assert spread['sell_price'] == max(averages.values())
+
+
+@pytest.fixture
+def odd_regions(market):
+    """Listings in a region only known from its listings, one with no centroid, one with no region"""
+    vehicle_id = market.execute_query("SELECT id FROM vehicles WHERE model = 'Tacoma' AND year = 2021")[0]['id']
+    listing = dict(vehicle_id=vehicle_id, listing_date='2026-01-20', mileage=30000, asking_price=41000)
+    MarketPriceRepository(market).add_listings_bulk([
+        MarketPrice(**listing, region='Redding', latitude=40.5865, longitude=-122.3917),
+        MarketPrice(**listing, region='Redding', latitude=40.6, longitude=-122.4),
+        MarketPrice(**listing, region='Atlantis'),
+        MarketPrice(**listing),
+    ])
+    return market
+
+
+def baseline_arbitrage(db, cost_per_mile, min_listings):
+    """Pairwise spreads computed one vehicle and one region pair at a time"""
+    rows = db.execute_query("""
+        SELECT v.make, v.model, v.year, mp.region, mp.asking_price, mp.mileage, mp.latitude, mp.longitude
+        FROM market_prices mp JOIN vehicles v ON mp.vehicle_id = v.id
+    """)
+
+    located = defaultdict(list)
+    for row in rows:
+        if row['region'] and row['latitude'] is not None:
+            located[row['region']].append((row['latitude'], row['longitude']))
+    centroids = dict(REGION_CENTROIDS)
+    for region, points in located.items():
+        centroids[region] = (statistics.mean(p[0] for p in points), statistics.mean(p[1] for p in points))
+
+    by_vehicle = defaultdict(list)
+    for row in rows:
+        if row['region'] in centroids:
+            by_vehicle[(row['make'], row['model'], row['year'])].append(row)
+
+    spreads = {}
+    for vehicle, listings in by_vehicle.items():
+        mileages = [l['mileage'] or 0 for l in listings]
+        prices = [l['asking_price'] for l in listings]
+        mean_mileage, mean_price = statistics.mean(mileages), statistics.mean(prices)
+        sxx = sum((m - mean_mileage) ** 2 for m in mileages)
+        sxy = sum((m - mean_mileage) * (p - mean_price) for m, p in zip(mileages, prices))
+        slope = min(sxy / sxx, 0.0) if len(listings) >= 3 and sxx > 0 else 0.0
+
+        by_region = defaultdict(list)
+        for listing, mileage, price in zip(listings, mileages, prices):
+            by_region[listing['region']].append(price - slope * (mileage - mean_mileage))
+        averages = {region: statistics.mean(p) for region, p in by_region.items() if len(p) >= min_listings}
+
+        for buy, buy_price in averages.items():
+            for sell, sell_price in averages.items():
+                cost = haversine_distance(*centroids[buy], *centroids[sell]) * cost_per_mile
+                spreads[(vehicle, buy, sell)] = sell_price - buy_price - cost
+    return spreads, centroids
+
+
+@pytest.mark.parametrize('cost_per_mile, min_listings', [(TRANSPORT_COST_PER_MILE, 1), (0.0, 1), (1.5, 3)])
+def test_arbitrage_matrix_matches_pairwise_spreads(odd_regions, cost_per_mile, min_listings):
+    matrix = MarketAnalyzer(odd_regions).build_arbitrage_matrix(cost_per_mile, min_listings)
+    expected, centroids = baseline_arbitrage(odd_regions, cost_per_mile, min_listings)
+
+    assert 'Redding' in matrix['regions'] and 'Atlantis' not in matrix['regions']
+    assert matrix['excluded_listings'] == 2
+    for region, centroid in matrix['centroids'].items():
+        assert centroid == pytest.approx(centroids[region])
+
+    spreads = {}
+    for v, vehicle in enumerate(matrix['vehicles']):
+        for b, buy in enumerate(matrix['regions']):
+            for s, sell in enumerate(matrix['regions']):
+                if not math.isnan(matrix['spread'][v, b, s]):
+                    spreads[(vehicle, buy, sell)] = float(matrix['spread'][v, b, s])
+    assert expected and spreads.keys() == expected.keys()
+    for key, spread in expected.items():
+        assert spreads[key] == pytest.approx(spread)
+
+
+def test_opportunities_are_the_largest_spreads(odd_regions):
+    opportunities = MarketAnalyzer(odd_regions).find_arbitrage_opportunities(limit=10)
+    expected, _ = baseline_arbitrage(odd_regions, TRANSPORT_COST_PER_MILE, 1)
+    best = sorted((spread for spread in expected.values() if spread > 0), reverse=True)[:10]
+
+    assert [o['potential_profit'] for o in opportunities] == [round(spread, 0) for spread in best]
+    for o in opportunities:
+        spread = expected[((o['make'], o['model'], o['year']), o['buy_from'], o['sell_to'])]
+        assert o['potential_profit'] == round(spread, 0)
+
+
+def baseline_underpriced(db, threshold_pct):
+    """{listing id: (peer avg, peer count, z-score, percentile)} for unsold listings under the threshold"""
+    rows = db.execute_query("""
+        SELECT mp.id, mp.asking_price, mp.sold, v.make, v.model, v.year
+        FROM market_prices mp JOIN vehicles v ON mp.vehicle_id = v.id
+    """)
+    peers = defaultdict(list)
+    for row in rows:
+        peers[(row['make'], row['model'], row['year'])].append(row['asking_price'])
+
+    expected = {}
+    for row in rows:
+        prices = peers[(row['make'], row['model'], row['year'])]
+        avg = statistics.mean(prices)
+        if row['sold'] or (row['asking_price'] - avg) / avg * 100 > -threshold_pct:
+            continue
+        std = statistics.stdev(prices) if len(prices) > 1 else 0
+        z = (row['asking_price'] - avg) / std if std else None
+        # PERCENT_RANK: share of the other peers priced strictly lower
+        below = sum(price < row['asking_price'] for price in prices)
+        percentile = below / (len(prices) - 1) if len(prices) > 1 else 0.0
+        expected[row['id']] = (avg, len(prices), z, percentile)
+    return expected
+
+
+@pytest.mark.parametrize('threshold_pct', [0, 10, 25])
+def test_underpriced_listings_match_peer_statistics(market, threshold_pct):
+    # A tie, so percentile ranks of equal prices are covered too
+    with market.get_connection() as conn:
+        conn.execute("UPDATE market_prices SET asking_price = "
+                     "(SELECT MIN(asking_price) FROM market_prices) WHERE id IN (2, 3)")
+    expected = baseline_underpriced(market, threshold_pct)
+
+    found = MarketAnalyzer(market).find_underpriced_listings(threshold_pct)
+
+    assert expected and {l['listing_id'] for l in found} == expected.keys()
+    for listing in found:
+        avg, count, z, percentile = expected[listing['listing_id']]
+        assert listing['market_avg'] == round(avg, 0)
+        assert listing['peer_count'] == count
+        assert listing['savings_pct'] == pytest.approx((avg - listing['asking_price']) / avg * 100, abs=0.05)
+        assert listing['z_score'] == (round(z, 2) if z is not None else None)
+        assert listing['price_percentile'] == round(percentile * 100, 1)
+    savings = [listing['savings_pct'] for listing in found]
+    assert savings == sorted(savings, reverse=True)
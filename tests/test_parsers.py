@@ -0,0 +1,85 @@
+"""
+Scraper parse paths on the committed synthetic corpus
+"""
+
+from urllib.parse import urlparse
+
+import pytest
+
+from craigslist_scraper import CraigslistScraper
+from fixtures import iter_corpus
+from google_scraper import GoogleScraper
+from html_backend import LXML_AVAILABLE
+from http_cache import HTTPCache
+from synthetic_corpus import SYNTHETIC_CORPUS_PATH
+
+
+def corpus_pages(kind):
+    for response in iter_corpus(SYNTHETIC_CORPUS_PATH):
+        host, path = urlparse(response.url).netloc, urlparse(response.url).path
+        if kind == 'search' and '/search/' in path and host.endswith('craigslist.org'):
+            yield response
+        elif kind == 'detail' and '/cto/' in path:
+            yield response
+        elif kind == 'google' and 'google.' in host:
+            yield response
+
+
+def scrapers(cls):
+    """The same scraper with each HTML backend"""
+    fast, fallback = cls(cache_dir=None), cls(cache_dir=None)
+    fast.parser_backend, fallback.parser_backend = 'lxml', 'html.parser'
+    return fast, fallback
+
+
+@pytest.mark.skipif(not LXML_AVAILABLE, reason="lxml is not installed")
+def test_craigslist_search_spec_matches_html_parser():
+    fast, fallback = scrapers(CraigslistScraper)
+    pages = list(corpus_pages('search'))
+    assert pages
+
+    for response in pages:
+        region = urlparse(response.url).netloc.split('.')[0]
+        expected = fallback.parse_search_body(response.content, region)
+        assert expected['results']
+        assert fast.parse_search_body(response.content, region) == expected
+
+
+@pytest.mark.skipif(not LXML_AVAILABLE, reason="lxml is not installed")
+def test_craigslist_detail_matches_html_parser():
+    fast, fallback = scrapers(CraigslistScraper)
+    for response in corpus_pages('detail'):
+        expected = fallback.parse_detail_page(fallback.parse_html(response.content), response.url)
+        assert expected['title'] and expected['mileage']
+        assert fast.parse_detail_page(fast.parse_html(response.content), response.url) == expected
+
+
+@pytest.mark.skipif(not LXML_AVAILABLE, reason="lxml is not installed")
+def test_google_results_spec_matches_html_parser():
+    fast, fallback = scrapers(GoogleScraper)
+    for response in corpus_pages('google'):
+        expected = fallback.parse_search_body(response.content, 'Toyota', 'Tacoma', 2021)
+        assert expected
+        assert fast.parse_search_body(response.content, 'Toyota', 'Tacoma', 2021) == expected
+
+
+def test_parsed_results_are_reused_until_the_parser_version_changes(tmp_path):
+    scraper = CraigslistScraper(cache_dir=None)
+    scraper.replay(SYNTHETIC_CORPUS_PATH)
+    scraper.cache = HTTPCache(str(tmp_path / 'cache'))
+    url = next(corpus_pages('search')).url
+
+    calls = []
+
+    def parse(body):
+        calls.append(len(body))
+        return {'size': len(body)}
+
+    first = scraper.fetch_parsed(url, parse)
+    assert scraper.fetch_parsed(url, parse) == first
+    assert len(calls) == 1
+
+    scraper.PARSER_VERSION += 1
+    assert scraper.fetch_parsed(url, parse) == first
+    assert len(calls) == 2
+    scraper.cache.close()
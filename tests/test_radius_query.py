@@ -0,0 +1,84 @@
+"""
+Radius queries (R*Tree bounding box + haversine) against a brute-force scan
+"""
+
+import random
+
+import pytest
+
+from database import MarketPrice, MarketPriceRepository
+from geolocation import haversine_distance
+
+
+CENTERS = [(36.9741, -122.0308), (37.3382, -121.8863), (34.0522, -118.2437), (47.6062, -122.3321)]
+
+
+@pytest.fixture
+def scattered(db):
+    """The seeded listings plus a few hundred at random points along the West Coast"""
+    rng = random.Random(11)
+    vehicle_id = db.execute_query("SELECT id FROM vehicles LIMIT 1")[0]['id']
+    listings = [MarketPrice(vehicle_id=vehicle_id, listing_date='2026-01-20', mileage=50000,
+                            asking_price=30000, latitude=rng.uniform(32.5, 48.5),
+                            longitude=rng.uniform(-124.5, -114.0), source='test')
+                for _ in range(400)]
+    listings.append(MarketPrice(vehicle_id=vehicle_id, listing_date='2026-01-20', mileage=50000,
+                                asking_price=30000, city='Nowhere', state='CA'))  # no coordinates
+    MarketPriceRepository(db).add_listings_bulk(listings)
+    return db
+
+
+def brute_force(db, center, radius):
+    rows = db.execute_query("SELECT id, latitude, longitude FROM market_prices WHERE latitude IS NOT NULL")
+    distances = {row['id']: haversine_distance(center[0], center[1], row['latitude'], row['longitude'])
+                 for row in rows}
+    return {listing_id: d for listing_id, d in distances.items() if d <= radius}
+
+
+@pytest.mark.parametrize('center', CENTERS)
+@pytest.mark.parametrize('radius', [10, 75, 250, 600])
+def test_radius_query_matches_brute_force(scattered, center, radius):
+    expected = brute_force(scattered, center, radius)
+
+    rows = MarketPriceRepository(scattered).get_listings(near=center, radius_miles=radius)
+
+    assert {row['id'] for row in rows} == set(expected)
+    for row in rows:
+        assert row['distance'] == pytest.approx(expected[row['id']])
+    distances = [row['distance'] for row in rows]
+    assert distances == sorted(distances)
+
+
+def test_listings_near_is_the_radius_query(scattered):
+    repo = MarketPriceRepository(scattered)
+    lat, lon = CENTERS[0]
+    assert repo.get_listings_near(lat, lon, 100) == repo.get_listings(near=(lat, lon), radius_miles=100)
+
+
+def test_near_without_radius_annotates_every_listing(scattered):
+    rows = MarketPriceRepository(scattered).get_listings(near=CENTERS[0])
+    total = scattered.execute_query("SELECT COUNT(*) as n FROM market_prices")[0]['n']
+
+    assert len(rows) == total
+    assert sum(row['distance'] is None for row in rows) == 1
+
+
+def test_radius_query_combines_with_other_filters(scattered):
+    repo = MarketPriceRepository(scattered)
+    rows = repo.get_listings(region='Bay Area', near=CENTERS[1], radius_miles=50)
+
+    assert rows and all(row['region'] == 'Bay Area' for row in rows)
+    assert {row['id'] for row in rows} == {
+        row['id'] for row in repo.get_listings(near=CENTERS[1], radius_miles=50) if row['region'] == 'Bay Area'}
+
+
+def test_moved_listing_is_reindexed(scattered):
+    repo = MarketPriceRepository(scattered)
+    offshore = (35.0, -126.0)  # outside the scattered area
+    listing_id = repo.get_listings(near=CENTERS[3], radius_miles=600)[0]['id']
+    with scattered.get_connection() as conn:
+        conn.execute("UPDATE market_prices SET latitude = ?, longitude = ? WHERE id = ?",
+                     (*offshore, listing_id))
+
+    assert [row['id'] for row in repo.get_listings(near=offshore, radius_miles=1)] == [listing_id]
+    assert listing_id not in {row['id'] for row in repo.get_listings(near=CENTERS[3], radius_miles=600)}
@@ -0,0 +1,106 @@
+"""
+JSONL sinks and readers, including gzip files cut short by a crash
+"""
+
+import gzip
+import os
+
+import pytest
+
+from fixtures import RecordedResponse, RecordingTransport, iter_corpus
+from result_sink import JSONLSink, gzip_is_complete, iter_jsonl
+
+
+RECORDS = [{'id': n, 'title': f'2021 Toyota Tacoma #{n}', 'price': 30000 + n} for n in range(200)]
+
+
+def write_records(path, records):
+    with JSONLSink(path) as sink:
+        for record in records:
+            sink.write(record)  # flushed one at a time, as a long scrape would
+
+
+def cut(path, nbytes):
+    """Drop the last bytes of a file, as a crash mid-write would"""
+    with open(path, 'r+b') as f:
+        f.truncate(os.path.getsize(path) - nbytes)
+
+
+@pytest.mark.parametrize('name', ['results.jsonl', 'results.jsonl.gz'])
+def test_records_round_trip_across_appends(tmp_path, name):
+    path = str(tmp_path / name)
+    write_records(path, RECORDS[:150])
+    write_records(path, RECORDS[150:])
+
+    assert list(iter_jsonl(path)) == RECORDS
+    if name.endswith('.gz'):
+        assert gzip_is_complete(path)
+
+
+def test_partial_last_line_is_skipped(tmp_path):
+    path = str(tmp_path / 'results.jsonl')
+    write_records(path, RECORDS[:3])
+    with open(path, 'a') as f:
+        f.write('{"id": 3, "tit')
+
+    assert list(iter_jsonl(path)) == RECORDS[:3]
+
+
+def test_truncated_gzip_reads_up_to_the_last_complete_record(tmp_path):
+    path = str(tmp_path / 'results.jsonl.gz')
+    write_records(path, RECORDS)
+    cut(path, 40)
+
+    assert not gzip_is_complete(path)
+    records = list(iter_jsonl(path))
+    assert 150 < len(records) < len(RECORDS)
+    assert records == RECORDS[:len(records)]
+
+
+def test_append_after_truncation_keeps_every_complete_record(tmp_path):
+    path = str(tmp_path / 'results.jsonl.gz')
+    write_records(path, RECORDS)
+    cut(path, 40)
+    kept = len(list(iter_jsonl(path)))
+
+    extra = {'id': 'new', 'title': 'appended after the crash'}
+    write_records(path, [extra])
+
+    assert gzip_is_complete(path)
+    assert list(iter_jsonl(path)) == RECORDS[:kept] + [extra]
+
+
+@pytest.mark.parametrize('mtime', range(0, 40, 4))
+def test_reader_stops_cleanly_at_a_member_appended_to_a_broken_one(tmp_path, monkeypatch, mtime):
+    # A file appended to by code that did not repair the truncated member first.
+    # The gzip header mtime changes the bytes the reader inflates past the cut.
+    monkeypatch.setattr(gzip.time, 'time', lambda: 1_790_000_000 + mtime)
+    path = str(tmp_path / 'results.jsonl.gz')
+    write_records(path, RECORDS)
+    cut(path, 40)
+    with gzip.open(path, 'at', encoding='utf-8') as f:
+        f.write('{"id": "new"}\n')
+
+    records = list(iter_jsonl(path))
+    assert records == RECORDS[:len(records)]
+
+
+def test_recording_appends_to_a_truncated_corpus(tmp_path):
+    path = str(tmp_path / 'responses.jsonl.gz')
+
+    def get(url, headers):
+        return RecordedResponse(url, 200, {'Content-Type': 'text/html'}, url.encode() * 50)
+
+    transport = RecordingTransport(get, path)
+    for n in range(50):
+        transport.get(f'https://example.com/{n}', {})
+    transport.close()
+    cut(path, 40)
+
+    transport = RecordingTransport(get, path)
+    transport.get('https://example.com/after-crash', {})
+    transport.close()
+
+    urls = [response.url for response in iter_corpus(path)]
+    assert urls[-1] == 'https://example.com/after-crash'
+    assert urls[:-1] == [f'https://example.com/{n}' for n in range(len(urls) - 1)]
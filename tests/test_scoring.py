@@ -0,0 +1,95 @@
+"""
+Batch scoring, top-k ranking and the shared fair value estimator
+"""
+
+import pytest
+
+from database import MarketPrice, MarketPriceRepository
+from recommendation_engine import RecommendationEngine
+from scoring_engine import VehicleScorer, UserPreferences
+from valuation import FairValueEstimator
+
+
+PREFERENCES = [
+    UserPreferences(budget_max=60000, driver_height=75),
+    UserPreferences(budget_max=40000, driver_height=70, min_cargo_cuft=30, require_4wd=True,
+                    weight_price=0.4, weight_reliability=0.2, weight_comfort=0.1),
+]
+
+
+def all_listings(db):
+    return db.execute_query("""
+        SELECT mp.*, v.make, v.model, v.year, v.trim
+        FROM market_prices mp JOIN vehicles v ON mp.vehicle_id = v.id
+        ORDER BY mp.id
+    """)
+
+
+@pytest.mark.parametrize('preferences', PREFERENCES)
+def test_batch_scores_match_per_listing_scores(db, preferences):
+    scorer = VehicleScorer(db)
+    scorer.valuation.refit()
+    listings = all_listings(db)
+
+    batch = scorer.score_listings_batch(listings, preferences)
+
+    assert len(batch) == len(listings)
+    for listing, result in zip(listings, batch):
+        assert result == scorer.score_listing(listing, preferences)
+
+
+@pytest.mark.parametrize('limit', [1, 5, 20, 100])
+def test_top_k_matches_full_sort(db, limit):
+    engine = RecommendationEngine(db)
+    engine.scorer.valuation.refit()
+    preferences = PREFERENCES[0]
+    listings = engine.price_repo.get_filtered_listings(budget_max=preferences.budget_max,
+                                                       max_mileage=preferences.max_mileage,
+                                                       driver_height=preferences.driver_height)
+
+    scores = engine.scorer.score_listings_batch(listings, preferences)
+    ranked = sorted((r['total_score'], -i) for i, r in enumerate(scores) if r is not None)[::-1]
+    expected = [listings[-position]['id'] for _, position in ranked[:limit]]
+
+    # Small chunks exercise the upper-bound early exit
+    top = engine._rank_top_k(listings, preferences, limit, chunk_size=4)
+    assert [match['listing']['id'] for match in top] == expected
+
+
+def test_shared_estimator_sees_refits_from_other_instances(db):
+    reader, writer = FairValueEstimator(db), FairValueEstimator(db)
+    writer.refit()
+    before = reader.get_model('Toyota', 'Tacoma')
+    assert before is not None
+
+    vehicle_id = db.execute_query("SELECT id FROM vehicles WHERE model = 'Tacoma' LIMIT 1")[0]['id']
+    MarketPriceRepository(db).add_listing(MarketPrice(vehicle_id=vehicle_id, listing_date='2026-02-01',
+                                                      mileage=10000, asking_price=45000, region='Bay Area'))
+
+    # Reads never refit, so nothing changes until a writer does
+    assert reader.get_model('Toyota', 'Tacoma') == before
+    writer.refit()
+    assert reader.get_model('Toyota', 'Tacoma')['listing_count'] == before['listing_count'] + 1
+
+
+def test_components_share_an_injected_estimator(db):
+    valuation = FairValueEstimator(db)
+    engine = RecommendationEngine(db, valuation)
+    assert engine.scorer.valuation is valuation
+    assert VehicleScorer(db, valuation).valuation is valuation
+
+
+def test_pinned_estimator_checks_the_version_once_per_block(db, monkeypatch):
+    scorer = VehicleScorer(db)
+    scorer.valuation.refit()
+    get_version = scorer.valuation.repo.get_version
+    calls = []
+    monkeypatch.setattr(scorer.valuation.repo, 'get_version', lambda: calls.append(1) or get_version())
+
+    listings = all_listings(db)
+    with scorer.valuation.pinned():
+        pinned = [scorer.score_listing(listing, PREFERENCES[0]) for listing in listings]
+    assert len(calls) == 1
+
+    assert [scorer.score_listing(listing, PREFERENCES[0]) for listing in listings] == pinned
+    assert len(calls) == 1 + len(listings)
@@ -0,0 +1,37 @@
+"""
+Catalog title matching
+"""
+
+import pytest
+
+from vehicle_matcher import TitleMatcher, VehicleMatch, match_vehicle, normalize_title
+
+
+@pytest.mark.parametrize('title, expected', [
+    ("2015 Lexus GX 460 Premium", ('Lexus', 'GX', 'Premium')),
+    ("Lexus es300", ('Lexus', 'ES', None)),
+    ("2020 Toyota 4 Runner SR5", ('Toyota', '4runner', 'SR5')),
+    ("2019 Toyota Tacoma TRD Off-Road", ('Toyota', 'Tacoma', 'TRD Off-Road')),
+    ("2018 Chevy Silverado 1500 LTZ", ('Chevrolet', 'Silverado', 'LTZ')),
+    ("2021 Ford F150 XLT 4x4", ('Ford', 'F-150', 'XLT')),
+    ("2022 Tesla ModelY Long Range", ('Tesla', 'Model Y', 'Long Range')),
+])
+def test_titles_resolve_to_catalog_spellings(title, expected):
+    assert match_vehicle(title) == VehicleMatch(*expected)
+
+
+def test_model_needs_a_make_unless_one_is_given():
+    assert match_vehicle("sequoia sr5") is None
+    assert match_vehicle("sequoia sr5", make='Toyota') == VehicleMatch('Toyota', 'Sequoia', 'SR5')
+    assert match_vehicle("2015 Lexus GX 460", make='Toyota') is None
+
+
+def test_make_alone_is_not_a_match():
+    # 'es' inside "Lexus" is not a word-aligned hit
+    assert match_vehicle("2019 Lexus") is None
+
+
+def test_scan_hits_are_word_aligned():
+    matcher = TitleMatcher([('es', 'ES'), ('gx', 'GX'), ('lexus', 'Lexus')])
+    text = normalize_title("Lexus GX460, es 300")
+    assert [(start, value) for start, _, value in matcher.scan(text)] == [(0, 'Lexus'), (6, 'GX'), (12, 'ES')]
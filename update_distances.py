@@ -6,12 +6,15 @@ Recalculate distances for listings missing distance data
 
 import sqlite3
 import sys
-from geolocation import get_closest_distance
+from database import DatabaseManager
+from geolocation import update_listing_distances
 
 
 def update_distances(db_path="car_valuation.db"):
     """Update distance calculations for all listings"""
 
+    DatabaseManager(db_path).close()  # apply pending migrations (listing coordinates)
+
     conn = sqlite3.connect(db_path)
     cursor = conn.cursor()
 
@@ -19,47 +22,21 @@ def update_distances(db_path="car_valuation.db"):
     print("UPDATING DISTANCE CALCULATIONS")
     print("="*80)
 
-    # Get all listings
-    cursor.execute("""
-        SELECT id, city, state, distance_miles
-        FROM market_prices
-        WHERE city IS NOT NULL AND city != ''
-    """)
-    listings = cursor.fetchall()
-
-    print(f"\nFound {len(listings)} listings with location data")
-
-    # Calculate distances
-    updated = 0
-    newly_calculated = 0
-    failed = 0
-    failed_cities = set()
-
-    for listing_id, city, state, current_distance in listings:
-        distance = get_closest_distance(city, state)
-
-        if distance is not None:
-            # Update or insert distance
-            cursor.execute("""
-                UPDATE market_prices
-                SET distance_miles = ?
-                WHERE id = ?
-            """, (distance, listing_id))
-
-            if current_distance is None:
-                newly_calculated += 1
-            updated += 1
-        else:
-            failed += 1
-            failed_cities.add(f"{city}, {state}")
-
+    # Recalculate every listing in one pass and one write
+    stats = update_listing_distances(conn)
     conn.commit()
 
+    updated = stats['updated']
+    newly_calculated = stats['newly_calculated']
+    failed = stats['failed']
+    failed_cities = stats['failed_cities']
+
     # Summary
     print(f"\n✓ Updated {updated} listings with distance data")
     print(f"  → Newly calculated: {newly_calculated}")
     print(f"  → Recalculated existing: {updated - newly_calculated}")
     print(f"  → Failed (unknown cities): {failed}")
+    print(f"  → Stale distances cleared: {stats['cleared']}")
 
     if failed_cities:
         print(f"\nCities without coordinates (top 20):")
@@ -0,0 +1,214 @@
+"""
+Fair Value Models
+Per make/model price regressions (price ~ mileage + age + region) fitted in bulk
+"""
+
+from database import DatabaseManager, MarketPriceRepository, FairValueRepository
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import threading
+import numpy as np
+
+
+# Models with fewer listings than this are not stored; callers fall back to
+# the MSRP depreciation ladder in VehicleScorer
+MIN_LISTINGS = 5
+
+# Ridge penalty on region offsets, in pseudo-listings at zero offset, so a
+# region with one or two listings only nudges the prediction
+REGION_SHRINKAGE = 2.0
+
+# Tiny ridge on the slopes: keeps them at 0 when a model has a single year or mileage
+SLOPE_SHRINKAGE = 1e-3
+
+# Mileage is fitted in 10k-mile units to keep the normal equations well scaled
+MILEAGE_UNIT = 10000.0
+
+
+def fit_fair_value_models(rows: List[Dict], reference_year: int = None) -> Dict[Tuple[str, str], Dict]:
+    """
+    Fit one regression per (make, model) in a single vectorized batch
+
+    rows need make, model, year, region, asking_price and mileage. Returns
+    {(make, model): model} for groups with at least MIN_LISTINGS listings.
+    """
+    reference_year = reference_year or datetime.now().year
+    rows = [r for r in rows if r['asking_price'] and r['mileage'] is not None]
+    if not rows:
+        return {}
+
+    keys = sorted({(r['make'], r['model']) for r in rows})
+    regions = sorted({r['region'] or '' for r in rows})
+    key_index = {key: i for i, key in enumerate(keys)}
+    region_index = {region: i for i, region in enumerate(regions)}
+    n_groups, n_features = len(keys), 3 + len(regions)
+
+    g = np.array([key_index[(r['make'], r['model'])] for r in rows], dtype=int)
+    y = np.array([r['asking_price'] for r in rows], dtype=float)
+
+    # Design matrix: intercept, mileage, age, one column per region
+    X = np.zeros((len(rows), n_features))
+    X[:, 0] = 1
+    X[:, 1] = [r['mileage'] / MILEAGE_UNIT for r in rows]
+    X[:, 2] = [reference_year - r['year'] for r in rows]
+    X[np.arange(len(rows)), [3 + region_index[r['region'] or ''] for r in rows]] = 1
+
+    # Per-group normal equations, solved as one stacked system
+    XtX = np.zeros((n_groups, n_features, n_features))
+    Xty = np.zeros((n_groups, n_features))
+    np.add.at(XtX, g, X[:, :, None] * X[:, None, :])
+    np.add.at(Xty, g, X * y[:, None])
+    penalty = np.diag([0, SLOPE_SHRINKAGE, SLOPE_SHRINKAGE] + [REGION_SHRINKAGE] * len(regions))
+    coef = np.linalg.solve(XtX + penalty, Xty[:, :, None])[:, :, 0]
+
+    # Residual sigma and R² per group
+    counts = np.bincount(g, minlength=n_groups)
+    residuals = y - np.einsum('ij,ij->i', X, coef[g])
+    ssr = np.bincount(g, weights=residuals ** 2, minlength=n_groups)
+    mean_price = np.bincount(g, weights=y, minlength=n_groups) / counts
+    sst = np.bincount(g, weights=(y - mean_price[g]) ** 2, minlength=n_groups)
+    regions_seen = (XtX[:, 3:, 3:].diagonal(axis1=1, axis2=2) > 0).sum(axis=1)
+    dof = np.maximum(counts - 2 - regions_seen, 1)
+    sigma = np.sqrt(ssr / dof)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r_squared = np.where(sst > 0, 1 - ssr / sst, np.nan)
+
+    models = {}
+    for i, (make, model) in enumerate(keys):
+        if counts[i] < MIN_LISTINGS:
+            continue
+        offsets = {region: round(float(coef[i, 3 + j]), 2)
+                   for j, region in enumerate(regions) if XtX[i, 3 + j, 3 + j] > 0}
+        models[(make, model)] = {
+            'make': make,
+            'model': model,
+            'intercept': float(coef[i, 0]),
+            'coef_mileage': float(coef[i, 1]) / MILEAGE_UNIT,
+            'coef_age': float(coef[i, 2]),
+            'region_offsets': offsets,
+            'reference_year': reference_year,
+            'sigma': float(sigma[i]),
+            'r_squared': None if np.isnan(r_squared[i]) else float(r_squared[i]),
+            'listing_count': int(counts[i])
+        }
+
+    return models
+
+
+class FairValueEstimator:
+    """
+    Stored fair value models with O(1) predictions and incremental refits
+
+    Loaded models are cached until fair_value_models changes (a cheap version
+    check per read, or one per block inside pinned()), so refits by another
+    estimator or process are picked up. Reads never refit: writers call
+    refit() after changing listings. Share one instance between components
+    that use the same database.
+    """
+
+    def __init__(self, db: DatabaseManager):
+        self.db = db
+        self.price_repo = MarketPriceRepository(db)
+        self.repo = FairValueRepository(db)
+        self._models = None
+        self._version = None
+        self._local = threading.local()
+
+    def refit(self, full: bool = False) -> int:
+        """
+        Refit the models whose listings changed (every model if full)
+        Returns the number of (make, model) groups refit
+        """
+        changes = self.repo.get_dirty_models()
+        if full:
+            groups = {(r['make'], r['model']) for r in self.price_repo.get_price_rows_for_models()}
+            groups |= set(self.repo.get_models())
+            groups |= set(changes)
+        else:
+            groups = set(changes)
+
+        if not groups:
+            return 0
+
+        rows = [r for r in self.price_repo.get_price_rows_for_models(list(groups))
+                if r['asking_price'] is not None]
+        fitted = fit_fair_value_models(rows)
+
+        # Groups that dropped below MIN_LISTINGS lose their stored model
+        self.repo.save_models({key: fitted.get(key) for key in groups}, changes)
+        self._models = None
+        return len(groups)
+
+    @contextmanager
+    def pinned(self):
+        """
+        Check the stored version once for a whole request or batch: reads on
+        this thread inside the block skip the per-read version check
+        """
+        depth = getattr(self._local, 'pinned', 0)
+        if not depth:
+            self.get_models()
+        self._local.pinned = depth + 1
+        try:
+            yield self
+        finally:
+            self._local.pinned = depth
+
+    def get_models(self) -> Dict[Tuple[str, str], Dict]:
+        """Fitted models keyed by (make, model), reloaded when the stored models change"""
+        models = self._models
+        if models is not None and getattr(self._local, 'pinned', 0):
+            return models
+
+        version = self.repo.get_version()
+        if self._models is None or version != self._version:
+            self._models = self.repo.get_models()
+            self._version = version
+        return self._models
+
+    def get_model(self, make: str, model: str) -> Optional[Dict]:
+        return self.get_models().get((make, model))
+
+    def predict_fair_value(self, listing: Dict, models: Dict = None) -> Optional[float]:
+        """
+        Fair asking price for a listing (needs make, model, year, mileage, region)
+        None when there is no usable model for its make/model. Pass models
+        (from get_models) when predicting in a loop to skip the version check.
+        """
+        models = self.get_models() if models is None else models
+        fit = models.get((listing.get('make'), listing.get('model')))
+        if not fit or listing.get('mileage') is None or listing.get('year') is None:
+            return None
+
+        value = (fit['intercept'] +
+                 fit['coef_mileage'] * listing['mileage'] +
+                 fit['coef_age'] * (fit['reference_year'] - listing['year']) +
+                 fit['region_offsets'].get(listing.get('region') or '', 0.0))
+        return value if value > 0 else None
+
+    def predict_fair_values(self, listings: List[Dict]) -> np.ndarray:
+        """predict_fair_value for many listings; NaN where there is no prediction"""
+        models = self.get_models()
+        values = [self.predict_fair_value(listing, models) for listing in listings]
+        return np.array([np.nan if v is None else v for v in values], dtype=float)
+
+
+def main():
+    """Fit every model and print a summary"""
+    db = DatabaseManager()
+    estimator = FairValueEstimator(db)
+
+    refit = estimator.refit(full=True)
+    models = estimator.get_models()
+    print(f"Refit {refit} make/model groups, {len(models)} with enough listings\n")
+
+    for (make, model), fit in sorted(models.items()):
+        r_squared = f"{fit['r_squared']:.2f}" if fit['r_squared'] is not None else "n/a"
+        print(f"{make} {model}: ${fit['coef_mileage'] * 10000:,.0f}/10k mi, "
+              f"${fit['coef_age']:,.0f}/yr, sigma ${fit['sigma']:,.0f}, "
+              f"R² {r_squared} ({fit['listing_count']} listings)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Vehicle Title Matcher
+Resolve listing titles to canonical (make, model, trim) using one precompiled
+multi-pattern automaton built from vehicle_catalog.csv
+"""
+
+import csv
+import re
+from collections import deque, namedtuple
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+# Vehicle catalog: a row with an empty model names a make (aliases are make
+# aliases); every other row is a model with '|'-separated aliases and trims.
+# Compiled on first match and kept for the life of the process.
+CATALOG_PATH = Path(__file__).with_name('vehicle_catalog.csv')
+_matcher = None
+
+VehicleMatch = namedtuple('VehicleMatch', ['make', 'model', 'trim'])
+
+
+def normalize_title(text: str) -> str:
+    """Lowercase, with every run of punctuation/whitespace collapsed to one space"""
+    return ' '.join(re.sub(r'[^a-z0-9]+', ' ', text.lower()).split())
+
+
+class TitleMatcher:
+    """
+    Aho-Corasick automaton over every make, model and trim spelling
+
+    A pattern hit counts when it starts a word and is followed by a space, a
+    digit or the end of the title, so 'gx' matches "GX460" but 'es' does not
+    match inside "Lexus".
+    """
+
+    def __init__(self, patterns: List[Tuple[str, tuple]]):
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.outputs: List[List[Tuple[int, tuple]]] = [[]]
+
+        for pattern, value in patterns:
+            node = 0
+            for char in pattern:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.outputs.append([])
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.outputs[node].append((len(pattern), value))
+
+        # Breadth-first failure links; each node inherits its fallback's outputs
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.outputs[child] = self.outputs[child] + self.outputs[self.fail[child]]
+
+    def scan(self, text: str) -> List[Tuple[int, int, tuple]]:
+        """(start, length, value) for every word-aligned pattern hit in text"""
+        hits = []
+        node = 0
+        for end, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for length, value in self.outputs[node]:
+                start = end - length + 1
+                if start and text[start - 1] != ' ':
+                    continue
+                following = text[end + 1] if end + 1 < len(text) else ' '
+                if following == ' ' or following.isdigit():
+                    hits.append((start, length, value))
+        return hits
+
+
+def _load_matcher() -> TitleMatcher:
+    """Compile vehicle_catalog.csv once into a TitleMatcher"""
+    global _matcher
+    if _matcher is None:
+        patterns = []
+        with open(CATALOG_PATH, newline='') as f:
+            for row in csv.DictReader(f):
+                make, model = row['make'], row['model']
+                aliases = [a for a in row['aliases'].split('|') if a]
+                if not model:
+                    for name in [make] + aliases:
+                        patterns.append((normalize_title(name), ('make', make)))
+                    continue
+                for name in [model] + aliases:
+                    patterns.append((normalize_title(name), ('model', make, model)))
+                for trim in [t for t in row['trims'].split('|') if t]:
+                    patterns.append((normalize_title(trim), ('trim', make, model, trim)))
+        _matcher = TitleMatcher(patterns)
+    return _matcher
+
+
+@lru_cache(maxsize=4096)
+def match_vehicle(title: str, make: Optional[str] = None) -> Optional[VehicleMatch]:
+    """
+    Canonical make, model and trim named in a listing title
+
+    Without a make, the title must name the make as well as the model
+    ("2015 Lexus GX 460"); pass make when it is already known ("sequoia SR5").
+    The earliest model mentioned wins, as does the earliest of its trims, the
+    longest spelling breaking ties ("SR5" over "SR").
+
+    Returns:
+        VehicleMatch, or None if no catalog model is found
+    """
+    hits = sorted(_load_matcher().scan(normalize_title(title)), key=lambda hit: (hit[0], -hit[1]))
+
+    makes = {make} if make else {value[1] for _, _, value in hits if value[0] == 'make'}
+    model = next((value for _, _, value in hits if value[0] == 'model' and value[1] in makes), None)
+    if model is None:
+        return None
+
+    _, make, model = model
+    trim = next((value[3] for _, _, value in hits
+                 if value[0] == 'trim' and value[1:3] == (make, model)), None)
+    return VehicleMatch(make, model, trim)